@@ -3,8 +3,11 @@ from datetime import datetime
 from typing import List, Tuple
 
 from id_manager import IDManager
-from app.const import DATE_TIME_PATTERN
-from engine import process_user_query
+from app.const import DATE_TIME_PATTERN, THREAD_HISTORY_PAGE_SIZE
+from engine import stream_user_query
+from graph import checkpointer, store
+from memory_writer import start_memory_writer
+from tracing import start_tracing
 
 
 # Page config
@@ -14,23 +17,58 @@ st.set_page_config(page_title="Data Analyst Agent", layout="centered")
 # Initialize ID Manager
 @st.cache_resource
 def get_id_manager():
-    return IDManager()
+    # Deleting threads and users also deletes their checkpoints and memories
+    return IDManager(checkpointer=checkpointer, store=store)
 
 
 id_manager = get_id_manager()
 
+# Save memories in the background, off the response path (once per process)
+start_memory_writer()
+# Trace the queries and serve their metrics, if enabled (once per process)
+start_tracing()
+
 
 # History management functions
-def load_thread_history(user_id: str, thread_id: str) -> List[Tuple[str, str, int]]:
-    """Load conversation history for a specific thread and user."""
+def load_thread_history(
+    user_id: str, thread_id: str, before_order: int = None
+) -> List[Tuple[str, str, int]]:
+    """Load a page of the latest conversation history of a thread, before an entry."""
     try:
-        history = id_manager.get_thread_history(thread_id, user_id)
+        history = id_manager.get_thread_history_page(
+            thread_id,
+            user_id,
+            limit=THREAD_HISTORY_PAGE_SIZE,
+            before_order=before_order,
+        )
         return history
     except Exception as e:
         st.error(f"Error loading thread history: {str(e)}")
         return []
 
 
+def load_new_thread_history(
+    user_id: str, thread_id: str, after_order: int
+) -> List[Tuple[str, str, int]]:
+    """Load the conversation history entries of a thread saved after an entry."""
+    try:
+        return id_manager.get_thread_entries_after(thread_id, user_id, after_order)
+    except Exception as e:
+        st.error(f"Error loading thread history: {str(e)}")
+        return []
+
+
+def load_earlier_history():
+    """Prepend the previous page of history to the displayed conversation."""
+    history = st.session_state.conversation_history
+    earlier = load_thread_history(
+        st.session_state.current_user_id,
+        st.session_state.current_thread_id,
+        before_order=history[0][2] if history else None,
+    )
+    st.session_state.conversation_history = earlier + history
+
+
 def display_conversation_history(history: List[Tuple[str, str, int]]):
     """Display conversation history in Streamlit."""
     if not history:
@@ -38,10 +76,15 @@ def display_conversation_history(history: List[Tuple[str, str, int]]):
 
     st.markdown("### Conversation History")
 
-    # Sort by entry_order to ensure chronological display
-    sorted_history = sorted(history, key=lambda x: x[2])
+    # Only the loaded pages are rendered; older entries are fetched on demand
+    n_earlier = st.session_state.history_entry_count - len(history)
+    if n_earlier > 0:
+        st.button(
+            f"Load earlier messages ({n_earlier} more)",
+            on_click=load_earlier_history,
+        )
 
-    for user_query, analyst_response, entry_order in sorted_history:
+    for user_query, analyst_response, entry_order in history:
         # User message
         with st.container():
             st.markdown("**You:**")
@@ -75,14 +118,13 @@ def save_conversation_entry(
         return False
 
 
-def check_thread_has_history(user_id: str, thread_id: str) -> bool:
-    """Check if a thread has existing conversation history."""
+def get_thread_entry_count(user_id: str, thread_id: str) -> int:
+    """Get the number of conversation history entries of a thread."""
     try:
-        entry_count = id_manager.get_thread_entry_count(thread_id, user_id)
-        return entry_count > 0
+        return id_manager.get_thread_entry_count(thread_id, user_id)
     except Exception as e:
         st.error(f"Error checking thread history: {str(e)}")
-        return False
+        return 0
 
 
 def reset_conversation_state():
@@ -90,6 +132,7 @@ def reset_conversation_state():
     st.session_state.response = ""
     st.session_state.submitted = False
     st.session_state.conversation_history = []
+    st.session_state.history_entry_count = 0
     st.session_state.thread_has_history = False
     # Clear the form input
     if "user_query" in st.session_state:
@@ -112,6 +155,9 @@ if "submitted" not in st.session_state:
 if "conversation_history" not in st.session_state:
     st.session_state.conversation_history = []
 
+if "history_entry_count" not in st.session_state:
+    st.session_state.history_entry_count = 0
+
 if "thread_has_history" not in st.session_state:
     st.session_state.thread_has_history = False
 
@@ -270,13 +316,16 @@ with st.container():
                     )
 
                     # Check if thread has history
-                    st.session_state.thread_has_history = check_thread_has_history(
+                    st.session_state.history_entry_count = get_thread_entry_count(
                         st.session_state.current_user_id,
                         st.session_state.current_thread_id,
                     )
+                    st.session_state.thread_has_history = (
+                        st.session_state.history_entry_count > 0
+                    )
 
                     print(
-                        f"Loaded thread history: {len(st.session_state.conversation_history)} entries"
+                        f"Loaded thread history: {len(st.session_state.conversation_history)} of {st.session_state.history_entry_count} entries"
                     )
         else:
             st.info("Please select a user first")
@@ -301,7 +350,7 @@ with st.container():
             st.markdown(f"**Thread:** `{st.session_state.current_thread_id}`")
             if st.session_state.thread_has_history:
                 st.markdown(
-                    f"**History:** {len(st.session_state.conversation_history)} entries"
+                    f"**History:** {st.session_state.history_entry_count} entries"
                 )
         else:
             st.warning("Not Ready")
@@ -367,40 +416,58 @@ if user_ready and thread_ready:
 
     if st.session_state.submitted:
         if not st.session_state.response:
-            with st.spinner("Processing your question..."):
-                try:
-                    print("Processing query through workflow...")
-                    output = process_user_query(
-                        st.session_state.user_query,
-                        user_id=st.session_state.current_user_id,
-                        thread_id=st.session_state.current_thread_id,
-                        has_history=st.session_state.thread_has_history,
-                    )
-
-                    st.session_state.response = output["response"]
-                    print("Workflow processing complete")
+            status = st.status("Processing your question...")
+            answer_placeholder = st.empty()
+            try:
+                print("Processing query through workflow...")
+                streamed_answer = ""
+                # Render the steps and the answer tokens as the workflow produces them
+                for event in stream_user_query(
+                    st.session_state.user_query,
+                    user_id=st.session_state.current_user_id,
+                    thread_id=st.session_state.current_thread_id,
+                    has_history=st.session_state.thread_has_history,
+                ):
+                    if event["type"] == "node":
+                        status.write(f"Step: `{event['node']}`")
+                    elif event["type"] == "tool_call":
+                        status.write(f"Tool: `{event['name']}`")
+                    elif event["type"] == "token":
+                        streamed_answer += event["text"]
+                        answer_placeholder.markdown(streamed_answer)
+                    elif event["type"] == "final":
+                        st.session_state.response = event["response"]
+
+                status.update(label="Done", state="complete")
+                answer_placeholder.empty()
+                print("Workflow processing complete")
+
+                # Save conversation to database
+                save_success = save_conversation_entry(
+                    st.session_state.current_user_id,
+                    st.session_state.current_thread_id,
+                    st.session_state.user_query,
+                    st.session_state.response,
+                )
 
-                    # Save conversation to database
-                    save_success = save_conversation_entry(
+                if save_success:
+                    # Append the new entries instead of reloading the whole history
+                    history = st.session_state.conversation_history
+                    new_entries = load_new_thread_history(
                         st.session_state.current_user_id,
                         st.session_state.current_thread_id,
-                        st.session_state.user_query,
-                        st.session_state.response,
+                        after_order=history[-1][2] if history else 0,
                     )
-
-                    if save_success:
-                        # Reload conversation history to include new entry
-                        st.session_state.conversation_history = load_thread_history(
-                            st.session_state.current_user_id,
-                            st.session_state.current_thread_id,
-                        )
-                        st.session_state.thread_has_history = True
-                        print("Query processed and saved successfully")
-
-                except Exception as e:
-                    st.error(f"Error processing query: {str(e)}")
-                    print(f"Error processing query: {str(e)}")
-                    st.session_state.submitted = False
+                    st.session_state.conversation_history = history + new_entries
+                    st.session_state.history_entry_count += len(new_entries)
+                    st.session_state.thread_has_history = True
+                    print("Query processed and saved successfully")
+
+            except Exception as e:
+                status.update(label="Error", state="error")
+                st.error(f"Error processing query: {str(e)}")
+                print(f"Error processing query: {str(e)}")
+                st.session_state.submitted = False
 
         if st.session_state.response:
             st.markdown("### Latest Response")
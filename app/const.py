@@ -7,33 +7,84 @@ DATE_TIME_PATTERN = "%H:%M:%S"
 # Constants for file paths
 PROMPTS_DIR = "prompts"
 DB_DIR = "."
+# The users, checkpointer and store databases. Overridden by the APP_DB_DIR
+# environment variable, which benchmark.py and loadtest.py point at a temporary
+# directory so that their synthetic users never reach the app's databases
+APP_DB_DIR = os.getenv("APP_DB_DIR", DB_DIR)
 IMAGES_DIR = "images"
 
 # Dataset
 DATASET_NAME = "bitext/Bitext-customer-support-llm-chatbot-training-dataset"
 DATASET_SPLIT_NAME = "train"
+DATASET_INDEXED_COLUMNS = ["category", "intent", "flags"]
+DATASET_VIEW_CACHE_SIZE = 64
+
+DATASET_TEXT_INDEXED_COLUMNS = ["instruction", "response"]
+BM25_K1 = 1.5
+BM25_B = 0.75
+TEXT_SEARCH_DEFAULT_TOP_K = 10
+
+DATASET_SNAPSHOT_FILE_NAME = "bitext_dataset.arrow"
+DATASET_SNAPSHOT_FILE_PATH = os.path.join(DB_DIR, DATASET_SNAPSHOT_FILE_NAME)
+
+VECTOR_INDEX_DIR_NAME = "bitext_vector_index"
+VECTOR_INDEX_DIR_PATH = os.path.join(DB_DIR, VECTOR_INDEX_DIR_NAME)
+VECTOR_INDEX_N_FEATURES = 2**15
+VECTOR_INDEX_DIM = 128
 
 
 # LLM
 LLM_MODEL_NAME = "gpt-4o-mini"  # "gpt-3.5-turbo"  # "gpt-4o-mini"
 LLM_TEMPERATURE = 0.0
 LLM_TOP_P = 1.0
+# Per request, so that a hung call frees its worker; retried LLM_MAX_RETRIES times
+LLM_REQUEST_TIMEOUT_SECONDS = 20
+LLM_MAX_RETRIES = 2
+# USD per million tokens, to estimate the cost of every call in the traces
+LLM_PRICES_PER_MILLION_TOKENS = {
+    "gpt-4o-mini": {"input": 0.15, "output": 0.60},
+    "gpt-3.5-turbo": {"input": 0.50, "output": 1.50},
+}
 DEFAULT_PARALLEL_TOOL_CALLS = False
 
+LLM_CACHE_ENABLED = True
+LLM_CACHE_DB_FILE_NAME = "llm_cache.db"
+LLM_CACHE_DB_FILE_PATH = os.path.join(DB_DIR, LLM_CACHE_DB_FILE_NAME)
+LLM_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+LLM_CACHE_MAX_ENTRIES = 10_000
+
+# Overridden by the LLM_BACKEND, LLM_CASSETTE_FILE and FAKE_LLM_LATENCY_SECONDS
+# environment variables. Backends: "openai", "fake" (scripted, offline), "record"
+# (openai, saved to the cassette) or "replay" (from the cassette, offline)
+DEFAULT_LLM_BACKEND = "openai"
+LLM_CASSETTE_FILE_NAME = "llm_cassette.jsonl"
+LLM_CASSETTE_FILE_PATH = os.path.join(DB_DIR, LLM_CASSETTE_FILE_NAME)
+FAKE_LLM_LATENCY_SECONDS = 0.0
+# Seed of the row samples (show_examples, random summaries) with the record and
+# replay backends, so that the tool results, and the requests holding them, repeat
+LLM_CASSETTE_SAMPLE_SEED = 0
+
 
 # Users and threads
 USERS_THREADS_DB_FILE_NAME = "users_threads.db"
-USERS_THREADS_DB_FILE_PATH = os.path.join(DB_DIR, USERS_THREADS_DB_FILE_NAME)
+USERS_THREADS_DB_FILE_PATH = os.path.join(APP_DB_DIR, USERS_THREADS_DB_FILE_NAME)
+USERS_THREADS_DB_POOL_SIZE = 8
+THREAD_HISTORY_PAGE_SIZE = 20
+
+
+# SQLite connections
+SQLITE_BUSY_TIMEOUT_SECONDS = 5.0
 
 
 # Checkpointer
 CHECKPOINTER_DB_FILE_NAME = "graph_state_checkpointer.db"
-CHECKPOINTER_DB_FILE_PATH = os.path.join(DB_DIR, CHECKPOINTER_DB_FILE_NAME)
+CHECKPOINTER_DB_FILE_PATH = os.path.join(APP_DB_DIR, CHECKPOINTER_DB_FILE_NAME)
+CHECKPOINTS_KEEP_PER_THREAD = 2
 
 
 # Store
 STORE_DB_FILE_NAME = "graph_state_store.db"
-STORE_DB_FILE_PATH = os.path.join(DB_DIR, STORE_DB_FILE_NAME)
+STORE_DB_FILE_PATH = os.path.join(APP_DB_DIR, STORE_DB_FILE_NAME)
 
 
 # Router
@@ -42,11 +93,35 @@ ROUTER_SYSTEM_PROMPT_FILE_PATH = os.path.join(
     PROMPTS_DIR, ROUTER_SYSTEM_PROMPT_FILE_NAME
 )
 
+ROUTER_FAST_PATH_ENABLED = True
+ROUTER_FAST_PATH_CONFIDENCE_THRESHOLD = 0.9
+ROUTER_DECISIONS_LOG_FILE_NAME = "router_decisions.jsonl"
+ROUTER_DECISIONS_LOG_FILE_PATH = os.path.join(DB_DIR, ROUTER_DECISIONS_LOG_FILE_NAME)
+# The log holds raw user queries: past this size it is moved to <log>.1, replacing the
+# previous one, so that at most twice this size is kept for training
+ROUTER_DECISIONS_LOG_MAX_BYTES = 5 * 2**20
+ROUTER_MODEL_FILE_NAME = "router_model.npz"
+ROUTER_MODEL_FILE_PATH = os.path.join(DB_DIR, ROUTER_MODEL_FILE_NAME)
+ROUTER_MODEL_N_FEATURES = 2**12
+ROUTER_MODEL_MIN_TRAINING_QUERIES = 50
+
 
 # Agents
 MAX_ITERATIONS = 50
 
 
+# Context management
+SUMMARIZE_CONTEXT_PROMPT_FILE_NAME = "summarize_context_prompt.txt"
+SUMMARIZE_CONTEXT_PROMPT_FILE_PATH = os.path.join(
+    PROMPTS_DIR, SUMMARIZE_CONTEXT_PROMPT_FILE_NAME
+)
+
+CONTEXT_KEEP_LAST_TURNS = 4
+CONTEXT_MAX_TURNS = 8
+CONTEXT_TOKEN_BUDGET = 6000
+CONTEXT_TOOL_MESSAGE_MAX_CHARS = 2000
+
+
 # Structured Query Agent
 STRUCTURED_QUERY_AGENT_SYSTEM_PROMPT_FILE_NAME = (
     "structured_query_agent_system_prompt.txt"
@@ -55,6 +130,8 @@ STRUCTURED_QUERY_AGENT_SYSTEM_PROMPT_FILE_PATH = os.path.join(
     PROMPTS_DIR, STRUCTURED_QUERY_AGENT_SYSTEM_PROMPT_FILE_NAME
 )
 
+VALUE_COUNTS_TEXT_COLUMNS_DEFAULT_TOP_K = 20
+
 
 # Unstructured Query Agent
 UNSTRUCTURED_QUERY_AGENT_SYSTEM_PROMPT_FILE_NAME = (
@@ -76,6 +153,9 @@ SUMMARIZE_ALL_BATCHES_PROMPT_FILE_PATH = os.path.join(
 
 SUMMARIZE_DEFAULT_BATCH_SIZE = 20
 SUMMARIZE_DEFAULT_N_BATCHES = 5
+SUMMARIZE_RELEVANT_N_BATCHES = 2
+SUMMARIZE_MAX_CONCURRENCY = 5
+SUMMARIZE_BATCH_TIMEOUT_SECONDS = 60
 
 
 # Out of Scope Handler
@@ -92,9 +172,75 @@ SAVE_MEMORY_PROMPT_FILE_PATH = os.path.join(PROMPTS_DIR, SAVE_MEMORY_PROMPT_FILE
 READ_MEMORY_PROMPT_FILE_NAME = "read_memory_prompt.txt"
 READ_MEMORY_PROMPT_FILE_PATH = os.path.join(PROMPTS_DIR, READ_MEMORY_PROMPT_FILE_NAME)
 
+MEMORY_EMBEDDING_N_FEATURES = 2**16
+# Memories preselected by the memory index and read from the store for each search
+MEMORY_SEARCH_MAX_CANDIDATES = 100
+SAVE_MEMORY_TOP_K = 10
+SAVE_MEMORY_TOKEN_BUDGET = 400
+READ_MEMORY_TOP_K = 20
+READ_MEMORY_TOKEN_BUDGET = 800
+
+MEMORY_DEDUP_SIMILARITY_THRESHOLD = 0.8
+MEMORY_MAX_PER_USER = 200
+
+MEMORY_WRITER_ENABLED = True
+MEMORY_WRITER_N_WORKERS = 2
+MEMORY_WRITER_MAX_QUEUE_SIZE = 1000
+MEMORY_WRITER_BATCH_SIZE = 8
+MEMORY_WRITER_BATCH_WAIT_SECONDS = 0.5
+MEMORY_WRITER_MAX_ATTEMPTS = 3
+
 
 # Graph Viz
 GRAPH_VISUALIZATION_FILE_NAME_BASE = "graph_viz"
 GRAPH_VISUALIZATION_FILE_NAME_BASE_FULL_PATH = os.path.join(
     IMAGES_DIR, GRAPH_VISUALIZATION_FILE_NAME_BASE
 )
+
+
+# Benchmark
+BENCHMARK_REPEATS = 3
+BENCHMARK_RESULTS_FILE_NAME = "benchmark_results.json"
+BENCHMARK_RESULTS_FILE_PATH = os.path.join(DB_DIR, BENCHMARK_RESULTS_FILE_NAME)
+BENCHMARK_REGRESSION_TOLERANCE = 0.2
+
+# Load test
+LOADTEST_USERS = 50
+LOADTEST_THREADS_PER_USER = 1
+LOADTEST_TURNS = 3
+LOADTEST_CONCURRENCY = 50
+LOADTEST_LLM_LATENCY_SECONDS = 0.5
+
+# Dataset micro-benchmark
+MICROBENCHMARK_SIZES = [10_000, 50_000, 250_000]
+MICROBENCHMARK_SKEW = 1.0
+MICROBENCHMARK_REPEATS = 5
+MICROBENCHMARK_RESULTS_FILE_NAME = "microbenchmark_results.json"
+MICROBENCHMARK_RESULTS_FILE_PATH = os.path.join(
+    DB_DIR, MICROBENCHMARK_RESULTS_FILE_NAME
+)
+
+
+# Tracing, off unless the app entry point starts it with the TRACING_ENABLED
+# environment variable set to "1", which overrides this default
+TRACING_ENABLED = False
+TRACE_FILE_NAME = "traces.jsonl"
+TRACE_FILE_PATH = os.path.join(DB_DIR, TRACE_FILE_NAME)
+# Serves the Prometheus text metrics at http://localhost:<port>/metrics; None disables it
+TRACING_METRICS_PORT = 9464
+TRACING_HISTOGRAM_BUCKETS = [
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+]
+# Print every message of the conversation after each query (slow; for debugging)
+PRINT_TRANSCRIPTS = False
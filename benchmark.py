@@ -0,0 +1,215 @@
+import argparse
+import io
+import json
+import os
+import shutil
+import time
+from contextlib import redirect_stdout
+
+from benchmarking import (
+    BENCHMARK_QUERIES,
+    use_temporary_db_dir,
+    track_usage,
+    checkpoint_bytes,
+    latency_summary,
+    mean,
+    compare_results,
+)
+
+# The benchmark users get databases of their own, unless APP_DB_DIR is set
+temp_db_dir = use_temporary_db_dir(prefix="benchmark_")
+
+from app.const import (  # noqa: E402
+    CHECKPOINTER_DB_FILE_PATH,
+    USERS_THREADS_DB_FILE_PATH,
+    BENCHMARK_REPEATS,
+    BENCHMARK_RESULTS_FILE_PATH,
+    BENCHMARK_REGRESSION_TOLERANCE,
+)
+
+# End-to-end benchmark: run a fixed corpus of queries per class through
+# engine.process_user_query against an offline LLM, and report the latency, ReAct
+# iterations, tool calls, tokens sent and checkpoint bytes written per class. The
+# results are written as JSON, to be diffed against (or --compare'd with) a baseline.
+# Every query runs in a fresh thread; the memory queries run last, once the memories
+# of the other queries are saved. The benchmark users are deleted afterwards, and the
+# databases too when they are in a temporary directory.
+parser = argparse.ArgumentParser(description="Benchmark the workflow per query class.")
+parser.add_argument(
+    "--backend",
+    choices=["fake", "replay"],
+    default="fake",
+    help="The offline LLM: scripted, or replayed from the LLM cassette.",
+)
+parser.add_argument(
+    "--llm-latency",
+    type=float,
+    default=0.0,
+    help="Seconds the scripted LLM waits per call.",
+)
+parser.add_argument(
+    "--repeats",
+    type=int,
+    default=BENCHMARK_REPEATS,
+    help="Number of runs of the corpus.",
+)
+parser.add_argument(
+    "--output", default=BENCHMARK_RESULTS_FILE_PATH, help="The JSON results file."
+)
+parser.add_argument("--compare", help="A baseline JSON results file to compare with.")
+parser.add_argument(
+    "--tolerance",
+    type=float,
+    default=BENCHMARK_REGRESSION_TOLERANCE,
+    help="Relative increase of a metric over the baseline reported as a regression.",
+)
+parser.add_argument(
+    "--verbose", action="store_true", help="Show the output of the workflow."
+)
+args = parser.parse_args()
+
+# The LLM is created when the workflow is imported
+os.environ["LLM_BACKEND"] = args.backend
+os.environ["FAKE_LLM_LATENCY_SECONDS"] = str(args.llm_latency)
+
+from engine import process_user_query, build_config  # noqa: E402
+from graph import workflow, checkpointer, store  # noqa: E402
+from id_manager import IDManager, checkpoint_thread_id  # noqa: E402
+from memory_writer import memory_writer, start_memory_writer  # noqa: E402
+from tracing import start_tracing  # noqa: E402
+from sqlite_backend import connect_sqlite  # noqa: E402
+
+
+def run_query(user_id: str, user_query: str) -> dict:
+    thread_id = id_manager.generate_unique_thread_id(user_id, prefix="bench")
+    id_manager.create_thread_id(thread_id, user_id)
+    bytes_before = checkpoint_bytes(
+        checkpointer_conn, checkpoint_thread_id(user_id, thread_id)
+    )
+
+    output = None if args.verbose else io.StringIO()
+    with track_usage() as usage, redirect_stdout(output):
+        start = time.perf_counter()
+        process_user_query(user_query, user_id, thread_id, has_history=False)
+        latency = time.perf_counter() - start
+
+    state = workflow.get_state(build_config(user_id, thread_id)).values
+    return {
+        "latency": latency,
+        "label": state["query_classification_result"]["label"],
+        "react_iterations": state.get("iteration_count", 0),
+        "tool_calls": usage.tool_calls,
+        "llm_calls": usage.llm_calls,
+        "input_tokens": usage.input_tokens,
+        "output_tokens": usage.output_tokens,
+        "checkpoint_bytes": checkpoint_bytes(
+            checkpointer_conn, checkpoint_thread_id(user_id, thread_id)
+        )
+        - bytes_before,
+    }
+
+
+def run_corpus(user_id: str) -> dict:
+    samples = {}
+    for query_class, queries in BENCHMARK_QUERIES.items():
+        if query_class == "memory" and memory_writer is not None:
+            memory_writer.flush()
+        samples[query_class] = [run_query(user_id, query) for query in queries]
+    return samples
+
+
+def summarize(query_class: str, samples: list) -> dict:
+    return {
+        "queries": len(samples),
+        "misrouted": sum(s["label"] != query_class for s in samples),
+        "latency_ms": latency_summary([s["latency"] for s in samples]),
+        **{
+            name: mean([s[name] for s in samples])
+            for name in [
+                "react_iterations",
+                "tool_calls",
+                "llm_calls",
+                "input_tokens",
+                "output_tokens",
+                "checkpoint_bytes",
+            ]
+        },
+    }
+
+
+try:
+    id_manager = IDManager(
+        USERS_THREADS_DB_FILE_PATH, checkpointer=checkpointer, store=store
+    )
+    # Memories are saved in the background and queries traced if enabled, as in the app
+    start_memory_writer()
+    start_tracing()
+    checkpointer_conn = connect_sqlite(CHECKPOINTER_DB_FILE_PATH)
+    user_ids = []
+
+    try:
+        # One untimed run loads the dataset and warms the caches
+        print("Warming up...")
+        user_ids.append(id_manager.generate_unique_user_id(prefix="bench"))
+        id_manager.create_user_id(user_ids[-1])
+        run_corpus(user_ids[-1])
+
+        samples = {query_class: [] for query_class in BENCHMARK_QUERIES}
+        for repeat in range(args.repeats):
+            print(f"Run {repeat + 1}/{args.repeats}...")
+            user_ids.append(id_manager.generate_unique_user_id(prefix="bench"))
+            id_manager.create_user_id(user_ids[-1])
+            for query_class, class_samples in run_corpus(user_ids[-1]).items():
+                samples[query_class].extend(class_samples)
+    finally:
+        if memory_writer is not None:
+            memory_writer.flush()
+        for user_id in user_ids:
+            id_manager.delete_user(user_id)
+        if temp_db_dir is not None:
+            shutil.rmtree(temp_db_dir, ignore_errors=True)
+
+    results = {
+        "backend": args.backend,
+        "llm_latency_seconds": args.llm_latency,
+        "repeats": args.repeats,
+        "classes": {
+            query_class: summarize(query_class, class_samples)
+            for query_class, class_samples in samples.items()
+        },
+    }
+
+    for query_class, metrics in results["classes"].items():
+        latency = metrics["latency_ms"]
+        print(
+            f"{query_class}: p50 {latency['p50']} ms, p95 {latency['p95']} ms, "
+            f"p99 {latency['p99']} ms | {metrics['react_iterations']} iterations, "
+            f"{metrics['tool_calls']} tool calls, {metrics['llm_calls']} LLM calls, "
+            f"{metrics['input_tokens']} tokens sent, "
+            f"{metrics['checkpoint_bytes']} checkpoint bytes"
+            + (f" | {metrics['misrouted']} misrouted" if metrics["misrouted"] else "")
+        )
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print(f"Results written to {args.output}")
+
+    regressions = []
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_results(
+            baseline["classes"], results["classes"], args.tolerance
+        )
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        print(
+            f"{len(regressions)} regressions over {args.tolerance:.0%} "
+            f"against {args.compare}"
+        )
+except Exception as e:
+    print(f"Error running the benchmark: {e}")
+    raise SystemExit(1)
+
+if regressions:
+    raise SystemExit(1)
@@ -0,0 +1,232 @@
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_core.tracers.context import register_configure_hook
+
+# A fixed corpus per query class. Every query matches the router keyword rules of its
+# class (or none, for out-of-scope), so that the scripted LLM routes it the same way on
+# every run. It is also the evaluation set of the fast router in train_router.py.
+BENCHMARK_QUERIES = {
+    "structured": [
+        "What are the most frequent categories?",
+        "How many rows are there in the dataset?",
+        "Show me the top intents in the REFUND category",
+        "Count the rows in the PAYMENT category",
+        "List all the categories",
+    ],
+    "unstructured": [
+        "Summarize how agents respond to payment issues",
+        "Describe how agents handle refund requests",
+        "What is the tone of the responses about cancellations?",
+        "Summarize the complaints about delivery",
+        "What themes come up in account questions?",
+        # Ranking phrasings the structured keyword rule must not take
+        "What are the most common complaints customers have about refunds?",
+        "what are the top reasons customers ask for refunds?",
+    ],
+    "out-of-scope": [
+        "Who is Magnus Carlsen?",
+        "Write me a poem about the sea",
+        "What is the capital of Australia?",
+        "Recommend a good pizza place",
+        "Who won the 2018 World Cup?",
+        # Counting and listing phrasings the structured keyword rule must not take
+        "How many people live in Paris?",
+        "What are the top attractions in Rome?",
+        "List all the planets of the solar system",
+        "how many customers live in France?",
+    ],
+    "memory": [
+        "What do you remember about me?",
+        "What have I asked you before?",
+        "Do you remember my previous questions?",
+        "What do you know about me?",
+        "What have I told you so far?",
+    ],
+}
+
+
+def use_temporary_db_dir(prefix: str) -> Optional[str]:
+    """
+    Point the app databases at a new temporary directory, through APP_DB_DIR, unless
+    it is already set. Must run before app.const is imported.
+    Args:
+        prefix (str): The prefix of the directory name.
+    Returns:
+        Optional[str]: The directory created, or None if APP_DB_DIR was set.
+    """
+    if "app.const" in sys.modules:
+        raise RuntimeError("app.const is already imported, APP_DB_DIR would be ignored")
+    if os.environ.get("APP_DB_DIR"):
+        return None
+    db_dir = tempfile.mkdtemp(prefix=prefix)
+    os.environ["APP_DB_DIR"] = db_dir
+    return db_dir
+
+
+class UsageCounter(BaseCallbackHandler):
+    """
+    Count the LLM calls, tokens and tool calls of the runs it is attached to. Token
+    counts are read from the usage metadata of the responses.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.llm_calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.tool_calls = 0
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        input_tokens, output_tokens = 0, 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(
+                    getattr(generation, "message", None), "usage_metadata", None
+                )
+                if usage:
+                    input_tokens += usage.get("input_tokens", 0)
+                    output_tokens += usage.get("output_tokens", 0)
+        with self.lock:
+            self.llm_calls += 1
+            self.input_tokens += input_tokens
+            self.output_tokens += output_tokens
+
+    def on_tool_start(self, serialized: dict, input_str: str, **kwargs: Any) -> None:
+        with self.lock:
+            self.tool_calls += 1
+
+
+usage_counter_var: ContextVar[Optional[UsageCounter]] = ContextVar(
+    "usage_counter", default=None
+)
+register_configure_hook(usage_counter_var, inheritable=True)
+
+
+@contextmanager
+def track_usage() -> Iterator[UsageCounter]:
+    """
+    Attach a UsageCounter to every LLM and tool run started in this context, including
+    the graph nodes run in worker threads. Work handed to other threads outside the
+    graph, like the background memory writer, is not counted.
+    """
+    counter = UsageCounter()
+    token = usage_counter_var.set(counter)
+    try:
+        yield counter
+    finally:
+        usage_counter_var.reset(token)
+
+
+def checkpoint_bytes(conn: sqlite3.Connection, thread_id: str) -> int:
+    """
+    The bytes stored by the checkpointer for a thread: its checkpoints, their metadata
+    and their pending writes.
+    Args:
+        conn (sqlite3.Connection): A connection to the checkpointer database.
+        thread_id (str): The checkpoint thread id.
+    Returns:
+        int: The number of bytes.
+    """
+    (n_checkpoint_bytes,) = conn.execute(
+        "SELECT COALESCE(SUM(LENGTH(checkpoint) + LENGTH(metadata)), 0) "
+        "FROM checkpoints WHERE thread_id = ?",
+        (thread_id,),
+    ).fetchone()
+    (n_write_bytes,) = conn.execute(
+        "SELECT COALESCE(SUM(LENGTH(value)), 0) FROM writes WHERE thread_id = ?",
+        (thread_id,),
+    ).fetchone()
+    return n_checkpoint_bytes + n_write_bytes
+
+
+def latency_summary(latencies_seconds: List[float]) -> Dict[str, float]:
+    """The mean and p50/p95/p99 of latencies, in milliseconds."""
+    if not latencies_seconds:
+        return {}
+    latencies_ms = np.array(latencies_seconds) * 1000
+    return {
+        "mean": round(float(latencies_ms.mean()), 2),
+        "p50": round(float(np.percentile(latencies_ms, 50)), 2),
+        "p95": round(float(np.percentile(latencies_ms, 95)), 2),
+        "p99": round(float(np.percentile(latencies_ms, 99)), 2),
+        "max": round(float(latencies_ms.max()), 2),
+    }
+
+
+def measure(function: Callable[[], Any], repeats: int) -> Tuple[float, int]:
+    """
+    Time a function and measure the memory it allocates.
+    Args:
+        function (Callable[[], Any]): The function to measure.
+        repeats (int): The number of timed calls.
+    Returns:
+        Tuple[float, int]: The median time in seconds of the timed calls, and the peak
+        bytes allocated by one more call, traced separately as tracing slows it down.
+    """
+    durations = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        function()
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return float(np.median(durations)), peak_bytes
+
+
+def mean(values: List[float]) -> float:
+    return round(float(np.mean(values)), 2) if values else 0.0
+
+
+def compare_results(
+    baseline: Dict[str, dict], results: Dict[str, dict], tolerance: float
+) -> List[str]:
+    """
+    Compare the per-class metrics of two benchmark runs.
+    Args:
+        baseline (Dict[str, dict]): The per-class metrics of the baseline.
+        results (Dict[str, dict]): The per-class metrics of the new run.
+        tolerance (float): The relative increase of a metric counted as a regression.
+    Returns:
+        List[str]: One line per regressed metric.
+    """
+    regressions = []
+    for query_class, metrics in results.items():
+        baseline_metrics = flatten_metrics(baseline.get(query_class, {}))
+        for name, value in flatten_metrics(metrics).items():
+            old_value = baseline_metrics.get(name)
+            # The query count depends on the number of runs, not on the code
+            if name == "queries" or not old_value:
+                continue
+            change = (value - old_value) / old_value
+            if change > tolerance:
+                regressions.append(
+                    f"{query_class} {name}: {old_value} -> {value} ({change:+.0%})"
+                )
+    return regressions
+
+
+def flatten_metrics(metrics: dict, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for name, value in metrics.items():
+        if isinstance(value, dict):
+            flat.update(flatten_metrics(value, f"{prefix}{name}."))
+        elif isinstance(value, (int, float)):
+            flat[f"{prefix}{name}"] = value
+    return flat
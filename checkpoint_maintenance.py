@@ -0,0 +1,133 @@
+import os
+import sqlite3
+from typing import List, Tuple
+
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langgraph.store.base import BaseStore
+
+from id_manager import IDManager, checkpoint_thread_id
+from memory_compaction import delete_memories, list_memory_namespaces
+
+
+def db_file_size(db_path: str) -> int:
+    """The size in bytes of a SQLite database, including its write-ahead log."""
+    return sum(
+        os.path.getsize(path)
+        for path in (db_path, db_path + "-wal")
+        if os.path.exists(path)
+    )
+
+
+def prune_checkpoints(
+    conn: sqlite3.Connection, keep_latest: int, dry_run: bool = False
+) -> Tuple[int, int]:
+    """
+    Keep only the latest checkpoints of every thread, with their pending writes.
+    Checkpoint ids are time-ordered, so the latest checkpoints have the largest ids.
+    Args:
+        conn (sqlite3.Connection): An autocommit connection to the checkpointer database.
+        keep_latest (int): The number of checkpoints to keep per thread and namespace.
+        dry_run (bool): Count what would be deleted without deleting it.
+    Returns:
+        Tuple[int, int]: The numbers of checkpoints and writes removed.
+    """
+    stale_checkpoints = """
+        SELECT rowid FROM (
+            SELECT rowid, ROW_NUMBER() OVER (
+                PARTITION BY thread_id, checkpoint_ns ORDER BY checkpoint_id DESC
+            ) AS recency
+            FROM checkpoints
+        )
+        WHERE recency > ?
+    """
+    orphaned_writes = """
+        NOT EXISTS (
+            SELECT 1 FROM checkpoints
+            WHERE checkpoints.thread_id = writes.thread_id
+            AND checkpoints.checkpoint_ns = writes.checkpoint_ns
+            AND checkpoints.checkpoint_id = writes.checkpoint_id
+        )
+    """
+
+    # A dry run deletes inside a transaction, then rolls it back
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        n_checkpoints = conn.execute(
+            f"DELETE FROM checkpoints WHERE rowid IN ({stale_checkpoints})",
+            (keep_latest,),
+        ).rowcount
+        n_writes = conn.execute(f"DELETE FROM writes WHERE {orphaned_writes}").rowcount
+    except BaseException:
+        conn.rollback()
+        raise
+    if dry_run:
+        conn.rollback()
+    else:
+        conn.commit()
+    return n_checkpoints, n_writes
+
+
+def find_orphaned_threads(conn: sqlite3.Connection, id_manager: IDManager) -> List[str]:
+    """
+    Find the checkpointed threads that no longer exist in the users and threads database.
+    Args:
+        conn (sqlite3.Connection): A connection to the checkpointer database.
+        id_manager (IDManager): The users and threads database.
+    Returns:
+        List[str]: The checkpoint thread ids of the orphaned threads.
+    """
+    known_thread_ids = {
+        checkpoint_thread_id(user_id, thread_id)
+        for thread_id, user_id in id_manager.get_all_thread_ids()
+    }
+    checkpointed_thread_ids = [
+        row[0]
+        for row in conn.execute(
+            "SELECT DISTINCT thread_id FROM checkpoints UNION SELECT DISTINCT thread_id FROM writes"
+        )
+    ]
+    return [t for t in checkpointed_thread_ids if t not in known_thread_ids]
+
+
+def find_orphaned_users(store: BaseStore, id_manager: IDManager) -> List[str]:
+    """
+    Find the users with memories who no longer exist in the users and threads database.
+    Args:
+        store (BaseStore): The store holding the memories.
+        id_manager (IDManager): The users and threads database.
+    Returns:
+        List[str]: The ids of the orphaned users.
+    """
+    known_user_ids = set(id_manager.get_all_user_ids())
+    return [
+        namespace[-1]
+        for namespace in list_memory_namespaces(store)
+        if namespace[-1] not in known_user_ids
+    ]
+
+
+def delete_threads(checkpointer: BaseCheckpointSaver, thread_ids: List[str]) -> None:
+    for thread_id in thread_ids:
+        checkpointer.delete_thread(thread_id)
+
+
+def delete_user_memories(store: BaseStore, user_ids: List[str]) -> int:
+    return sum(
+        delete_memories(store, ("user_memories", user_id)) for user_id in user_ids
+    )
+
+
+def vacuum(conn: sqlite3.Connection, db_path: str) -> Tuple[int, int]:
+    """
+    Rebuild a database to return its free pages to the file system.
+    Args:
+        conn (sqlite3.Connection): A connection to the database, outside a transaction.
+        db_path (str): The path of the database.
+    Returns:
+        Tuple[int, int]: The size in bytes of the database before and after.
+    """
+    size_before = db_file_size(db_path)
+    conn.execute("VACUUM")
+    # Fold the write-ahead log back into the database so that the size is final
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return size_before, db_file_size(db_path)
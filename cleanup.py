@@ -1,15 +1,37 @@
 import os
+import shutil
 
-# List of files to delete
+# List of files to delete: the databases (with their WAL files), the dataset snapshot
+# and vector index built by preprocess.py, the router log and model, the traces, the
+# benchmark results and the LLM cassette
 files_to_delete = [
     "users_threads.db",
     "graph_state_store.db",
     "graph_state_checkpointer.db",
+    "llm_cache.db",
+    "bitext_dataset.arrow",
+    "bitext_vector_index",
+    "router_decisions.jsonl",
+    "router_decisions.jsonl.1",
+    "router_model.npz",
+    "traces.jsonl",
+    "benchmark_results.json",
+    "microbenchmark_results.json",
+    "llm_cassette.jsonl",
+]
+files_to_delete += [
+    filename + suffix
+    for filename in files_to_delete
+    if filename.endswith(".db")
+    for suffix in ["-wal", "-shm"]
 ]
 
 for filename in files_to_delete:
     try:
-        if os.path.exists(filename):
+        if os.path.isdir(filename):
+            shutil.rmtree(filename)
+            print(f"Deleted: {filename}")
+        elif os.path.exists(filename):
             os.remove(filename)
             print(f"Deleted: {filename}")
         else:
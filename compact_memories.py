@@ -0,0 +1,77 @@
+import argparse
+import os
+
+from langgraph.store.sqlite import SqliteStore
+
+from app.const import (
+    STORE_DB_FILE_PATH,
+    MEMORY_DEDUP_SIMILARITY_THRESHOLD,
+    MEMORY_MAX_PER_USER,
+)
+from memory_compaction import compact_memories
+from sqlite_backend import connect_sqlite
+
+# Offline memory compaction: merge each group of near-duplicate memories into its newest
+# one (keeping the distinct sentences of all) and cap each user's memory count, then
+# report what was reclaimed. Safe to schedule (e.g. nightly with cron)
+# while the app runs; deletes are autocommitted one memory at a time.
+parser = argparse.ArgumentParser(
+    description="Merge near-duplicate user memories and cap their number."
+)
+parser.add_argument(
+    "--similarity-threshold",
+    type=float,
+    default=MEMORY_DEDUP_SIMILARITY_THRESHOLD,
+    help="Cosine similarity above which two memories are near-duplicates.",
+)
+parser.add_argument(
+    "--max-memories",
+    type=int,
+    default=MEMORY_MAX_PER_USER,
+    help="Maximum number of memories kept per user.",
+)
+parser.add_argument(
+    "--dry-run",
+    action="store_true",
+    help="Report without merging or deleting anything.",
+)
+parser.add_argument(
+    "--vacuum",
+    action="store_true",
+    help="VACUUM the store afterwards to return the freed pages to the file system.",
+)
+args = parser.parse_args()
+
+try:
+    size_before = os.path.getsize(STORE_DB_FILE_PATH)
+    store_conn = connect_sqlite(STORE_DB_FILE_PATH)
+    store = SqliteStore(store_conn)
+
+    reports = compact_memories(
+        store, args.similarity_threshold, args.max_memories, dry_run=args.dry_run
+    )
+    for user_id, report in reports.items():
+        print(
+            f"{user_id}: {report['memories_before']} -> {report['memories_after']} memories "
+            f"({report['duplicates_merged']} duplicates merged into "
+            f"{report['memories_rewritten']} memories, {report['capped_removed']} over the cap)"
+        )
+
+    rows_removed = sum(
+        r["memories_before"] - r["memories_after"] for r in reports.values()
+    )
+    bytes_removed = sum(r["bytes_removed"] for r in reports.values())
+    print(
+        f"{'Would remove' if args.dry_run else 'Removed'} {rows_removed} memories "
+        f"({bytes_removed / 1024:.1f} KB of memory values) across {len(reports)} users"
+    )
+
+    if args.vacuum and not args.dry_run:
+        store_conn.execute("VACUUM")
+        size_after = os.path.getsize(STORE_DB_FILE_PATH)
+        print(
+            f"Store file: {size_before / 1024:.1f} KB -> {size_after / 1024:.1f} KB "
+            f"({(size_before - size_after) / 1024:.1f} KB reclaimed)"
+        )
+except Exception as e:
+    print(f"Error compacting memories: {e}")
@@ -0,0 +1,252 @@
+import json
+from typing import List, Optional, Tuple
+
+from pydantic import BaseModel, Field
+from langchain_core.messages import (
+    AIMessage,
+    HumanMessage,
+    SystemMessage,
+    ToolMessage,
+    RemoveMessage,
+)
+from langgraph.graph.message import REMOVE_ALL_MESSAGES
+
+from graph_state import UserQueryState
+from app.const import (
+    SUMMARIZE_CONTEXT_PROMPT_FILE_PATH,
+    CONTEXT_KEEP_LAST_TURNS,
+    CONTEXT_MAX_TURNS,
+    CONTEXT_TOKEN_BUDGET,
+    CONTEXT_TOOL_MESSAGE_MAX_CHARS,
+)
+from prompt import read_prompt_file, estimate_tokens
+from llm import llm
+
+# The rolling summary always sits first in the messages, under a fixed id
+CONTEXT_SUMMARY_MESSAGE_ID = "context_summary"
+CONTEXT_SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+
+class ContextSummary(BaseModel):
+    summary: str = Field(
+        ..., description="The updated summary of the conversation so far."
+    )
+
+
+def message_tokens(message) -> int:
+    text = message.content if isinstance(message.content, str) else str(message.content)
+    if isinstance(message, AIMessage) and message.tool_calls:
+        text += json.dumps([tool_call["args"] for tool_call in message.tool_calls])
+    return estimate_tokens(text)
+
+
+def turns_tokens(turns: List[list]) -> int:
+    return sum(message_tokens(message) for turn in turns for message in turn)
+
+
+def split_turns(messages: list) -> Tuple[Optional[SystemMessage], List[list]]:
+    """
+    Split the messages of a thread into the rolling summary and the turns after it.
+    A turn starts with the user query, or with the system prompt right before it.
+    Args:
+        messages (list): The messages of the thread.
+    Returns:
+        Tuple[Optional[SystemMessage], List[list]]: The summary, if any, and the turns.
+    """
+    summary, turns, current = None, [], []
+    for message in messages:
+        if message.id == CONTEXT_SUMMARY_MESSAGE_ID:
+            summary = message
+            continue
+        if isinstance(message, HumanMessage) and current:
+            head = [current.pop()] if isinstance(current[-1], SystemMessage) else []
+            if current:
+                turns.append(current)
+            current = head
+        current.append(message)
+    if current:
+        turns.append(current)
+    return summary, turns
+
+
+def compact_turn(turn: list) -> list:
+    # Past system prompts are rebuilt for every new turn, so they are dropped
+    return [
+        truncate_tool_message(message, CONTEXT_TOOL_MESSAGE_MAX_CHARS)
+        for message in turn
+        if not isinstance(message, SystemMessage)
+    ]
+
+
+def truncate_tool_message(message, max_chars: int):
+    if not isinstance(message, ToolMessage) or not isinstance(message.content, str):
+        return message
+    if len(message.content) <= max_chars:
+        return message
+
+    marker = f"\n... [truncated {len(message.content)} characters]"
+    return ToolMessage(
+        content=message.content[: max(0, max_chars - len(marker))] + marker,
+        tool_call_id=message.tool_call_id,
+        name=message.name,
+        id=message.id,
+    )
+
+
+def plan_context(messages: list) -> Tuple[Optional[SystemMessage], list, list, bool]:
+    """
+    Decide how to bound the context of a thread before a new turn. Past system prompts
+    are dropped and bulky tool outputs truncated. Once the thread is longer than
+    CONTEXT_MAX_TURNS turns, or over CONTEXT_TOKEN_BUDGET tokens, the oldest turns are
+    marked for folding into the summary, so that at most CONTEXT_KEEP_LAST_TURNS turns
+    (and at least one) stay verbatim. Folding down to fewer turns than the trigger
+    amortizes the summary LLM call over several turns.
+    Args:
+        messages (list): The messages of the thread.
+    Returns:
+        Tuple: The current summary, the turns to fold, the turns to keep, and whether
+        any message was dropped or truncated.
+    """
+    summary, turns = split_turns(messages)
+
+    compacted_turns = [compact_turn(turn) for turn in turns]
+    compacted = any(
+        len(new_turn) != len(turn)
+        or any(new is not old for new, old in zip(new_turn, turn))
+        for new_turn, turn in zip(compacted_turns, turns)
+    )
+    turns = compacted_turns
+
+    summary_tokens = message_tokens(summary) if summary is not None else 0
+    n_fold = 0
+    if (
+        len(turns) > CONTEXT_MAX_TURNS
+        or summary_tokens + turns_tokens(turns) > CONTEXT_TOKEN_BUDGET
+    ):
+        n_fold = max(0, len(turns) - CONTEXT_KEEP_LAST_TURNS)
+        while (
+            n_fold < len(turns) - 1
+            and summary_tokens + turns_tokens(turns[n_fold:]) > CONTEXT_TOKEN_BUDGET
+        ):
+            n_fold += 1
+
+    return summary, turns[:n_fold], turns[n_fold:], compacted
+
+
+def format_turns(turns: List[list]) -> str:
+    lines = []
+    for turn in turns:
+        for message in turn:
+            if isinstance(message, HumanMessage):
+                lines.append(f"User: {message.content}")
+            elif isinstance(message, AIMessage):
+                if message.content:
+                    lines.append(f"Assistant: {message.content}")
+                for tool_call in message.tool_calls:
+                    lines.append(
+                        f"Assistant called {tool_call['name']}: {json.dumps(tool_call['args'])}"
+                    )
+            elif isinstance(message, ToolMessage):
+                lines.append(f"Tool {message.name} returned: {message.content}")
+        lines.append("")
+    return "\n".join(lines)
+
+
+def build_context_summary_prompt(
+    summary: Optional[SystemMessage], folded_turns: List[list]
+) -> str:
+    previous_summary = (
+        summary.content[len(CONTEXT_SUMMARY_PREFIX) :]
+        if summary is not None
+        else "No earlier summary."
+    )
+    return read_prompt_file(SUMMARIZE_CONTEXT_PROMPT_FILE_PATH).format(
+        previous_summary=previous_summary,
+        conversation=format_turns(folded_turns),
+    )
+
+
+def apply_context(
+    state: UserQueryState,
+    summary: Optional[SystemMessage],
+    folded_turns: List[list],
+    kept_turns: List[list],
+    compacted: bool,
+) -> UserQueryState:
+    # The router and agents' prompts repeat the history of the turns kept verbatim,
+    # the older ones are in the summary: it is trimmed along with the messages, and
+    # capped like them between folds
+    concise_history = state.get("concise_history", [])
+    state["concise_history"] = concise_history[
+        -(len(kept_turns) if folded_turns else CONTEXT_MAX_TURNS) :
+    ]
+
+    if not folded_turns and not compacted:
+        state["messages"] = []
+        return state
+
+    messages = state.get("messages", [])
+    kept_messages = [message for turn in kept_turns for message in turn]
+    if summary is not None and all(
+        message.id != CONTEXT_SUMMARY_MESSAGE_ID for message in messages
+    ):
+        # Rewrite the whole list, so that the first summary lands first
+        state["messages"] = [RemoveMessage(id=REMOVE_ALL_MESSAGES), summary]
+        state["messages"].extend(kept_messages)
+        return state
+
+    # Otherwise only the dropped, truncated and summary messages are written: a
+    # message under an existing id is replaced in place, so the order is kept
+    current_messages = {message.id: message for message in messages}
+    kept_ids = {message.id for message in kept_messages}
+    state["messages"] = [
+        RemoveMessage(id=message.id)
+        for message in messages
+        if message.id not in kept_ids and message.id != CONTEXT_SUMMARY_MESSAGE_ID
+    ]
+    if summary is not None and summary is not current_messages.get(summary.id):
+        state["messages"].append(summary)
+    state["messages"].extend(
+        message
+        for message in kept_messages
+        if message is not current_messages.get(message.id)
+    )
+    return state
+
+
+def summary_message(summary: str) -> SystemMessage:
+    return SystemMessage(
+        content=CONTEXT_SUMMARY_PREFIX + summary, id=CONTEXT_SUMMARY_MESSAGE_ID
+    )
+
+
+def manage_context_node(state: UserQueryState) -> UserQueryState:
+
+    summary, folded_turns, kept_turns, compacted = plan_context(
+        state.get("messages", [])
+    )
+
+    if folded_turns:
+        response = llm.with_structured_output(ContextSummary).invoke(
+            build_context_summary_prompt(summary, folded_turns)
+        )
+        summary = summary_message(response.summary)
+        print(f"Folded {len(folded_turns)} turns into the context summary")
+
+    return apply_context(state, summary, folded_turns, kept_turns, compacted)
+
+
+async def manage_context_node_async(state: UserQueryState) -> UserQueryState:
+
+    summary, folded_turns, kept_turns, compacted = plan_context(
+        state.get("messages", [])
+    )
+
+    if folded_turns:
+        response = await llm.with_structured_output(ContextSummary).ainvoke(
+            build_context_summary_prompt(summary, folded_turns)
+        )
+        summary = summary_message(response.summary)
+        print(f"Folded {len(folded_turns)} turns into the context summary")
+
+    return apply_context(state, summary, folded_turns, kept_turns, compacted)
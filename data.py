@@ -1,11 +1,272 @@
-from typing import Any, Optional, Dict, List
-from app.const import DATASET_NAME, DATASET_SPLIT_NAME
-from datasets import load_dataset
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Optional, Dict, List, Tuple
+from app.const import (
+    DATASET_NAME,
+    DATASET_SPLIT_NAME,
+    DATASET_INDEXED_COLUMNS,
+    DATASET_VIEW_CACHE_SIZE,
+    DATASET_SNAPSHOT_FILE_PATH,
+    DATASET_TEXT_INDEXED_COLUMNS,
+    BM25_K1,
+    BM25_B,
+    VECTOR_INDEX_DIR_PATH,
+    VECTOR_INDEX_N_FEATURES,
+    VECTOR_INDEX_DIM,
+    DEFAULT_LLM_BACKEND,
+    LLM_CASSETTE_SAMPLE_SEED,
+)
+from text_index import BM25Index, top_k_matches
+from vector_index import VectorIndex
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+
+
+def sample_random_state() -> Optional[int]:
+    """The seed of the row samples: fixed when LLM exchanges are recorded or replayed."""
+    if os.getenv("LLM_BACKEND", DEFAULT_LLM_BACKEND) in ("record", "replay"):
+        return LLM_CASSETTE_SAMPLE_SEED
+    return None
+
+
+def load_dataset_from_hub() -> pd.DataFrame:
+    """
+    Download (or read from the Hugging Face cache) the Bitext dataset.
+    Returns:
+        pd.DataFrame: The dataset split as a DataFrame.
+    """
+    # Imported lazily: the snapshot path below does not need the datasets library
+    from datasets import load_dataset
+
+    dataset = load_dataset(DATASET_NAME, split=DATASET_SPLIT_NAME)
+    return dataset.to_pandas()
+
+
+def write_dataset_snapshot(
+    df: pd.DataFrame, snapshot_file_path: str = DATASET_SNAPSHOT_FILE_PATH
+) -> None:
+    """
+    Write the dataset as an uncompressed Arrow IPC file, with the indexed columns
+    dictionary-encoded, so it can be memory-mapped at startup.
+    Args:
+        df (pd.DataFrame): The dataset to write.
+        snapshot_file_path (str): The path of the snapshot file.
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    for column in DATASET_INDEXED_COLUMNS:
+        column_position = table.schema.get_field_index(column)
+        table = table.set_column(
+            column_position, column, table[column].dictionary_encode()
+        )
+
+    # Write to a temporary file first so a reader never sees a partial snapshot
+    tmp_file_path = f"{snapshot_file_path}.tmp"
+    with pa.OSFile(tmp_file_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_file_path, snapshot_file_path)
+
+
+def read_dataset_snapshot(
+    snapshot_file_path: str = DATASET_SNAPSHOT_FILE_PATH,
+) -> pd.DataFrame:
+    """
+    Memory-map the Arrow IPC snapshot written by write_dataset_snapshot.
+    Args:
+        snapshot_file_path (str): The path of the snapshot file.
+    Returns:
+        pd.DataFrame: The dataset, with text columns backed by the mapped Arrow buffers
+        and the indexed columns as categoricals.
+    """
+    with pa.memory_map(snapshot_file_path, "r") as source:
+        table = pa.ipc.open_file(source).read_all()
+    return table.to_pandas(types_mapper={pa.string(): pd.ArrowDtype(pa.string())}.get)
+
+
+def dataset_fingerprint(
+    snapshot_file_path: str = DATASET_SNAPSHOT_FILE_PATH,
+) -> Optional[str]:
+    """
+    Identify a dataset snapshot by its size and modification time, so that an index
+    built from an older snapshot is never used with a newer one.
+    Args:
+        snapshot_file_path (str): The path of the snapshot file.
+    Returns:
+        Optional[str]: The fingerprint, or None if there is no snapshot.
+    """
+    if not os.path.exists(snapshot_file_path):
+        return None
+    stat = os.stat(snapshot_file_path)
+    return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+
+def build_vector_index(df: pd.DataFrame) -> VectorIndex:
+    """
+    Embed every row (instruction and response together) for similarity search.
+    Args:
+        df (pd.DataFrame): The dataset to embed.
+    Returns:
+        VectorIndex: The index, with one embedding per row of df.
+    """
+    documents = (
+        df["instruction"].astype(str) + "\n" + df["response"].astype(str)
+    ).tolist()
+    return VectorIndex.build(
+        documents, n_features=VECTOR_INDEX_N_FEATURES, dim=VECTOR_INDEX_DIM
+    )
+
+
+def build_bitmap_index(
+    df: pd.DataFrame, columns: List[str]
+) -> Dict[str, Dict[str, np.ndarray]]:
+    """
+    Build a per-value bitmap index over the given columns.
+    Args:
+        df (pd.DataFrame): The DataFrame to index.
+        columns (List[str]): The columns to index.
+    Returns:
+        Dict[str, Dict[str, np.ndarray]]: For every column, a mapping from each value
+        (in order of first appearance) to a packed bitmap of the rows holding it.
+    """
+    n_rows = len(df)
+    index = {}
+    for column in columns:
+        codes, uniques = pd.factorize(df[column], sort=False)
+
+        # Group row ids by value with a single sort instead of one scan per value
+        order = np.argsort(codes, kind="stable")
+        boundaries = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+
+        bitmaps = {}
+        for code, value in enumerate(uniques):
+            mask = np.zeros(n_rows, dtype=bool)
+            mask[order[boundaries[code] : boundaries[code + 1]]] = True
+            bitmaps[str(value)] = np.packbits(mask)
+        index[column] = bitmaps
+    return index
+
+
+class CountCube:
+    """
+    Dense row counts over every combination of values of a few columns, so that
+    distributions and cross-tabs under any filter on those columns are array sums.
+    """
+
+    def __init__(self, df: pd.DataFrame, columns: List[str]):
+        self.columns = list(columns)
+        self.values: List[List[str]] = []
+
+        all_codes = []
+        for column in self.columns:
+            codes, uniques = pd.factorize(df[column], sort=False)
+            all_codes.append(codes)
+            self.values.append([str(value) for value in uniques])
+
+        shape = tuple(len(values) for values in self.values)
+        valid = np.all([codes >= 0 for codes in all_codes], axis=0)
+        flat_codes = np.ravel_multi_index([codes[valid] for codes in all_codes], shape)
+        self.counts = np.bincount(flat_codes, minlength=int(np.prod(shape))).reshape(
+            shape
+        )
+
+    def filtered_counts(self, filter_by: Dict[str, List[str]]) -> Optional[np.ndarray]:
+        """
+        Zero out the cells excluded by the filters.
+        Args:
+            filter_by (Dict[str, List[str]]): The filters, as in Dataset.filter_by.
+        Returns:
+            Optional[np.ndarray]: The filtered cube, or None if a filter is on a column
+            outside the cube.
+        """
+        counts = self.counts
+        for column, values in filter_by.items():
+            if not values:
+                continue
+            if column not in self.columns:
+                return None
+
+            axis = self.columns.index(column)
+            selected = np.isin(self.values[axis], values)
+            shape = [1] * counts.ndim
+            shape[axis] = -1
+            counts = counts * selected.reshape(shape)
+        return counts
+
+    def marginal(self, counts: np.ndarray, columns: List[str]) -> np.ndarray:
+        """Sum the cube over every axis except the given columns, in that order."""
+        axes = [self.columns.index(column) for column in columns]
+        other_axes = tuple(i for i in range(counts.ndim) if i not in axes)
+        summed = counts.sum(axis=other_axes)
+        # Axes that survive the sum keep their original relative order
+        return np.moveaxis(summed, np.argsort(np.argsort(axes)), range(len(axes)))
+
+
+def count_bitmap(bits: np.ndarray) -> int:
+    """Count the rows set in a packed bitmap."""
+    return int(np.bitwise_count(bits).sum())
+
+
+def first_row_in_bitmap(bits: np.ndarray) -> Optional[int]:
+    """Get the position of the first row set in a packed bitmap, if any."""
+    non_zero_bytes = np.flatnonzero(bits)
+    if len(non_zero_bytes) == 0:
+        return None
+    byte_position = int(non_zero_bytes[0])
+    # np.packbits is big-endian: the first row of a byte is its most significant bit
+    return byte_position * 8 + 8 - int(bits[byte_position]).bit_length()
+
+
+class FilteredView:
+    """
+    The rows selected by one filter combination, shared read-only by all Dataset
+    objects with the same filters.
+    """
+
+    def __init__(self, bits: np.ndarray, generation: int):
+        self.bits = bits
+        self.generation = generation
+        self._frame: Optional[pd.DataFrame] = None
+
+    @property
+    def frame(self) -> pd.DataFrame:
+        if self._frame is None:
+            df = Dataset.singleton_dataset
+            if count_bitmap(self.bits) == len(df):
+                # Nothing is filtered out, so share the singleton without copying
+                self._frame = df
+            else:
+                row_ids = np.flatnonzero(np.unpackbits(self.bits, count=len(df)))
+                self._frame = df.iloc[row_ids]
+        return self._frame
 
 
 class Dataset:
     singleton_dataset: Optional[pd.DataFrame] = None
+    singleton_index: Optional[Dict[str, Dict[str, np.ndarray]]] = None
+    singleton_cube: Optional[CountCube] = None
+
+    # Built when the dataset loads, so that no search pays for it
+    singleton_text_index: Optional[Dict[str, BM25Index]] = None
+    _text_index_lock = threading.Lock()
+
+    # Fingerprint of the snapshot the dataset was read from, None if not from a snapshot
+    singleton_fingerprint: Optional[str] = None
+
+    # Memory-mapped on first use from VECTOR_INDEX_DIR_PATH, which only preprocess.py
+    # writes; None (checked once) if it is missing or was built from another snapshot
+    singleton_vector_index: Optional[VectorIndex] = None
+    _vector_index_checked: bool = False
+    _vector_index_lock = threading.Lock()
+
+    # LRU cache of filtered views keyed by filter fingerprint, shared across threads
+    _view_cache: "OrderedDict[Tuple, FilteredView]" = OrderedDict()
+    _view_cache_lock = threading.Lock()
+    _generation: int = 0
+
+    # Held while the dataset is read and indexed, so that concurrent first uses load it once
+    _load_lock = threading.Lock()
 
     def __init__(
         self,
@@ -15,29 +276,205 @@ class Dataset:
             filter_by = {"category": [], "intent": []}
 
         self.filter_by: Dict[str, List[str]] = filter_by
-        if Dataset.singleton_dataset is None:
-            Dataset.singleton_dataset = self.load_dataset()
+        self._view: Optional[FilteredView] = None
+        self._view_key: Optional[Tuple] = None
+        self._ensure_loaded()
+
+    def _ensure_loaded(self) -> None:
+        if Dataset.singleton_dataset is not None:
+            return
+        with Dataset._load_lock:
+            if Dataset.singleton_dataset is None:
+                # Taken before reading, so a snapshot replaced meanwhile is never trusted
+                fingerprint = dataset_fingerprint(DATASET_SNAPSHOT_FILE_PATH)
+                Dataset.set_singleton_dataset(self.load_dataset(), fingerprint)
+                if Dataset.singleton_dataset is not None:
+                    Dataset.get_text_index()
+
+    @classmethod
+    def set_singleton_dataset(
+        cls, df: Optional[pd.DataFrame], fingerprint: Optional[str] = None
+    ) -> None:
+        """
+        Install the DataFrame shared by all Dataset objects and index it once.
+        Args:
+            df (Optional[pd.DataFrame]): The DataFrame to share, or None if loading failed.
+            fingerprint (Optional[str]): The fingerprint of the snapshot df was read from.
+        """
+        cls.singleton_dataset = df
+        cls.singleton_fingerprint = fingerprint
+        cls.singleton_index = (
+            None if df is None else build_bitmap_index(df, DATASET_INDEXED_COLUMNS)
+        )
+        cls.singleton_cube = (
+            None if df is None else CountCube(df, DATASET_INDEXED_COLUMNS)
+        )
+        with cls._text_index_lock:
+            cls.singleton_text_index = None
+        with cls._vector_index_lock:
+            cls.singleton_vector_index = None
+            cls._vector_index_checked = False
+        with cls._view_cache_lock:
+            cls._view_cache.clear()
+            cls._generation += 1
+
+    @classmethod
+    def get_text_index(cls) -> Dict[str, BM25Index]:
+        """
+        Get the BM25 index of every text column. It is built when the dataset loads;
+        a DataFrame installed directly with set_singleton_dataset gets it on first use.
+        Returns:
+            Dict[str, BM25Index]: The index of each column in DATASET_TEXT_INDEXED_COLUMNS.
+        """
+        if cls.singleton_dataset is None:
+            raise ValueError("Dataset not loaded properly.")
+
+        with cls._text_index_lock:
+            if cls.singleton_text_index is None:
+                cls.singleton_text_index = {
+                    column: BM25Index(
+                        cls.singleton_dataset[column].tolist(), k1=BM25_K1, b=BM25_B
+                    )
+                    for column in DATASET_TEXT_INDEXED_COLUMNS
+                }
+            return cls.singleton_text_index
+
+    @classmethod
+    def get_vector_index(cls) -> Optional[VectorIndex]:
+        """
+        Get the row embedding index written by preprocess.py. It is never built here,
+        as that takes minutes: a missing or stale index is reported once.
+        Returns:
+            Optional[VectorIndex]: The index, with one embedding per row of the dataset,
+            or None if there is no index for the loaded snapshot.
+        """
+        if cls.singleton_dataset is None:
+            raise ValueError("Dataset not loaded properly.")
+
+        with cls._vector_index_lock:
+            if cls.singleton_vector_index is None and not cls._vector_index_checked:
+                cls._vector_index_checked = True
+                vector_index = None
+                if cls.singleton_fingerprint is not None:
+                    vector_index = VectorIndex.load(
+                        VECTOR_INDEX_DIR_PATH, cls.singleton_fingerprint
+                    )
+                if vector_index is None or vector_index.embeddings.shape[0] != len(
+                    cls.singleton_dataset
+                ):
+                    print(
+                        "Vector index missing or built from another dataset snapshot, "
+                        "run preprocess.py to build it"
+                    )
+                    vector_index = None
+                cls.singleton_vector_index = vector_index
+            return cls.singleton_vector_index
 
     def load_dataset(self) -> Optional[pd.DataFrame]:
         try:
-            dataset = load_dataset(DATASET_NAME, split=DATASET_SPLIT_NAME)
-            return dataset.to_pandas()
+            if os.path.exists(DATASET_SNAPSHOT_FILE_PATH):
+                return read_dataset_snapshot(DATASET_SNAPSHOT_FILE_PATH)
+            return load_dataset_from_hub()
         except Exception as e:
             print(f"Error loading dataset: {e}")
             return None
 
     @property
     def dataset(self) -> pd.DataFrame:
-        if Dataset.singleton_dataset is None:
+        """
+        The rows selected by the current filters. The returned DataFrame is shared
+        between calls (and with the singleton when nothing is filtered), so it must
+        be treated as read-only.
+        """
+        return self._filtered_view().frame
+
+    def filter_bitmap(self) -> np.ndarray:
+        """
+        Get the packed bitmap of the rows selected by the current filters.
+        Returns:
+            np.ndarray: A packed bitmap with one bit per row of the full dataset.
+        """
+        return self._filtered_view().bits
+
+    def _filter_fingerprint(self) -> Tuple:
+        return tuple(
+            sorted(
+                (column, tuple(sorted(set(values))))
+                for column, values in self.filter_by.items()
+                if values
+            )
+        )
+
+    def _filtered_view(self) -> FilteredView:
+        if Dataset.singleton_dataset is None or Dataset.singleton_index is None:
             raise ValueError("Dataset not loaded properly.")
 
-        filtered_df = Dataset.singleton_dataset.copy()
+        # filter_by may have been changed in place, so the view held is checked
+        # against the current filters
+        key = self._filter_fingerprint()
+        view = getattr(self, "_view", None)
+        if (
+            view is not None
+            and view.generation == Dataset._generation
+            and getattr(self, "_view_key", None) == key
+        ):
+            return view
+
+        with Dataset._view_cache_lock:
+            view = Dataset._view_cache.get(key)
+            if view is not None:
+                Dataset._view_cache.move_to_end(key)
+
+        if view is None:
+            view = FilteredView(self._compute_filter_bitmap(), Dataset._generation)
+            with Dataset._view_cache_lock:
+                Dataset._view_cache[key] = view
+                Dataset._view_cache.move_to_end(key)
+                while len(Dataset._view_cache) > DATASET_VIEW_CACHE_SIZE:
+                    Dataset._view_cache.popitem(last=False)
+
+        self._view = view
+        self._view_key = key
+        return view
+
+    def _compute_filter_bitmap(self) -> np.ndarray:
+        bits = np.packbits(np.ones(len(Dataset.singleton_dataset), dtype=bool))
 
         for column, values in self.filter_by.items():
-            if values:
-                filtered_df = filtered_df[filtered_df[column].isin(values)]
+            if not values:
+                continue
+
+            column_index = Dataset.singleton_index.get(column)
+            if column_index is None:
+                column_bits = np.packbits(
+                    Dataset.singleton_dataset[column].isin(values).to_numpy()
+                )
+            else:
+                column_bits = np.zeros_like(bits)
+                for value in values:
+                    value_bits = column_index.get(value)
+                    if value_bits is not None:
+                        column_bits |= value_bits
 
-        return filtered_df
+            bits &= column_bits
+
+        return bits
+
+    def _get_possible_values(self, column: str) -> List[str]:
+        bits = self.filter_bitmap()
+        first_rows = {}
+        for value, value_bits in Dataset.singleton_index[column].items():
+            first_row = first_row_in_bitmap(value_bits & bits)
+            if first_row is not None:
+                first_rows[value] = first_row
+        # Keep the order of first appearance in the filtered rows
+        return sorted(first_rows, key=first_rows.get)
+
+    def _count_value(self, column: str, value: str) -> int:
+        value_bits = Dataset.singleton_index[column].get(value)
+        if value_bits is None:
+            return 0
+        return count_bitmap(value_bits & self.filter_bitmap())
 
     # For checkpointing (serialization)
     def __getstate__(self) -> Dict[str, Any]:
@@ -47,8 +484,9 @@ class Dataset:
 
     def __setstate__(self, state: Dict[str, Any]) -> None:
         self.filter_by = state["filter_by"]
-        if Dataset.singleton_dataset is None:
-            Dataset.singleton_dataset = self.load_dataset()
+        self._view = None
+        self._view_key = None
+        self._ensure_loaded()
 
     def __reduce__(self):
         # Return a tuple of (callable, args) to reconstruct the object
@@ -60,7 +498,7 @@ class Dataset:
         Returns:
             List[str]: A list of unique intent names.
         """
-        return self.dataset["intent"].unique().tolist()
+        return self._get_possible_values("intent")
 
     def get_possible_categories(self) -> List[str]:
         """
@@ -68,7 +506,7 @@ class Dataset:
         Returns:
             List[str]: A list of unique category names.
         """
-        return self.dataset["category"].unique().tolist()
+        return self._get_possible_values("category")
 
     def set_filter(
         self, category_names: List[str] = None, intent_names: List[str] = None
@@ -78,11 +516,13 @@ class Dataset:
             self.filter_by["category"] = category_names
         if intent_names is not None:
             self.filter_by["intent"] = intent_names
+        self._view = None
         return self
 
     def clear_filters(self) -> "Dataset":
         """Reset all filters"""
         self.filter_by = {"category": [], "intent": []}
+        self._view = None
         return self
 
     def select_semantic_intent(self, intent_names: List[str]) -> "Dataset":
@@ -111,7 +551,7 @@ class Dataset:
         Returns:
             int: The number of rows in the DataFrame.
         """
-        return len(self.dataset)
+        return count_bitmap(self.filter_bitmap())
 
     def count_category(self, category: str) -> int:
         """
@@ -121,7 +561,7 @@ class Dataset:
         Returns:
             int: The count of rows matching the specified category.
         """
-        return self.dataset[self.dataset["category"] == category].shape[0]
+        return self._count_value("category", category)
 
     def count_intent(self, intent: str) -> int:
         """
@@ -131,7 +571,7 @@ class Dataset:
         Returns:
             int: The count of rows matching the specified intent.
         """
-        return self.dataset[self.dataset["intent"] == intent].shape[0]
+        return self._count_value("intent", intent)
 
     def show_examples(self, n: int) -> pd.DataFrame:
         """
@@ -141,4 +581,190 @@ class Dataset:
         Returns:
             pd.DataFrame: A DataFrame containing n random samples from the dataset.
         """
-        return self.dataset.sample(n)
+        return self.dataset.sample(n, random_state=sample_random_state())
+
+    def get_distribution(
+        self, column: str, top_k: Optional[int] = None
+    ) -> Dict[str, int]:
+        """
+        Count the rows of every value of a column, most frequent first.
+        Args:
+            column (str): The column to count, one of category, intent or flags.
+            top_k (Optional[int]): Keep only the k most frequent values. Default is all.
+        Returns:
+            Dict[str, int]: The non-zero counts, sorted in descending order.
+        """
+        if column not in DATASET_INDEXED_COLUMNS:
+            raise ValueError(
+                f"Unsupported column '{column}'. Choose one of {DATASET_INDEXED_COLUMNS}."
+            )
+
+        counts = Dataset.singleton_cube.filtered_counts(self.filter_by)
+        if counts is None:
+            distribution = self.dataset[column].astype(str).value_counts(sort=False)
+        else:
+            values = Dataset.singleton_cube.values[
+                Dataset.singleton_cube.columns.index(column)
+            ]
+            marginal = Dataset.singleton_cube.marginal(counts, [column])
+            distribution = pd.Series(marginal, index=values)
+
+        distribution = distribution[distribution > 0].sort_values(
+            ascending=False, kind="stable"
+        )
+        if top_k is not None:
+            distribution = distribution.head(top_k)
+        return {str(value): int(count) for value, count in distribution.items()}
+
+    def value_counts(self, column: str, top_k: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Count the rows of every value of any column in one pass, with their shares.
+        Args:
+            column (str): The column to group by.
+            top_k (Optional[int]): Keep only the k most frequent values. Default is all.
+        Returns:
+            Dict[str, Any]: The number of rows and of distinct values under the current
+            filters, and the counts and shares (fraction of rows) per value, sorted in
+            descending order.
+        """
+        if column in DATASET_INDEXED_COLUMNS:
+            counts = self.get_distribution(column)
+        elif column in Dataset.singleton_dataset.columns:
+            distribution = self.dataset[column].value_counts(sort=True)
+            counts = {str(value): int(count) for value, count in distribution.items()}
+        else:
+            raise ValueError(
+                f"Unknown column '{column}'. Choose one of {Dataset.singleton_dataset.columns.tolist()}."
+            )
+
+        number_of_rows = self.count_rows()
+        number_of_distinct_values = len(counts)
+        if top_k is not None:
+            counts = dict(list(counts.items())[:top_k])
+
+        return {
+            "number_of_rows": number_of_rows,
+            "number_of_distinct_values": number_of_distinct_values,
+            "counts": counts,
+            "shares": {
+                value: round(count / number_of_rows, 4)
+                for value, count in counts.items()
+            },
+        }
+
+    def get_cross_tab(
+        self, row_column: str, column_column: str
+    ) -> Dict[str, Dict[str, int]]:
+        """
+        Count the rows of every pair of values of two columns.
+        Args:
+            row_column (str): The outer column, one of category, intent or flags.
+            column_column (str): The inner column, one of category, intent or flags.
+        Returns:
+            Dict[str, Dict[str, int]]: For every outer value, the non-zero counts of the
+            inner values, sorted in descending order.
+        """
+        for column in (row_column, column_column):
+            if column not in DATASET_INDEXED_COLUMNS:
+                raise ValueError(
+                    f"Unsupported column '{column}'. Choose one of {DATASET_INDEXED_COLUMNS}."
+                )
+        if row_column == column_column:
+            raise ValueError("The two columns of a cross-tab must be different.")
+
+        counts = Dataset.singleton_cube.filtered_counts(self.filter_by)
+        if counts is None:
+            df = self.dataset
+            table = pd.crosstab(
+                df[row_column].astype(str), df[column_column].astype(str)
+            )
+        else:
+            cube = Dataset.singleton_cube
+            table = pd.DataFrame(
+                cube.marginal(counts, [row_column, column_column]),
+                index=cube.values[cube.columns.index(row_column)],
+                columns=cube.values[cube.columns.index(column_column)],
+            )
+
+        cross_tab = {}
+        for row_value, row in table.iterrows():
+            row = row[row > 0].sort_values(ascending=False, kind="stable")
+            if len(row):
+                cross_tab[str(row_value)] = {
+                    str(value): int(count) for value, count in row.items()
+                }
+        return cross_tab
+
+    def search_text(
+        self, query: str, top_k: int, columns: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """
+        Rank the rows selected by the current filters against a free-text query with BM25.
+        Args:
+            query (str): The free-text query.
+            top_k (int): The maximum number of rows to return.
+            columns (Optional[List[str]]): The text columns to search. Default is all of
+                DATASET_TEXT_INDEXED_COLUMNS, with their scores summed.
+        Returns:
+            Dict[str, Any]: The number of matching rows, and the ids (positions in the full
+            dataset) and scores of the top rows, best first.
+        """
+        if columns is None:
+            columns = DATASET_TEXT_INDEXED_COLUMNS
+        for column in columns:
+            if column not in DATASET_TEXT_INDEXED_COLUMNS:
+                raise ValueError(
+                    f"Unsupported column '{column}'. Choose one of {DATASET_TEXT_INDEXED_COLUMNS}."
+                )
+        if top_k < 1:
+            raise ValueError("top_k must be at least 1.")
+
+        text_index = Dataset.get_text_index()
+        scores = sum(text_index[column].score(query) for column in columns)
+        candidates = np.unpackbits(
+            self.filter_bitmap(), count=len(Dataset.singleton_dataset)
+        ).astype(bool)
+
+        row_ids, row_scores, number_of_matching_rows = top_k_matches(
+            scores, candidates, top_k
+        )
+        return {
+            "number_of_matching_rows": number_of_matching_rows,
+            "row_ids": row_ids.tolist(),
+            "scores": [round(float(score), 4) for score in row_scores],
+        }
+
+    def search_similar(self, query: str, top_k: int) -> Dict[str, Any]:
+        """
+        Find the rows selected by the current filters that are most similar to a query.
+        Args:
+            query (str): The free-text query.
+            top_k (int): The maximum number of rows to return.
+        Returns:
+            Dict[str, Any]: The ids (positions in the full dataset) and cosine
+            similarities of the top rows, most similar first.
+        """
+        vector_index = Dataset.get_vector_index()
+        if vector_index is None:
+            raise ValueError("Vector index not built, run preprocess.py.")
+
+        candidates = np.unpackbits(
+            self.filter_bitmap(), count=len(Dataset.singleton_dataset)
+        ).astype(bool)
+        row_ids, similarities = vector_index.search(query, candidates, top_k)
+        return {
+            "row_ids": row_ids.tolist(),
+            "scores": [round(float(score), 4) for score in similarities],
+        }
+
+    def get_rows(self, row_ids: List[int]) -> pd.DataFrame:
+        """
+        Get rows of the full dataset by id, e.g. the ids returned by search_text.
+        Args:
+            row_ids (List[int]): Positions of the rows in the full dataset.
+        Returns:
+            pd.DataFrame: The rows, in the given order.
+        """
+        if Dataset.singleton_dataset is None:
+            raise ValueError("Dataset not loaded properly.")
+        return Dataset.singleton_dataset.iloc[row_ids]
@@ -1,27 +1,31 @@
-from typing import Callable
+from typing import AsyncIterator, Callable, Iterator
 
-from graph import workflow
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.utils.json import parse_partial_json
+
+from graph import workflow, get_async_workflow
 from data import Dataset
+from id_manager import checkpoint_thread_id
+from tracing import get_tracer
+from app.const import PRINT_TRANSCRIPTS
 
+# The answer field of every call whose arguments (tool calls) or JSON content
+# (structured output) carry the text shown to the user
+STREAMED_ANSWER_TOOL_FIELDS = {
+    "finish_tool": "final_response",
+}
+STREAMED_ANSWER_NODE_FIELDS = {
+    "out_of_scope_handler": "response",
+    "read_memory": "relevant_memories",
+}
+STREAM_MODES = ["messages", "updates", "tasks"]
+# The nodes that call tools. Other nodes may write back earlier messages of the
+# thread, like manage_context when it bounds the context, whose tool calls were
+# already reported in their own turn
+TOOL_CALLING_NODES = {"structured_query_agent", "unstructured_query_agent"}
 
-def process_user_query(
-    user_query: str,
-    user_id: str = None,
-    thread_id: str = None,
-    has_history: bool = False,
-):
-    """Process user query using the LangGraph workflow.
-
-    Args:
-        user_query (str): The user's question
-        user_id (str): The user ID for this conversation
-        thread_id (str): The thread ID for this conversation
-        has_history (bool): Whether this thread has existing conversation history
-
-    Returns:
-        dict: Contains 'dataset' and 'response'
-    """
 
+def build_initial_state(user_query: str, thread_id: str, has_history: bool) -> dict:
     initial_state = {
         "user_query": user_query,
         "query_classification_result": {},
@@ -38,25 +42,280 @@ def process_user_query(
         initial_state["concise_history"] = []
         print(f"Initialized fresh dataset for new thread {thread_id}")
 
+    return initial_state
+
+
+def build_config(user_id: str, thread_id: str) -> dict:
     # Configure with proper user_id and thread_id
     config = {
         "recursion_limit": 100,
         "configurable": {
-            "thread_id": user_id + "_" + thread_id,
+            "thread_id": checkpoint_thread_id(user_id, thread_id),
             "user_id": user_id,
         },
     }
+    tracer = get_tracer()
+    if tracer is not None:
+        config["callbacks"] = [tracer]
+    return config
+
+
+def print_transcript(final_state: dict) -> None:
+    # Formatting every message is slow on long threads, so it is off by default
+    if PRINT_TRANSCRIPTS:
+        for m in final_state["messages"]:
+            print(m.pretty_repr())
+
+
+def process_user_query(
+    user_query: str,
+    user_id: str = None,
+    thread_id: str = None,
+    has_history: bool = False,
+):
+    """Process user query using the LangGraph workflow.
+
+    Args:
+        user_query (str): The user's question
+        user_id (str): The user ID for this conversation
+        thread_id (str): The thread ID for this conversation
+        has_history (bool): Whether this thread has existing conversation history
+
+    Returns:
+        dict: Contains 'dataset' and 'response'
+    """
+
+    initial_state = build_initial_state(user_query, thread_id, has_history)
+    config = build_config(user_id, thread_id)
 
     print(
         f"Processing query through workflow for user {user_id}, thread {thread_id}..."
     )
     final_state = workflow.invoke(initial_state, config)
 
-    for m in final_state["messages"]:
-        print(m.pretty_repr())
+    print_transcript(final_state)
+
+    print("Workflow processing complete.")
+
+    return {
+        "response": final_state["final_response"],
+    }
+
+
+async def process_user_query_async(
+    user_query: str,
+    user_id: str = None,
+    thread_id: str = None,
+    has_history: bool = False,
+):
+    """Process user query using the async LangGraph workflow. Many queries can be
+    awaited concurrently from one event loop, interleaving while they wait on the LLM.
+
+    Args:
+        user_query (str): The user's question
+        user_id (str): The user ID for this conversation
+        thread_id (str): The thread ID for this conversation
+        has_history (bool): Whether this thread has existing conversation history
+
+    Returns:
+        dict: Contains 'response'
+    """
+
+    initial_state = build_initial_state(user_query, thread_id, has_history)
+    config = build_config(user_id, thread_id)
+
+    print(
+        f"Processing query through async workflow for user {user_id}, thread {thread_id}..."
+    )
+    async_workflow = await get_async_workflow()
+    final_state = await async_workflow.ainvoke(initial_state, config)
+
+    print_transcript(final_state)
 
     print("Workflow processing complete.")
 
     return {
         "response": final_state["final_response"],
     }
+
+
+class StreamEventParser:
+    """
+    Turn the (mode, chunk) pairs of a LangGraph multi-mode stream into UI events:
+        {"type": "node", "node": ...} when a node starts,
+        {"type": "tool_call", "node": ..., "name": ..., "args": ...} when an agent calls a tool,
+        {"type": "token", "text": ...} for every new piece of the answer text.
+    The answer is read from the partial JSON of finish_tool's arguments, or of the
+    structured output of the nodes that answer directly.
+    """
+
+    def __init__(self):
+        self.tool_call_args = {}
+        self.tool_call_names = {}
+        self.contents = {}
+        self.answer_length = 0
+        # Nodes that return the whole state repeat earlier messages in their updates
+        self.seen_tool_call_ids = set()
+
+    def parse(self, mode: str, chunk) -> list:
+        if mode == "tasks":
+            # Task start events carry the input, task results do not
+            if "input" in chunk:
+                return [{"type": "node", "node": chunk["name"]}]
+            return []
+
+        if mode == "updates":
+            return self._parse_update(chunk)
+
+        if mode == "messages":
+            message, metadata = chunk
+            if isinstance(message, AIMessageChunk):
+                return self._parse_message_chunk(message, metadata["langgraph_node"])
+            if isinstance(message, AIMessage):
+                # Messages that were not streamed, e.g. LLM cache hits
+                return self._parse_message(message, metadata["langgraph_node"])
+        return []
+
+    def _parse_update(self, update: dict) -> list:
+        events = []
+        for node, node_update in update.items():
+            if node not in TOOL_CALLING_NODES or not isinstance(node_update, dict):
+                continue
+            for message in node_update.get("messages", []):
+                if isinstance(message, AIMessage):
+                    for tool_call in message.tool_calls:
+                        if tool_call["id"] in self.seen_tool_call_ids:
+                            continue
+                        self.seen_tool_call_ids.add(tool_call["id"])
+                        events.append(
+                            {
+                                "type": "tool_call",
+                                "node": node,
+                                "name": tool_call["name"],
+                                "args": tool_call["args"],
+                            }
+                        )
+        return events
+
+    def _parse_message_chunk(self, message: AIMessageChunk, node: str) -> list:
+        partial_json, field = None, None
+
+        for tool_call_chunk in message.tool_call_chunks:
+            key = (message.id, tool_call_chunk.get("index"))
+            if tool_call_chunk.get("name"):
+                self.tool_call_names[key] = tool_call_chunk["name"]
+            self.tool_call_args[key] = self.tool_call_args.get(key, "") + (
+                tool_call_chunk.get("args") or ""
+            )
+            field = STREAMED_ANSWER_TOOL_FIELDS.get(self.tool_call_names.get(key))
+            if field is not None:
+                partial_json = self.tool_call_args[key]
+
+        if isinstance(message.content, str) and message.content:
+            self.contents[message.id] = (
+                self.contents.get(message.id, "") + message.content
+            )
+            if node in STREAMED_ANSWER_NODE_FIELDS:
+                field = STREAMED_ANSWER_NODE_FIELDS[node]
+                partial_json = self.contents[message.id]
+
+        if partial_json is None:
+            return []
+        parsed = parse_partial_json(partial_json) if partial_json else None
+        return self._answer_delta(parsed, field)
+
+    def _parse_message(self, message: AIMessage, node: str) -> list:
+        for tool_call in message.tool_calls:
+            field = STREAMED_ANSWER_TOOL_FIELDS.get(tool_call["name"])
+            if field is not None:
+                return self._answer_delta(tool_call["args"], field)
+
+        if node in STREAMED_ANSWER_NODE_FIELDS and isinstance(message.content, str):
+            parsed = parse_partial_json(message.content) if message.content else None
+            return self._answer_delta(parsed, STREAMED_ANSWER_NODE_FIELDS[node])
+        return []
+
+    def _answer_delta(self, parsed, field: str) -> list:
+        answer = parsed.get(field) if isinstance(parsed, dict) else None
+        if not isinstance(answer, str) or len(answer) <= self.answer_length:
+            return []
+
+        new_text = answer[self.answer_length :]
+        self.answer_length = len(answer)
+        return [{"type": "token", "text": new_text}]
+
+
+def stream_user_query(
+    user_query: str,
+    user_id: str = None,
+    thread_id: str = None,
+    has_history: bool = False,
+) -> Iterator[dict]:
+    """Process user query using the LangGraph workflow, yielding progress as it happens.
+
+    Args:
+        user_query (str): The user's question
+        user_id (str): The user ID for this conversation
+        thread_id (str): The thread ID for this conversation
+        has_history (bool): Whether this thread has existing conversation history
+
+    Yields:
+        dict: The events of StreamEventParser, then {"type": "final", "response": ...}
+    """
+
+    initial_state = build_initial_state(user_query, thread_id, has_history)
+    config = build_config(user_id, thread_id)
+
+    print(f"Streaming query through workflow for user {user_id}, thread {thread_id}...")
+    parser = StreamEventParser()
+    for mode, chunk in workflow.stream(initial_state, config, stream_mode=STREAM_MODES):
+        yield from parser.parse(mode, chunk)
+
+    final_state = workflow.get_state(config).values
+
+    print_transcript(final_state)
+
+    print("Workflow processing complete.")
+
+    yield {"type": "final", "response": final_state["final_response"]}
+
+
+async def astream_user_query(
+    user_query: str,
+    user_id: str = None,
+    thread_id: str = None,
+    has_history: bool = False,
+) -> AsyncIterator[dict]:
+    """Async variant of stream_user_query, on the async LangGraph workflow.
+
+    Args:
+        user_query (str): The user's question
+        user_id (str): The user ID for this conversation
+        thread_id (str): The thread ID for this conversation
+        has_history (bool): Whether this thread has existing conversation history
+
+    Yields:
+        dict: The events of StreamEventParser, then {"type": "final", "response": ...}
+    """
+
+    initial_state = build_initial_state(user_query, thread_id, has_history)
+    config = build_config(user_id, thread_id)
+
+    print(
+        f"Streaming query through async workflow for user {user_id}, thread {thread_id}..."
+    )
+    async_workflow = await get_async_workflow()
+    parser = StreamEventParser()
+    async for mode, chunk in async_workflow.astream(
+        initial_state, config, stream_mode=STREAM_MODES
+    ):
+        for event in parser.parse(mode, chunk):
+            yield event
+
+    final_state = (await async_workflow.aget_state(config)).values
+
+    print_transcript(final_state)
+
+    print("Workflow processing complete.")
+
+    yield {"type": "final", "response": final_state["final_response"]}
@@ -0,0 +1,235 @@
+import asyncio
+import hashlib
+import json
+import time
+from typing import Any, Iterator, List, Optional, Sequence
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import (
+    AIMessage,
+    AIMessageChunk,
+    BaseMessage,
+    HumanMessage,
+    ToolMessage,
+)
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from fast_router import match_keyword_rules
+from prompt import estimate_tokens
+
+
+def last_user_query(messages: List[BaseMessage]) -> str:
+    for message in reversed(messages):
+        if isinstance(message, HumanMessage):
+            return message.content if isinstance(message.content, str) else ""
+    return messages[-1].content if messages else ""
+
+
+def fill_schema(schema: dict, query: str) -> dict:
+    """
+    Build arguments matching a tool's JSON schema. The query classification label is
+    taken from the router keyword rules; other fields get fixed placeholder values.
+    """
+    properties = schema.get("parameters", {}).get("properties", {})
+    definitions = schema.get("parameters", {}).get("$defs", {})
+    args = {}
+    for field, field_schema in properties.items():
+        if "$ref" in field_schema:
+            field_schema = definitions.get(field_schema["$ref"].split("/")[-1], {})
+        elif "allOf" in field_schema:
+            field_schema = definitions.get(
+                field_schema["allOf"][0]["$ref"].split("/")[-1], {}
+            )
+
+        if "enum" in field_schema and field == "label":
+            args[field] = match_keyword_rules(query) or "out-of-scope"
+        elif "enum" in field_schema:
+            args[field] = field_schema["enum"][0]
+        elif field_schema.get("type") == "boolean":
+            args[field] = True
+        elif field_schema.get("type") == "integer":
+            args[field] = 1
+        elif field_schema.get("type") == "number":
+            args[field] = 1.0
+        elif field_schema.get("type") == "array":
+            args[field] = []
+        else:
+            args[field] = f"Scripted {field} for: {query[:80]}"
+    return args
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    A deterministic, offline stand-in for the chat model, to exercise and benchmark the
+    graph without any network. It follows a fixed script:
+    - With one tool forced (with_structured_output), it answers with arguments built from
+      the tool schema; the router label comes from the router keyword rules.
+    - With tools bound (the ReAct agents), it calls one data tool for the current turn
+      (summarize_tool, else count_rows_tool), then finish_tool with the tool's output.
+    - Without tools, it echoes the user query.
+    Every call waits latency_seconds, and reports estimated token usage.
+    """
+
+    latency_seconds: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted-fake"
+
+    def bind_tools(
+        self, tools: Sequence[Any], *, tool_choice: Optional[Any] = None, **kwargs: Any
+    ):
+        return self.bind(
+            tools=[convert_to_openai_tool(tool) for tool in tools],
+            tool_choice=tool_choice,
+            **kwargs,
+        )
+
+    def _respond(
+        self,
+        messages: List[BaseMessage],
+        tools: Optional[List[dict]] = None,
+        tool_choice: Optional[Any] = None,
+    ) -> AIMessage:
+        query = last_user_query(messages)
+        tool_functions = {
+            tool["function"]["name"]: tool["function"] for tool in tools or []
+        }
+
+        if not tool_functions:
+            content = f"Scripted answer for: {query[:80]}"
+            return AIMessage(
+                content=content, usage_metadata=self._usage(messages, content)
+            )
+
+        if tool_choice is not None and len(tool_functions) == 1:
+            name, function = next(iter(tool_functions.items()))
+            tool_call = {"name": name, "args": fill_schema(function, query)}
+        else:
+            # The tool results of the current turn, after the user query
+            turn_tool_messages = []
+            for message in reversed(messages):
+                if isinstance(message, HumanMessage):
+                    break
+                if isinstance(message, ToolMessage):
+                    turn_tool_messages.append(message)
+
+            if not turn_tool_messages and "summarize_tool" in tool_functions:
+                tool_call = {
+                    "name": "summarize_tool",
+                    "args": {"reasoning": "Summarize the rows", "user_request": query},
+                }
+            elif not turn_tool_messages and "count_rows_tool" in tool_functions:
+                tool_call = {
+                    "name": "count_rows_tool",
+                    "args": {"reasoning": "Count the rows"},
+                }
+            else:
+                result = turn_tool_messages[0].content if turn_tool_messages else ""
+                tool_call = {
+                    "name": "finish_tool",
+                    "args": {
+                        "reasoning": "The tool result answers the query",
+                        "final_response": f"Scripted answer: {result[:200]}",
+                    },
+                }
+
+        # Ids derived from the request, so that repeated runs are identical
+        request = json.dumps([str(message.content) for message in messages])
+        tool_call["id"] = (
+            "call_" + hashlib.sha1(request.encode("utf-8")).hexdigest()[:24]
+        )
+        return AIMessage(
+            content="",
+            tool_calls=[tool_call],
+            usage_metadata=self._usage(messages, json.dumps(tool_call["args"])),
+        )
+
+    def _usage(self, messages: List[BaseMessage], output: str) -> dict:
+        input_tokens = sum(
+            estimate_tokens(str(message.content)) for message in messages
+        )
+        output_tokens = estimate_tokens(output)
+        return {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        }
+
+    def _generate(
+        self, messages, stop=None, run_manager=None, **kwargs: Any
+    ) -> ChatResult:
+        time.sleep(self.latency_seconds)
+        message = self._respond(
+            messages, kwargs.get("tools"), kwargs.get("tool_choice")
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(
+        self, messages, stop=None, run_manager=None, **kwargs: Any
+    ) -> ChatResult:
+        await asyncio.sleep(self.latency_seconds)
+        message = self._respond(
+            messages, kwargs.get("tools"), kwargs.get("tool_choice")
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _chunks(self, message: AIMessage) -> Iterator[ChatGenerationChunk]:
+        # Split the response like a streaming API: the tool name first, then the
+        # arguments a few characters at a time
+        if not message.tool_calls:
+            yield ChatGenerationChunk(
+                message=AIMessageChunk(
+                    content=message.content, usage_metadata=message.usage_metadata
+                )
+            )
+            return
+
+        tool_call = message.tool_calls[0]
+        args = json.dumps(tool_call["args"])
+        yield ChatGenerationChunk(
+            message=AIMessageChunk(
+                content="",
+                tool_call_chunks=[
+                    {
+                        "name": tool_call["name"],
+                        "args": "",
+                        "id": tool_call["id"],
+                        "index": 0,
+                    }
+                ],
+            )
+        )
+        for i in range(0, len(args), 16):
+            yield ChatGenerationChunk(
+                message=AIMessageChunk(
+                    content="",
+                    tool_call_chunks=[
+                        {"name": None, "args": args[i : i + 16], "id": None, "index": 0}
+                    ],
+                )
+            )
+        yield ChatGenerationChunk(
+            message=AIMessageChunk(content="", usage_metadata=message.usage_metadata)
+        )
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        time.sleep(self.latency_seconds)
+        message = self._respond(
+            messages, kwargs.get("tools"), kwargs.get("tool_choice")
+        )
+        for chunk in self._chunks(message):
+            if run_manager:
+                run_manager.on_llm_new_token("", chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        await asyncio.sleep(self.latency_seconds)
+        message = self._respond(
+            messages, kwargs.get("tools"), kwargs.get("tool_choice")
+        )
+        for chunk in self._chunks(message):
+            if run_manager:
+                await run_manager.on_llm_new_token("", chunk=chunk)
+            yield chunk
@@ -0,0 +1,256 @@
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from text_index import tokenize
+
+# High-precision phrasings, checked in order; the first match wins.
+# Labels are QueryLabel values, kept as plain strings to avoid importing the LLM router.
+KEYWORD_RULES = [
+    (
+        "memory",
+        re.compile(
+            # Anchored to the user: "Do you remember the intents in ACCOUNT?" is a
+            # dataset follow-up
+            r"\b(what do you (remember|know) about me|do you remember (me|what i|my)|"
+            r"what have i (told|asked) you|my (preferences|previous questions))\b"
+        ),
+    ),
+    (
+        "structured",
+        re.compile(
+            # Counting and listing are only dataset queries about the labels and the
+            # schema. Words like customers or requests are in most customer service
+            # questions: "How many customers live in France?" is left to the model or
+            # the LLM
+            r"^(?=.*\b(categor(y|ies)|intents?|flags?|rows?|dataset|records?)\b)"
+            r"\s*(how many|count|what is the (number|count|share|percentage)|"
+            r"what are the (top|most|least)|list (all|the)|show (me )?(the )?"
+            r"(distribution|counts?|top|examples?))\b"
+        ),
+    ),
+    (
+        "unstructured",
+        re.compile(
+            r"^\s*(summari[sz]e|give me a summary|describe how|explain how|"
+            r"what (themes|patterns)|what is the tone|"
+            r"what are the (most common|top|main) (complaints|reasons|issues))\b"
+        ),
+    ),
+]
+
+
+def match_keyword_rules(query: str) -> Optional[str]:
+    """
+    Classify a query with the keyword rules.
+    Args:
+        query (str): The user query.
+    Returns:
+        Optional[str]: The label of the first matching rule, or None.
+    """
+    query = query.lower()
+    for label, pattern in KEYWORD_RULES:
+        if pattern.search(query):
+            return label
+    return None
+
+
+def query_features(query: str, n_features: int) -> np.ndarray:
+    """Hash the unigrams and bigrams of a query into a bag-of-words feature ids array."""
+    tokens = tokenize(query)
+    grams = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    return np.asarray(
+        [zlib.crc32(gram.encode("utf-8")) % n_features for gram in grams],
+        dtype=np.int64,
+    )
+
+
+def softmax(logits: np.ndarray) -> np.ndarray:
+    logits = logits - logits.max(axis=-1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+class FastRouterModel:
+    """
+    A multinomial logistic regression over hashed query n-grams, trained on the
+    decisions logged by the LLM router.
+    """
+
+    def __init__(
+        self, labels: List[str], weights: np.ndarray, bias: np.ndarray
+    ) -> None:
+        self.labels = labels
+        self.weights = weights
+        self.bias = bias
+        self.n_features = weights.shape[0]
+
+    @classmethod
+    def train(
+        cls,
+        queries: List[str],
+        labels: List[str],
+        n_features: int,
+        n_epochs: int = 300,
+        learning_rate: float = 5.0,
+        l2: float = 1e-4,
+    ) -> "FastRouterModel":
+        """
+        Fit the model with full-batch gradient descent on the cross-entropy loss.
+        Args:
+            queries (List[str]): The logged user queries.
+            labels (List[str]): The label chosen for each query.
+            n_features (int): The number of hashed features.
+            n_epochs (int): The number of gradient steps.
+            learning_rate (float): The gradient step size.
+            l2 (float): The L2 penalty on the weights.
+        Returns:
+            FastRouterModel: The trained model.
+        """
+        label_names = sorted(set(labels))
+        label_ids = np.asarray([label_names.index(label) for label in labels])
+        n_queries, n_labels = len(queries), len(label_names)
+
+        # Binary bag-of-words design matrix, normalized per query
+        x = np.zeros((n_queries, n_features), dtype=np.float32)
+        for i, query in enumerate(queries):
+            x[i, query_features(query, n_features)] = 1.0
+        x /= np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-12)
+        y = np.eye(n_labels, dtype=np.float32)[label_ids]
+
+        weights = np.zeros((n_features, n_labels), dtype=np.float32)
+        bias = np.zeros(n_labels, dtype=np.float32)
+        for _ in range(n_epochs):
+            error = (softmax(x @ weights + bias) - y) / n_queries
+            weights -= learning_rate * (x.T @ error + l2 * weights)
+            bias -= learning_rate * error.sum(axis=0)
+
+        return cls(label_names, weights, bias)
+
+    def predict(self, query: str) -> Tuple[str, float]:
+        """
+        Classify a query.
+        Args:
+            query (str): The user query.
+        Returns:
+            Tuple[str, float]: The most probable label and its probability.
+        """
+        features = np.unique(query_features(query, self.n_features))
+        logits = self.bias.copy()
+        if len(features):
+            logits += self.weights[features].sum(axis=0) / np.sqrt(len(features))
+        probabilities = softmax(logits)
+        best = int(np.argmax(probabilities))
+        return self.labels[best], float(probabilities[best])
+
+    def save(self, path: str) -> None:
+        np.savez(
+            path, labels=np.asarray(self.labels), weights=self.weights, bias=self.bias
+        )
+
+    @classmethod
+    def load(cls, path: str) -> Optional["FastRouterModel"]:
+        """
+        Load a model saved with save.
+        Returns:
+            Optional[FastRouterModel]: The model, or None if path does not exist.
+        """
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            return cls(
+                [str(label) for label in data["labels"]], data["weights"], data["bias"]
+            )
+
+
+class FastRouter:
+    """
+    Classify obvious queries locally: keyword rules first, then the trained model
+    when its confidence reaches the threshold. Returns None to defer to the LLM router.
+    """
+
+    def __init__(self, model: Optional[FastRouterModel], threshold: float) -> None:
+        self.model = model
+        self.threshold = threshold
+
+    def classify(self, query: str) -> Optional[Tuple[str, str]]:
+        """
+        Classify a query without calling the LLM.
+        Args:
+            query (str): The user query.
+        Returns:
+            Optional[Tuple[str, str]]: The label and a short reason, or None if no
+            local decision is confident enough.
+        """
+        label = match_keyword_rules(query)
+        if label is not None:
+            return label, "Matched a fast-path keyword rule."
+
+        if self.model is not None:
+            label, confidence = self.model.predict(query)
+            if confidence >= self.threshold:
+                return (
+                    label,
+                    f"Fast-path classifier confidence {confidence:.2f}.",
+                )
+        return None
+
+
+router_log_lock = threading.Lock()
+
+
+def rotated_log_path(log_path: str) -> str:
+    return log_path + ".1"
+
+
+def log_router_decision(
+    log_path: str, query: str, label: str, max_bytes: Optional[int] = None
+) -> None:
+    """
+    Append an LLM router decision to the JSONL training log of the fast router.
+    Args:
+        log_path (str): The log file.
+        query (str): The user query.
+        label (str): The label chosen by the LLM router.
+        max_bytes (Optional[int]): The size past which the log is moved to
+            rotated_log_path, replacing the previous one. None never rotates.
+    """
+    line = json.dumps({"time": time.time(), "query": query, "label": label}) + "\n"
+    try:
+        with router_log_lock:
+            if (
+                max_bytes is not None
+                and os.path.exists(log_path)
+                and os.path.getsize(log_path) >= max_bytes
+            ):
+                os.replace(log_path, rotated_log_path(log_path))
+            with open(log_path, "a", encoding="utf-8") as f:
+                f.write(line)
+    except OSError as e:
+        print(f"Error logging router decision: {e}")
+
+
+def read_router_decisions(log_path: str) -> Tuple[List[str], List[str]]:
+    """
+    Read the logged router decisions, the rotated ones first.
+    Returns:
+        Tuple[List[str], List[str]]: The queries and their labels.
+    """
+    queries, labels = [], []
+    for path in [rotated_log_path(log_path), log_path]:
+        if not os.path.exists(path):
+            continue
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                decision = json.loads(line)
+                queries.append(decision["query"])
+                labels.append(decision["label"])
+    return queries, labels
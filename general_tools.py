@@ -1,5 +1,5 @@
 import json
-from typing import List
+from typing import List, Optional
 from typing_extensions import Annotated
 from langchain_core.tools import tool, InjectedToolCallId
 from langchain_core.messages import ToolMessage
@@ -7,6 +7,7 @@ from langgraph.prebuilt import InjectedState
 from langgraph.types import Command
 
 from data import Dataset
+from app.const import TEXT_SEARCH_DEFAULT_TOP_K
 
 
 @tool
@@ -129,6 +130,71 @@ def select_semantic_category_tool(
     )
 
 
+@tool
+def search_text_tool(
+    reasoning: str,
+    query: str,
+    dataset: Annotated[Dataset, InjectedState("dataset")],
+    tool_call_id: Annotated[str, InjectedToolCallId],
+    top_k: Optional[int] = None,
+) -> Command:
+    """
+    Keyword search (BM25) over the 'instruction' and 'response' text of the currently selected rows.
+    Args:
+        reasoning (str): Reasoning for the function call.
+        query (str): The keywords to search for.
+        top_k (int): The number of best matching rows to return. Default is 10.
+    Returns:
+        The number of matching rows and the best matching rows with their scores.
+    """
+    try:
+        search_results = dataset.search_text(
+            query, top_k=top_k or TEXT_SEARCH_DEFAULT_TOP_K
+        )
+        rows = dataset.get_rows(search_results["row_ids"])
+        top_rows = [
+            {
+                "row_id": row_id,
+                "score": score,
+                "instruction": row["instruction"],
+                "category": row["category"],
+                "intent": row["intent"],
+            }
+            for row_id, score, (_, row) in zip(
+                search_results["row_ids"], search_results["scores"], rows.iterrows()
+            )
+        ]
+        return Command(
+            update={
+                "messages": [
+                    ToolMessage(
+                        json.dumps(
+                            {
+                                "number_of_matching_rows": search_results[
+                                    "number_of_matching_rows"
+                                ],
+                                "top_rows": top_rows,
+                            }
+                        ),
+                        tool_call_id=tool_call_id,
+                    )
+                ]
+            }
+        )
+    except Exception as e:
+        error_msg = f"Error processing function call: {str(e)}"
+        return Command(
+            update={
+                "messages": [
+                    ToolMessage(
+                        json.dumps({"error": error_msg}),
+                        tool_call_id=tool_call_id,
+                    )
+                ]
+            }
+        )
+
+
 @tool
 def finish_tool(
     reasoning: str,
@@ -1,25 +1,40 @@
-import sqlite3
+import asyncio
+import threading
+import aiosqlite
 from langgraph.graph import StateGraph, START, END
-from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
 from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
-from langgraph.store.sqlite import SqliteStore
+from langgraph.store.sqlite.aio import AsyncSqliteStore
 
 from graph_state import UserQueryState
-from router import router_node, get_query_label, QueryLabel
+from sqlite_backend import ThreadLocalSqliteSaver, ThreadLocalSqliteStore
+from context_window import manage_context_node, manage_context_node_async
+from router import router_node, router_node_async, get_query_label, QueryLabel
 from structured_query_agent import (
     structured_query_agent_node,
+    structured_query_agent_node_async,
     structured_query_agent_tool_node,
 )
 from unstructured_query_agent import (
     unstructured_query_agent_node,
+    unstructured_query_agent_node_async,
     unstructured_query_agent_tool_node,
 )
-from out_of_scope_query_handler import out_of_scope_handler_node
-from summarized_memory import save_memory_node, read_memory_node
+from out_of_scope_query_handler import (
+    out_of_scope_handler_node,
+    out_of_scope_handler_node_async,
+)
+from summarized_memory import (
+    save_memory_node,
+    save_memory_node_async,
+    read_memory_node,
+    read_memory_node_async,
+)
 from app.const import (
     CHECKPOINTER_DB_FILE_PATH,
     STORE_DB_FILE_PATH,
     GRAPH_VISUALIZATION_FILE_NAME_BASE_FULL_PATH,
+    SQLITE_BUSY_TIMEOUT_SECONDS,
 )
 
 
@@ -44,81 +59,183 @@ def is_complete(state: UserQueryState) -> bool:
     return bool(state["is_complete"])
 
 
-workflow_builder = StateGraph(UserQueryState)
-
-workflow_builder.add_node("router", router_node)
-
-workflow_builder.add_node("structured_query_agent", structured_query_agent_node)
-workflow_builder.add_node(
-    "structured_query_agent_tools", structured_query_agent_tool_node
-)
-
-workflow_builder.add_node("unstructured_query_agent", unstructured_query_agent_node)
-workflow_builder.add_node(
-    "unstructured_query_agent_tools", unstructured_query_agent_tool_node
-)
-
-workflow_builder.add_node("out_of_scope_handler", out_of_scope_handler_node)
-
-workflow_builder.add_node("save_memory", save_memory_node)
-workflow_builder.add_node("read_memory", read_memory_node)
-
-workflow_builder.add_edge(START, "router")
-
-workflow_builder.add_conditional_edges(
-    "router",
-    get_query_label,
-    {
-        QueryLabel.structured: "structured_query_agent",
-        QueryLabel.unstructured: "unstructured_query_agent",
-        QueryLabel.out_of_scope: "out_of_scope_handler",
-        QueryLabel.memory: "read_memory",
-    },
-)
-
-workflow_builder.add_conditional_edges(
-    "structured_query_agent",
-    is_complete,
-    {
-        True: "save_memory",
-        False: "structured_query_agent_tools",
-    },
-)
-workflow_builder.add_conditional_edges(
-    "structured_query_agent_tools",
-    is_complete,
-    {True: "save_memory", False: "structured_query_agent"},
-)
-
-workflow_builder.add_conditional_edges(
-    "unstructured_query_agent",
-    is_complete,
+def build_workflow(nodes: dict) -> StateGraph:
+    """
+    Build the workflow graph. The sync and async workflows share this topology and
+    differ only in their node functions.
+    Args:
+        nodes (dict): The function of each LLM-calling node, by node name.
+    Returns:
+        StateGraph: The uncompiled workflow.
+    """
+    workflow_builder = StateGraph(UserQueryState)
+
+    workflow_builder.add_node("manage_context", nodes["manage_context"])
+
+    workflow_builder.add_node("router", nodes["router"])
+
+    workflow_builder.add_node("structured_query_agent", nodes["structured_query_agent"])
+    workflow_builder.add_node(
+        "structured_query_agent_tools", structured_query_agent_tool_node
+    )
+
+    workflow_builder.add_node(
+        "unstructured_query_agent", nodes["unstructured_query_agent"]
+    )
+    workflow_builder.add_node(
+        "unstructured_query_agent_tools", unstructured_query_agent_tool_node
+    )
+
+    workflow_builder.add_node("out_of_scope_handler", nodes["out_of_scope_handler"])
+
+    workflow_builder.add_node("save_memory", nodes["save_memory"])
+    workflow_builder.add_node("read_memory", nodes["read_memory"])
+
+    workflow_builder.add_edge(START, "manage_context")
+
+    workflow_builder.add_edge("manage_context", "router")
+
+    workflow_builder.add_conditional_edges(
+        "router",
+        get_query_label,
+        {
+            QueryLabel.structured: "structured_query_agent",
+            QueryLabel.unstructured: "unstructured_query_agent",
+            QueryLabel.out_of_scope: "out_of_scope_handler",
+            QueryLabel.memory: "read_memory",
+        },
+    )
+
+    workflow_builder.add_conditional_edges(
+        "structured_query_agent",
+        is_complete,
+        {
+            True: "save_memory",
+            False: "structured_query_agent_tools",
+        },
+    )
+    workflow_builder.add_conditional_edges(
+        "structured_query_agent_tools",
+        is_complete,
+        {True: "save_memory", False: "structured_query_agent"},
+    )
+
+    workflow_builder.add_conditional_edges(
+        "unstructured_query_agent",
+        is_complete,
+        {
+            True: "save_memory",
+            False: "unstructured_query_agent_tools",
+        },
+    )
+    workflow_builder.add_conditional_edges(
+        "unstructured_query_agent_tools",
+        is_complete,
+        {True: "save_memory", False: "unstructured_query_agent"},
+    )
+
+    workflow_builder.add_edge("out_of_scope_handler", "save_memory")
+
+    workflow_builder.add_edge("read_memory", "save_memory")
+
+    workflow_builder.add_edge("save_memory", END)
+
+    return workflow_builder
+
+
+workflow_builder = build_workflow(
     {
-        True: "save_memory",
-        False: "unstructured_query_agent_tools",
-    },
-)
-workflow_builder.add_conditional_edges(
-    "unstructured_query_agent_tools",
-    is_complete,
-    {True: "save_memory", False: "unstructured_query_agent"},
+        "manage_context": manage_context_node,
+        "router": router_node,
+        "structured_query_agent": structured_query_agent_node,
+        "unstructured_query_agent": unstructured_query_agent_node,
+        "out_of_scope_handler": out_of_scope_handler_node,
+        "save_memory": save_memory_node,
+        "read_memory": read_memory_node,
+    }
 )
 
-workflow_builder.add_edge("out_of_scope_handler", "save_memory")
-
-workflow_builder.add_edge("read_memory", "save_memory")
-
-workflow_builder.add_edge("save_memory", END)
-
-checkpointer_conn = sqlite3.connect(
-    CHECKPOINTER_DB_FILE_PATH, check_same_thread=False, isolation_level=None
-)
+# One connection per thread, so that queries run from several threads at once (e.g.
+# concurrent Streamlit sessions) do not serialize on, or share, a single connection
 serde = JsonPlusSerializer(pickle_fallback=True)
-checkpointer = SqliteSaver(checkpointer_conn, serde=serde)
+checkpointer = ThreadLocalSqliteSaver(CHECKPOINTER_DB_FILE_PATH, serde=serde)
 
-store_conn = sqlite3.connect(
-    STORE_DB_FILE_PATH, check_same_thread=False, isolation_level=None
-)
-store = SqliteStore(store_conn)
+store = ThreadLocalSqliteStore(STORE_DB_FILE_PATH)
 
 workflow = workflow_builder.compile(checkpointer=checkpointer, store=store)
+
+
+# The async workflow runs the same graph on async nodes, an async checkpointer and an
+# async store, so one process can serve many queries while waiting on the LLM.
+# aiosqlite connections (and asyncio locks) are bound to the event loop they were
+# created in, and a process may run several loops, one after the other or in different
+# threads, so there is one async workflow per loop, opened on first use inside it.
+# Their worker threads are daemonized so that, like the sync connections, they never
+# keep the process alive at exit (writes are autocommitted). close_async_workflow
+# closes the connections of a loop before it ends.
+async_workflows = {}
+async_workflow_locks = {}
+async_workflows_lock = threading.Lock()
+
+
+def get_async_workflow_lock(loop: asyncio.AbstractEventLoop) -> asyncio.Lock:
+    with async_workflows_lock:
+        return async_workflow_locks.setdefault(loop, asyncio.Lock())
+
+
+async def open_async_connection(db_file_path: str) -> aiosqlite.Connection:
+    conn = aiosqlite.connect(
+        db_file_path,
+        isolation_level=None,
+        timeout=SQLITE_BUSY_TIMEOUT_SECONDS,
+    )
+    conn.daemon = True
+    return await conn
+
+
+async def get_async_workflow():
+    """
+    Get the async workflow of the running event loop, opening its connections on
+    first use.
+    """
+    loop = asyncio.get_running_loop()
+    async with get_async_workflow_lock(loop):
+        if loop not in async_workflows:
+            async_checkpointer_conn = await open_async_connection(
+                CHECKPOINTER_DB_FILE_PATH
+            )
+            async_checkpointer = AsyncSqliteSaver(async_checkpointer_conn, serde=serde)
+
+            async_store_conn = await open_async_connection(STORE_DB_FILE_PATH)
+            async_store = AsyncSqliteStore(async_store_conn)
+
+            async_workflow = build_workflow(
+                {
+                    "manage_context": manage_context_node_async,
+                    "router": router_node_async,
+                    "structured_query_agent": structured_query_agent_node_async,
+                    "unstructured_query_agent": unstructured_query_agent_node_async,
+                    "out_of_scope_handler": out_of_scope_handler_node_async,
+                    "save_memory": save_memory_node_async,
+                    "read_memory": read_memory_node_async,
+                }
+            ).compile(checkpointer=async_checkpointer, store=async_store)
+            async_workflows[loop] = (
+                async_workflow,
+                [async_checkpointer_conn, async_store_conn],
+            )
+        return async_workflows[loop][0]
+
+
+async def close_async_workflow() -> None:
+    """
+    Close the connections of the running event loop's async workflow, if it has one,
+    and forget it. Call it before the loop ends, e.g. at the end of asyncio.run.
+    """
+    loop = asyncio.get_running_loop()
+    async with get_async_workflow_lock(loop):
+        _, connections = async_workflows.pop(loop, (None, []))
+        for conn in connections:
+            await conn.close()
+    with async_workflows_lock:
+        async_workflow_locks.pop(loop, None)
@@ -1,24 +1,89 @@
+import queue
 import sqlite3
 import uuid
-from typing import List, Optional, Tuple
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Tuple
 import os
 
-from app.const import USERS_THREADS_DB_FILE_PATH
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langgraph.store.base import BaseStore
+
+from sqlite_backend import connect_sqlite, begin_immediate
+from app.const import USERS_THREADS_DB_FILE_PATH, USERS_THREADS_DB_POOL_SIZE
+
+
+def checkpoint_thread_id(user_id: str, thread_id: str) -> str:
+    """The thread id under which the graph checkpoints a user's thread."""
+    return user_id + "_" + thread_id
 
 
 class IDManager:
-    def __init__(self, db_path: str = USERS_THREADS_DB_FILE_PATH):
-        """Initialize the ID Manager with SQLite database."""
+    def __init__(
+        self,
+        db_path: str = USERS_THREADS_DB_FILE_PATH,
+        pool_size: int = USERS_THREADS_DB_POOL_SIZE,
+        checkpointer: Optional[BaseCheckpointSaver] = None,
+        store: Optional[BaseStore] = None,
+    ):
+        """
+        Initialize the ID Manager with SQLite database.
+        Args:
+            db_path: The path of the users and threads database
+            pool_size: The maximum number of idle pooled connections
+            checkpointer: Optional - the graph checkpointer, to delete the checkpoints
+                of deleted threads
+            store: Optional - the graph store, to delete the memories of deleted users
+        """
         self.db_path = db_path
+        self.checkpointer = checkpointer
+        self.store = store
+        # Idle connections, reused across calls and threads (one user at a time)
+        self.pool = queue.LifoQueue(maxsize=pool_size)
         self.init_database()
 
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a pooled connection, opening one if none is idle."""
+        try:
+            conn = self.pool.get_nowait()
+        except queue.Empty:
+            # Autocommit mode: compound writes open their own transaction
+            conn = connect_sqlite(self.db_path)
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            try:
+                self.pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Cursor]:
+        """Run the enclosed statements as one atomic write transaction."""
+        with self._connection() as conn:
+            begin_immediate(conn)
+            try:
+                yield conn.cursor()
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    def close(self):
+        """Close every idle pooled connection."""
+        while True:
+            try:
+                self.pool.get_nowait().close()
+            except queue.Empty:
+                return
+
     def init_database(self):
         """Initialize the database with required tables only if database doesn't exist."""
         # Check if database file exists
         if not os.path.exists(self.db_path):
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-
+            with self._transaction() as cursor:
                 # Create users table
                 cursor.execute(
                     """
@@ -58,17 +123,24 @@ class IDManager:
                 """
                 )
 
-                conn.commit()
-                print(f"Database created: {self.db_path}")
+            print(f"Database created: {self.db_path}")
+
+        # Also added to databases created before the index existed
+        with self._connection() as conn:
+            conn.execute(
+                """
+                CREATE INDEX IF NOT EXISTS idx_thread_history_user_thread_order
+                ON thread_history (user_id, thread_id, entry_order)
+            """
+            )
 
     def get_all_user_ids(self) -> List[str]:
         """
         Get all existing user IDs.
         Returns: List of user IDs
         """
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT user_id FROM users ORDER BY user_id")
+        with self._connection() as conn:
+            cursor = conn.execute("SELECT user_id FROM users ORDER BY user_id")
             return [row[0] for row in cursor.fetchall()]
 
     def create_user_id(self, user_id: str) -> bool:
@@ -80,10 +152,8 @@ class IDManager:
             True if created successfully, False if already exists
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("INSERT INTO users (user_id) VALUES (?)", (user_id,))
-                conn.commit()
+            with self._connection() as conn:
+                conn.execute("INSERT INTO users (user_id) VALUES (?)", (user_id,))
                 return True
         except sqlite3.IntegrityError:
             # User ID already exists
@@ -91,9 +161,8 @@ class IDManager:
 
     def user_exists(self, user_id: str) -> bool:
         """Check if a user ID exists."""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT 1 FROM users WHERE user_id = ?", (user_id,))
+        with self._connection() as conn:
+            cursor = conn.execute("SELECT 1 FROM users WHERE user_id = ?", (user_id,))
             return cursor.fetchone() is not None
 
     def get_all_thread_ids(
@@ -106,23 +175,22 @@ class IDManager:
         Returns:
             List of tuples (thread_id, user_id)
         """
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+        with self._connection() as conn:
             if user_id:
-                cursor.execute(
+                cursor = conn.execute(
                     """
-                    SELECT thread_id, user_id 
-                    FROM threads 
-                    WHERE user_id = ? 
+                    SELECT thread_id, user_id
+                    FROM threads
+                    WHERE user_id = ?
                     ORDER BY thread_id
                 """,
                     (user_id,),
                 )
             else:
-                cursor.execute(
+                cursor = conn.execute(
                     """
-                    SELECT thread_id, user_id 
-                    FROM threads 
+                    SELECT thread_id, user_id
+                    FROM threads
                     ORDER BY thread_id
                 """
                 )
@@ -141,16 +209,14 @@ class IDManager:
             return False
 
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute(
+            with self._connection() as conn:
+                conn.execute(
                     """
-                    INSERT INTO threads (thread_id, user_id) 
+                    INSERT INTO threads (thread_id, user_id)
                     VALUES (?, ?)
                 """,
                     (thread_id, user_id),
                 )
-                conn.commit()
                 return True
         except sqlite3.IntegrityError:
             # Thread ID already exists for this user
@@ -158,11 +224,10 @@ class IDManager:
 
     def thread_exists(self, thread_id: str, user_id: str) -> bool:
         """Check if a thread ID exists for a specific user."""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
+        with self._connection() as conn:
+            cursor = conn.execute(
                 """
-                SELECT 1 FROM threads 
+                SELECT 1 FROM threads
                 WHERE thread_id = ? AND user_id = ?
             """,
                 (thread_id, user_id),
@@ -185,44 +250,56 @@ class IDManager:
 
     def delete_user(self, user_id: str) -> bool:
         """
-        Delete a user and all associated threads.
+        Delete a user and all associated threads and their history, atomically.
+        The threads' checkpoints and the user's memories are deleted afterwards, when
+        a checkpointer and a store are set.
         Args:
             user_id: The user ID to delete
         Returns:
             True if deleted, False if user doesn't exist
         """
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-
-            # Check if user exists
-            if not self.user_exists(user_id):
-                return False
+        with self._transaction() as cursor:
+            cursor.execute(
+                "SELECT thread_id FROM threads WHERE user_id = ?", (user_id,)
+            )
+            thread_ids = [row[0] for row in cursor.fetchall()]
 
-            # Delete associated threads first
+            # Delete thread history and threads first
+            cursor.execute("DELETE FROM thread_history WHERE user_id = ?", (user_id,))
             cursor.execute("DELETE FROM threads WHERE user_id = ?", (user_id,))
 
             # Delete user
             cursor.execute("DELETE FROM users WHERE user_id = ?", (user_id,))
+            deleted = cursor.rowcount > 0
 
-            conn.commit()
-            return True
+        # Checkpoints and memories live in other databases, outside the transaction
+        if self.checkpointer is not None:
+            for thread_id in thread_ids:
+                self.checkpointer.delete_thread(
+                    checkpoint_thread_id(user_id, thread_id)
+                )
+        if self.store is not None:
+            # Imported here, as it pulls in the memory index
+            from memory_compaction import delete_memories
+
+            delete_memories(self.store, ("user_memories", user_id))
+        return deleted
 
     def delete_thread(self, thread_id: str, user_id: str) -> bool:
         """
-        Delete a thread and all its history for a specific user.
+        Delete a thread and all its history for a specific user, atomically.
+        The thread's checkpoints are deleted afterwards, when a checkpointer is set.
         Args:
             thread_id: The thread ID to delete
             user_id: The user ID
         Returns:
             True if deleted, False if thread doesn't exist
         """
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-
+        with self._transaction() as cursor:
             # Delete thread history first
             cursor.execute(
                 """
-                DELETE FROM thread_history 
+                DELETE FROM thread_history
                 WHERE thread_id = ? AND user_id = ?
             """,
                 (thread_id, user_id),
@@ -231,14 +308,17 @@ class IDManager:
             # Delete thread
             cursor.execute(
                 """
-                DELETE FROM threads 
+                DELETE FROM threads
                 WHERE thread_id = ? AND user_id = ?
             """,
                 (thread_id, user_id),
             )
             deleted = cursor.rowcount > 0
-            conn.commit()
-            return deleted
+
+        # Checkpoints live in another database, outside the transaction
+        if self.checkpointer is not None:
+            self.checkpointer.delete_thread(checkpoint_thread_id(user_id, thread_id))
+        return deleted
 
     def get_thread_info(
         self, thread_id: str, user_id: str
@@ -247,12 +327,11 @@ class IDManager:
         Get thread information for a specific user.
         Returns: (thread_id, user_id) or None if not found
         """
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
+        with self._connection() as conn:
+            cursor = conn.execute(
                 """
-                SELECT thread_id, user_id 
-                FROM threads 
+                SELECT thread_id, user_id
+                FROM threads
                 WHERE thread_id = ? AND user_id = ?
             """,
                 (thread_id, user_id),
@@ -264,9 +343,10 @@ class IDManager:
         Get user information.
         Returns: user_id or None if not found
         """
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT user_id FROM users WHERE user_id = ?", (user_id,))
+        with self._connection() as conn:
+            cursor = conn.execute(
+                "SELECT user_id FROM users WHERE user_id = ?", (user_id,)
+            )
             result = cursor.fetchone()
             return result[0] if result else None
 
@@ -283,34 +363,34 @@ class IDManager:
         Returns:
             True if added successfully, False if thread doesn't exist
         """
-        if not self.thread_exists(thread_id, user_id):
-            return False
-
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-
-            # Get the next order number for this thread and user
-            cursor.execute(
-                """
-                SELECT COALESCE(MAX(entry_order), 0) + 1 
-                FROM thread_history 
-                WHERE thread_id = ? AND user_id = ?
-            """,
-                (thread_id, user_id),
-            )
-            next_order = cursor.fetchone()[0]
-
-            # Insert the new entry
+        with self._transaction() as cursor:
+            # Check the thread and take the next order number in the same statement,
+            # under the write lock, so concurrent appends cannot race for an order
             cursor.execute(
                 """
                 INSERT INTO thread_history (thread_id, user_id, user_query, analyst_response, entry_order)
-                VALUES (?, ?, ?, ?, ?)
+                SELECT ?, ?, ?, ?, (
+                    SELECT COALESCE(MAX(entry_order), 0) + 1
+                    FROM thread_history
+                    WHERE thread_id = ? AND user_id = ?
+                )
+                WHERE EXISTS (
+                    SELECT 1 FROM threads
+                    WHERE thread_id = ? AND user_id = ?
+                )
             """,
-                (thread_id, user_id, user_query, analyst_response, next_order),
+                (
+                    thread_id,
+                    user_id,
+                    user_query,
+                    analyst_response,
+                    thread_id,
+                    user_id,
+                    thread_id,
+                    user_id,
+                ),
             )
-
-            conn.commit()
-            return True
+            return cursor.rowcount > 0
 
     def get_thread_history(
         self, thread_id: str, user_id: str
@@ -323,9 +403,8 @@ class IDManager:
         Returns:
             List of tuples (user_query, analyst_response, entry_order)
         """
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
+        with self._connection() as conn:
+            cursor = conn.execute(
                 """
                 SELECT user_query, analyst_response, entry_order
                 FROM thread_history
@@ -336,6 +415,66 @@ class IDManager:
             )
             return cursor.fetchall()
 
+    def get_thread_history_page(
+        self,
+        thread_id: str,
+        user_id: str,
+        limit: int,
+        before_order: Optional[int] = None,
+    ) -> List[Tuple[str, str, int]]:
+        """
+        Get the latest history entries of a thread before a given entry, paginating
+        on entry_order so that every page is a bounded index range scan.
+        Args:
+            thread_id: The thread ID
+            user_id: The user ID
+            limit: The maximum number of entries to return
+            before_order: Only return entries older than this entry_order (None for the latest)
+        Returns:
+            List of tuples (user_query, analyst_response, entry_order), oldest first
+        """
+        with self._connection() as conn:
+            cursor = conn.execute(
+                """
+                SELECT user_query, analyst_response, entry_order
+                FROM thread_history
+                WHERE user_id = ? AND thread_id = ? AND entry_order < ?
+                ORDER BY entry_order DESC
+                LIMIT ?
+            """,
+                (
+                    user_id,
+                    thread_id,
+                    before_order if before_order is not None else 2**63 - 1,
+                    limit,
+                ),
+            )
+            return cursor.fetchall()[::-1]
+
+    def get_thread_entries_after(
+        self, thread_id: str, user_id: str, after_order: int
+    ) -> List[Tuple[str, str, int]]:
+        """
+        Get the history entries of a thread newer than a given entry.
+        Args:
+            thread_id: The thread ID
+            user_id: The user ID
+            after_order: Only return entries newer than this entry_order
+        Returns:
+            List of tuples (user_query, analyst_response, entry_order), oldest first
+        """
+        with self._connection() as conn:
+            cursor = conn.execute(
+                """
+                SELECT user_query, analyst_response, entry_order
+                FROM thread_history
+                WHERE user_id = ? AND thread_id = ? AND entry_order > ?
+                ORDER BY entry_order ASC
+            """,
+                (user_id, thread_id, after_order),
+            )
+            return cursor.fetchall()
+
     def get_thread_entry_count(self, thread_id: str, user_id: str) -> int:
         """
         Get the number of entries in a thread's history for a specific user.
@@ -345,11 +484,10 @@ class IDManager:
         Returns:
             Number of entries
         """
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
+        with self._connection() as conn:
+            cursor = conn.execute(
                 """
-                SELECT COUNT(*) FROM thread_history 
+                SELECT COUNT(*) FROM thread_history
                 WHERE thread_id = ? AND user_id = ?
             """,
                 (thread_id, user_id),
@@ -365,17 +503,22 @@ class IDManager:
         Returns:
             True if cleared, False if thread doesn't exist
         """
-        if not self.thread_exists(thread_id, user_id):
-            return False
+        with self._transaction() as cursor:
+            cursor.execute(
+                """
+                SELECT 1 FROM threads
+                WHERE thread_id = ? AND user_id = ?
+            """,
+                (thread_id, user_id),
+            )
+            if cursor.fetchone() is None:
+                return False
 
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
             cursor.execute(
                 """
-                DELETE FROM thread_history 
+                DELETE FROM thread_history
                 WHERE thread_id = ? AND user_id = ?
             """,
                 (thread_id, user_id),
             )
-            conn.commit()
             return True
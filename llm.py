@@ -1,12 +1,84 @@
+import os
+
 from langchain_openai import ChatOpenAI
 from dotenv import load_dotenv
 
-from app.const import LLM_MODEL_NAME, LLM_TEMPERATURE, LLM_TOP_P
+from app.const import (
+    LLM_MODEL_NAME,
+    LLM_TEMPERATURE,
+    LLM_TOP_P,
+    LLM_REQUEST_TIMEOUT_SECONDS,
+    LLM_MAX_RETRIES,
+    LLM_CACHE_ENABLED,
+    LLM_CACHE_DB_FILE_PATH,
+    LLM_CACHE_TTL_SECONDS,
+    LLM_CACHE_MAX_ENTRIES,
+    DEFAULT_LLM_BACKEND,
+    LLM_CASSETTE_FILE_PATH,
+    FAKE_LLM_LATENCY_SECONDS,
+)
+from llm_cache import SQLiteLLMCache
+from llm_cassette import CassetteChatModel
+from fake_llm import ScriptedChatModel
 
 load_dotenv()
 
-llm = ChatOpenAI(
-    model=LLM_MODEL_NAME,
-    temperature=LLM_TEMPERATURE,
-    top_p=LLM_TOP_P,
+llm_backend = os.getenv("LLM_BACKEND", DEFAULT_LLM_BACKEND)
+
+# The cache would hide calls from a recording, and is not needed offline
+llm_cache = (
+    SQLiteLLMCache(
+        LLM_CACHE_DB_FILE_PATH,
+        ttl_seconds=LLM_CACHE_TTL_SECONDS,
+        max_entries=LLM_CACHE_MAX_ENTRIES,
+    )
+    if LLM_CACHE_ENABLED and llm_backend == "openai"
+    else None
 )
+
+
+def create_openai_llm(**kwargs) -> ChatOpenAI:
+    return ChatOpenAI(
+        model=LLM_MODEL_NAME,
+        temperature=LLM_TEMPERATURE,
+        top_p=LLM_TOP_P,
+        timeout=LLM_REQUEST_TIMEOUT_SECONDS,
+        max_retries=LLM_MAX_RETRIES,
+        cache=llm_cache,
+        **kwargs,
+    )
+
+
+def create_llm(backend: str):
+    """
+    Create the chat model of a backend.
+    Args:
+        backend (str): "openai", "fake" (scripted, offline), "record" (openai, with every
+            exchange saved to the cassette) or "replay" (from the cassette, offline).
+    Returns:
+        BaseChatModel: The chat model.
+    """
+    cassette_path = os.getenv("LLM_CASSETTE_FILE", LLM_CASSETTE_FILE_PATH)
+
+    if backend == "fake":
+        latency_seconds = float(
+            os.getenv("FAKE_LLM_LATENCY_SECONDS", FAKE_LLM_LATENCY_SECONDS)
+        )
+        return ScriptedChatModel(latency_seconds=latency_seconds)
+    if backend == "replay":
+        # The model only formats the requests and parses the responses, it is never
+        # called, so no API key is needed
+        openai_llm = create_openai_llm(api_key=os.getenv("OPENAI_API_KEY") or "replay")
+        return CassetteChatModel(
+            cassette_path=cassette_path, model=openai_llm, replay=True
+        )
+
+    openai_llm = create_openai_llm()
+    if backend == "record":
+        return CassetteChatModel(cassette_path=cassette_path, model=openai_llm)
+    if backend != "openai":
+        raise ValueError(f"Unknown LLM backend: {backend}")
+    return openai_llm
+
+
+llm = create_llm(llm_backend)
@@ -0,0 +1,183 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import warnings
+from typing import Any, Dict, Optional, Sequence
+
+from langchain_core.caches import BaseCache, RETURN_VAL_TYPE
+from langchain_core.load import dumps, loads
+from langchain_core._api import LangChainBetaWarning
+
+# Per-call fields of serialized messages that never change the model's answer
+VOLATILE_MESSAGE_FIELDS = ("id", "response_metadata", "usage_metadata")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Normalize a serialized message list so that equivalent conversations share a key:
+    drop per-call message fields (ids, response metadata, token usage) and sort keys.
+    Args:
+        prompt (str): The prompt as serialized by LangChain (dumps of the messages).
+    Returns:
+        str: The normalized prompt, or the prompt itself if it is not JSON.
+    """
+    try:
+        messages = json.loads(prompt)
+    except ValueError:
+        return prompt
+
+    if isinstance(messages, list):
+        for message in messages:
+            kwargs = message.get("kwargs") if isinstance(message, dict) else None
+            if isinstance(kwargs, dict):
+                for field in VOLATILE_MESSAGE_FIELDS:
+                    kwargs.pop(field, None)
+    return json.dumps(messages, sort_keys=True)
+
+
+def hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class SQLiteLLMCache(BaseCache):
+    """
+    A persistent LLM response cache in SQLite, keyed on the normalized message list and
+    the LLM string (model name, parameters, bound tools and structured-output schema).
+    Entries expire after ttl_seconds, and the least recently used entries are evicted
+    beyond max_entries.
+    """
+
+    def __init__(self, db_path: str, ttl_seconds: float, max_entries: int):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(
+            db_path, check_same_thread=False, isolation_level=None
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                prompt_hash TEXT NOT NULL,
+                llm_string_hash TEXT NOT NULL,
+                generations TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_accessed_at REAL NOT NULL,
+                PRIMARY KEY (prompt_hash, llm_string_hash)
+            )
+        """
+        )
+        self.conn.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_llm_cache_last_accessed_at
+            ON llm_cache (last_accessed_at)
+        """
+        )
+
+    def _count_entries(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+    def _key(self, prompt: str, llm_string: str):
+        return hash_text(normalize_prompt(prompt)), hash_text(llm_string)
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        key = self._key(prompt, llm_string)
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                """
+                SELECT generations, created_at FROM llm_cache
+                WHERE prompt_hash = ? AND llm_string_hash = ?
+            """,
+                key,
+            ).fetchone()
+
+            if row is not None and now - row[1] > self.ttl_seconds:
+                self.conn.execute(
+                    "DELETE FROM llm_cache WHERE prompt_hash = ? AND llm_string_hash = ?",
+                    key,
+                )
+                self.evictions += 1
+                row = None
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.conn.execute(
+                """
+                UPDATE llm_cache SET last_accessed_at = ?
+                WHERE prompt_hash = ? AND llm_string_hash = ?
+            """,
+                (now, *key),
+            )
+            self.hits += 1
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", LangChainBetaWarning)
+            return [loads(generation) for generation in json.loads(row[0])]
+
+    def update(
+        self, prompt: str, llm_string: str, return_val: Sequence[RETURN_VAL_TYPE]
+    ) -> None:
+        generations = []
+        for generation in return_val:
+            message = getattr(generation, "message", None)
+            if message is not None and message.id is not None:
+                # Let every cache hit get the id of the run that replays it
+                generation = generation.model_copy(
+                    update={"message": message.model_copy(update={"id": None})}
+                )
+            generations.append(dumps(generation))
+
+        key = self._key(prompt, llm_string)
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                """
+                INSERT OR REPLACE INTO llm_cache
+                (prompt_hash, llm_string_hash, generations, created_at, last_accessed_at)
+                VALUES (?, ?, ?, ?, ?)
+            """,
+                (*key, json.dumps(generations), now, now),
+            )
+
+            n_entries = self._count_entries()
+            if n_entries > self.max_entries:
+                cursor = self.conn.execute(
+                    """
+                    DELETE FROM llm_cache WHERE rowid IN (
+                        SELECT rowid FROM llm_cache
+                        ORDER BY last_accessed_at ASC
+                        LIMIT ?
+                    )
+                """,
+                    (n_entries - self.max_entries,),
+                )
+                self.evictions += cursor.rowcount
+
+    def clear(self, **kwargs: Any) -> None:
+        with self.lock:
+            self.conn.execute("DELETE FROM llm_cache")
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get the cache counters since startup and the current number of entries.
+        Returns:
+            Dict[str, int]: hits, misses, evictions and entries.
+        """
+        with self.lock:
+            n_entries = self._count_entries()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": n_entries,
+        }
@@ -0,0 +1,221 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, Iterator, List, Sequence
+
+from pydantic import BaseModel, PrivateAttr
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import (
+    AIMessage,
+    AIMessageChunk,
+    BaseMessage,
+    ToolMessage,
+    message_chunk_to_message,
+    message_to_dict,
+    messages_from_dict,
+)
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import RunnableBinding, RunnableSequence
+
+
+def message_chunk(message: BaseMessage) -> AIMessageChunk:
+    """A recorded response as one streamed chunk, tool calls included."""
+    return AIMessageChunk(
+        content=message.content,
+        additional_kwargs=message.additional_kwargs,
+        response_metadata=message.response_metadata,
+        usage_metadata=getattr(message, "usage_metadata", None),
+        id=message.id,
+        tool_call_chunks=[
+            {
+                "name": tool_call["name"],
+                "args": json.dumps(tool_call["args"]),
+                "id": tool_call["id"],
+                "index": i,
+            }
+            for i, tool_call in enumerate(getattr(message, "tool_calls", []))
+        ],
+    )
+
+
+def request_key(messages: List[BaseMessage], kwargs: dict) -> str:
+    """
+    Hash an LLM request: the messages and the bound tools and options. Message ids and
+    response metadata are left out, as they change from run to run.
+    Args:
+        messages (List[BaseMessage]): The messages sent.
+        kwargs (dict): The bound call options, e.g. tools and tool_choice.
+    Returns:
+        str: The hex digest identifying the request.
+    """
+    request = {
+        "messages": [
+            {
+                "type": message.type,
+                "content": message.content,
+                "tool_calls": (
+                    message.tool_calls if isinstance(message, AIMessage) else None
+                ),
+                "tool_call_id": (
+                    message.tool_call_id if isinstance(message, ToolMessage) else None
+                ),
+            }
+            for message in messages
+        ],
+        "kwargs": kwargs,
+    }
+    encoded = json.dumps(request, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class CassetteChatModel(BaseChatModel):
+    """
+    Record and replay LLM exchanges through a JSON-lines cassette file.
+
+    When recording, every request goes to the wrapped model and the response is
+    appended to the cassette. When replaying, responses are read back from the
+    cassette without network; a request that was never recorded raises a KeyError.
+    Requests made several times replay their recorded responses in order. Tools and
+    structured outputs are bound by the wrapped model, so that the requests and the
+    parsing are those of production (json_schema for ChatOpenAI), even in replay,
+    where the model is never called. Streamed calls are recorded too, and replayed as
+    one chunk.
+    """
+
+    cassette_path: str
+    model: BaseChatModel
+    replay: bool = False
+
+    _responses: Dict[str, List[dict]] = PrivateAttr(default_factory=dict)
+    _replay_counts: Dict[str, int] = PrivateAttr(default_factory=dict)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    def model_post_init(self, __context: Any) -> None:
+        if os.path.exists(self.cassette_path):
+            with open(self.cassette_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self._responses.setdefault(entry["key"], []).append(
+                        entry["message"]
+                    )
+        elif self.replay:
+            raise FileNotFoundError(f"No LLM cassette to replay: {self.cassette_path}")
+
+    @property
+    def _llm_type(self) -> str:
+        return "cassette"
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any):
+        # The wrapped model formats the tools and options; the call comes back here
+        return self.bind(**self.model.bind_tools(tools, **kwargs).kwargs)
+
+    def with_structured_output(self, schema: Any, **kwargs: Any):
+        """
+        Build the structured output runnable of the wrapped model, with its call to the
+        model replaced by a call through the cassette.
+        Args:
+            schema (Any): The output schema.
+            **kwargs: The options of the wrapped model's with_structured_output.
+        Returns:
+            Runnable: The model call, then the wrapped model's output parser.
+        """
+        structured = self.model.with_structured_output(schema, **kwargs)
+        if not isinstance(structured, RunnableSequence) or not isinstance(
+            structured.first, RunnableBinding
+        ):
+            raise NotImplementedError(
+                "Only structured outputs made of a model call and a parser are recorded"
+            )
+        binding = structured.first
+        return RunnableSequence(
+            RunnableBinding(bound=self, kwargs=binding.kwargs, config=binding.config),
+            *structured.steps[1:],
+        )
+
+    def _bound_model(self, kwargs: dict):
+        # Without the callbacks of the calling node: they already see this call, and
+        # would see every streamed chunk twice
+        return self.model.bind(**kwargs).with_config(callbacks=[])
+
+    def _record(self, key: str, message: BaseMessage) -> None:
+        message_dict = message_to_dict(message)
+        # Structured outputs parsed by the model are saved as plain values
+        parsed = message.additional_kwargs.get("parsed")
+        if isinstance(parsed, BaseModel):
+            message_dict["data"]["additional_kwargs"]["parsed"] = parsed.model_dump()
+        entry = {"key": key, "message": message_dict}
+        with self._lock:
+            self._responses.setdefault(key, []).append(entry["message"])
+            with open(self.cassette_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+
+    def _replay(self, key: str) -> BaseMessage:
+        with self._lock:
+            responses = self._responses.get(key)
+            if not responses:
+                raise KeyError(
+                    f"LLM request {key[:12]} is not in the cassette {self.cassette_path}; "
+                    "record it first"
+                )
+            count = self._replay_counts.get(key, 0)
+            self._replay_counts[key] = count + 1
+            # Past the recorded responses, the last one repeats
+            return messages_from_dict([responses[min(count, len(responses) - 1)]])[0]
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        key = request_key(messages, kwargs)
+        if self.replay:
+            message = self._replay(key)
+        else:
+            message = self._bound_model(kwargs).invoke(messages, stop=stop)
+            self._record(key, message)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        key = request_key(messages, kwargs)
+        if self.replay:
+            message = self._replay(key)
+        else:
+            message = await self._bound_model(kwargs).ainvoke(messages, stop=stop)
+            self._record(key, message)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(
+        self, messages, stop=None, run_manager=None, **kwargs: Any
+    ) -> Iterator[ChatGenerationChunk]:
+        key = request_key(messages, kwargs)
+        if self.replay:
+            chunks = [message_chunk(self._replay(key))]
+        else:
+            chunks = self._bound_model(kwargs).stream(messages, stop=stop)
+
+        response = None
+        for chunk in chunks:
+            response = chunk if response is None else response + chunk
+            generation_chunk = ChatGenerationChunk(message=chunk)
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text(), chunk=generation_chunk)
+            yield generation_chunk
+        if not self.replay and response is not None:
+            self._record(key, message_chunk_to_message(response))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        key = request_key(messages, kwargs)
+        if self.replay:
+            chunk = message_chunk(self._replay(key))
+            generation_chunk = ChatGenerationChunk(message=chunk)
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text(), chunk=generation_chunk)
+            yield generation_chunk
+            return
+
+        response = None
+        async for chunk in self._bound_model(kwargs).astream(messages, stop=stop):
+            response = chunk if response is None else response + chunk
+            generation_chunk = ChatGenerationChunk(message=chunk)
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text(), chunk=generation_chunk)
+            yield generation_chunk
+        if response is not None:
+            self._record(key, message_chunk_to_message(response))
@@ -0,0 +1,254 @@
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import shutil
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+
+from benchmarking import BENCHMARK_QUERIES, use_temporary_db_dir, latency_summary
+
+# The synthetic users get databases of their own, unless APP_DB_DIR is set: the lock
+# waits are those of the load alone, and a crash leaves nothing in the app's data
+temp_db_dir = use_temporary_db_dir(prefix="loadtest_")
+
+from app.const import (  # noqa: E402
+    APP_DB_DIR,
+    USERS_THREADS_DB_FILE_PATH,
+    LOADTEST_USERS,
+    LOADTEST_THREADS_PER_USER,
+    LOADTEST_TURNS,
+    LOADTEST_CONCURRENCY,
+    LOADTEST_LLM_LATENCY_SECONDS,
+)
+
+# Load test: create synthetic users and threads through IDManager, then run multi-turn
+# conversations concurrently against a scripted LLM with a fixed latency per call, the
+# way many UI sessions would. Reports throughput, tail latency, the time spent waiting
+# for the SQLite write lock, and errors. The synthetic users are deleted afterwards.
+parser = argparse.ArgumentParser(description="Load test the workflow.")
+parser.add_argument(
+    "--users", type=int, default=LOADTEST_USERS, help="Number of synthetic users."
+)
+parser.add_argument(
+    "--threads-per-user",
+    type=int,
+    default=LOADTEST_THREADS_PER_USER,
+    help="Number of conversations per user.",
+)
+parser.add_argument(
+    "--turns",
+    type=int,
+    default=LOADTEST_TURNS,
+    help="Number of queries per conversation.",
+)
+parser.add_argument(
+    "--concurrency",
+    type=int,
+    default=LOADTEST_CONCURRENCY,
+    help="Maximum number of conversations in flight.",
+)
+parser.add_argument(
+    "--mode",
+    choices=["thread", "async"],
+    default="thread",
+    help="Run the sync workflow from a thread pool, or the async workflow.",
+)
+parser.add_argument(
+    "--llm-latency",
+    type=float,
+    default=LOADTEST_LLM_LATENCY_SECONDS,
+    help="Seconds the scripted LLM waits per call.",
+)
+parser.add_argument("--seed", type=int, default=0, help="Seed of the conversations.")
+parser.add_argument("--output", help="Optional JSON file for the results.")
+parser.add_argument(
+    "--keep-users",
+    action="store_true",
+    help="Keep the synthetic users, threads and checkpoints, and their databases.",
+)
+args = parser.parse_args()
+
+# The LLM is created when the workflow is imported
+os.environ["LLM_BACKEND"] = "fake"
+os.environ["FAKE_LLM_LATENCY_SECONDS"] = str(args.llm_latency)
+
+from engine import process_user_query, process_user_query_async  # noqa: E402
+from data import Dataset  # noqa: E402
+from graph import checkpointer, store, close_async_workflow  # noqa: E402
+from id_manager import IDManager  # noqa: E402
+from memory_writer import memory_writer, start_memory_writer  # noqa: E402
+from tracing import start_tracing  # noqa: E402
+from sqlite_backend import lock_wait_stats  # noqa: E402
+
+
+def build_conversations(user_ids: list, rng: random.Random) -> list:
+    """One conversation per user thread, each a list of queries of random classes."""
+    queries = [
+        query for class_queries in BENCHMARK_QUERIES.values() for query in class_queries
+    ]
+    conversations = []
+    for user_id in user_ids:
+        for _ in range(args.threads_per_user):
+            thread_id = id_manager.generate_unique_thread_id(user_id, prefix="load")
+            id_manager.create_thread_id(thread_id, user_id)
+            conversations.append(
+                (user_id, thread_id, [rng.choice(queries) for _ in range(args.turns)])
+            )
+    return conversations
+
+
+def record_turn(start: float, error: Exception = None) -> None:
+    latencies.append(time.perf_counter() - start)
+    if error is not None:
+        errors[f"{type(error).__name__}: {str(error)[:100]}"] += 1
+
+
+def run_conversation(user_id: str, thread_id: str, queries: list) -> None:
+    for turn, user_query in enumerate(queries):
+        start = time.perf_counter()
+        try:
+            result = process_user_query(user_query, user_id, thread_id, turn > 0)
+            id_manager.add_thread_entry(
+                thread_id, user_id, user_query, result["response"]
+            )
+        except Exception as e:
+            record_turn(start, e)
+        else:
+            record_turn(start)
+
+
+async def run_conversation_async(
+    semaphore: asyncio.Semaphore, user_id: str, thread_id: str, queries: list
+) -> None:
+    async with semaphore:
+        for turn, user_query in enumerate(queries):
+            start = time.perf_counter()
+            try:
+                result = await process_user_query_async(
+                    user_query, user_id, thread_id, turn > 0
+                )
+                await asyncio.to_thread(
+                    id_manager.add_thread_entry,
+                    thread_id,
+                    user_id,
+                    user_query,
+                    result["response"],
+                )
+            except Exception as e:
+                record_turn(start, e)
+            else:
+                record_turn(start)
+
+
+async def run_all_async(conversations: list) -> None:
+    semaphore = asyncio.Semaphore(args.concurrency)
+    try:
+        await asyncio.gather(
+            *(
+                run_conversation_async(semaphore, *conversation)
+                for conversation in conversations
+            )
+        )
+    finally:
+        # The async workflow's connections belong to this loop, which ends here
+        await close_async_workflow()
+
+
+try:
+    # Memories are saved in the background and queries traced if enabled, as in the app
+    start_memory_writer()
+    start_tracing()
+    id_manager = IDManager(
+        USERS_THREADS_DB_FILE_PATH, checkpointer=checkpointer, store=store
+    )
+    user_ids = []
+    latencies = []
+    errors = Counter()
+
+    try:
+        for _ in range(args.users):
+            user_ids.append(id_manager.generate_unique_user_id(prefix="load"))
+            id_manager.create_user_id(user_ids[-1])
+        conversations = build_conversations(user_ids, random.Random(args.seed))
+
+        print(
+            f"Running {len(conversations)} conversations of {args.turns} turns "
+            f"({args.mode}, concurrency {args.concurrency}, "
+            f"LLM latency {args.llm_latency}s)..."
+        )
+        # Load the shared dataset before the clock starts
+        Dataset()
+        lock_wait_stats.reset()
+        # The workflow prints every message; interleaved across sessions it is noise
+        with redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            if args.mode == "thread":
+                with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+                    for future in [
+                        executor.submit(run_conversation, *conversation)
+                        for conversation in conversations
+                    ]:
+                        future.result()
+            else:
+                asyncio.run(run_all_async(conversations))
+            duration = time.perf_counter() - start
+        lock_wait = lock_wait_stats.snapshot()
+    finally:
+        if memory_writer is not None:
+            memory_writer.flush()
+        if args.keep_users:
+            print(f"Synthetic users kept in the databases of {APP_DB_DIR}")
+        else:
+            for user_id in user_ids:
+                id_manager.delete_user(user_id)
+            if temp_db_dir is not None:
+                shutil.rmtree(temp_db_dir, ignore_errors=True)
+
+    results = {
+        "mode": args.mode,
+        "users": args.users,
+        "conversations": len(conversations),
+        "turns": args.turns,
+        "concurrency": args.concurrency,
+        "llm_latency_seconds": args.llm_latency,
+        "queries": len(latencies),
+        "duration_seconds": round(duration, 2),
+        "throughput_qps": round(len(latencies) / duration, 2),
+        "latency_ms": latency_summary(latencies),
+        "lock_wait": {
+            "transactions": lock_wait["transactions"],
+            "total_ms": round(lock_wait["total_seconds"] * 1000, 2),
+            "max_ms": round(lock_wait["max_seconds"] * 1000, 2),
+        },
+        "errors": dict(errors),
+    }
+
+    latency = results["latency_ms"]
+    print(
+        f"{results['queries']} queries in {results['duration_seconds']}s: "
+        f"{results['throughput_qps']} queries/s"
+    )
+    print(
+        f"Latency: p50 {latency['p50']} ms, p95 {latency['p95']} ms, "
+        f"p99 {latency['p99']} ms, max {latency['max']} ms"
+    )
+    print(
+        f"Lock wait: {results['lock_wait']['total_ms']} ms over "
+        f"{results['lock_wait']['transactions']} write transactions "
+        f"(max {results['lock_wait']['max_ms']} ms)"
+    )
+    print(f"Errors: {sum(errors.values())}")
+    for error, count in errors.most_common():
+        print(f"  {count} x {error}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Results written to {args.output}")
+except Exception as e:
+    print(f"Error running the load test: {e}")
@@ -0,0 +1,104 @@
+import argparse
+
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.store.sqlite import SqliteStore
+
+from app.const import (
+    CHECKPOINTER_DB_FILE_PATH,
+    STORE_DB_FILE_PATH,
+    USERS_THREADS_DB_FILE_PATH,
+    CHECKPOINTS_KEEP_PER_THREAD,
+)
+from id_manager import IDManager
+from sqlite_backend import connect_sqlite
+from checkpoint_maintenance import (
+    prune_checkpoints,
+    find_orphaned_threads,
+    find_orphaned_users,
+    delete_threads,
+    delete_user_memories,
+    vacuum,
+)
+from memory_compaction import sync_memory_index
+
+# Database maintenance: keep only the latest checkpoints of every thread, delete the
+# checkpoints and memories of threads and users that no longer exist, bring the memory
+# index in line with the stored memories, then VACUUM and report the reclaimed space.
+# Unlike cleanup.py, users, threads and their latest state are kept. Safe to schedule
+# while the app runs (it waits for the app's writes).
+parser = argparse.ArgumentParser(description="Prune and compact the app databases.")
+parser.add_argument(
+    "--keep-checkpoints",
+    type=int,
+    default=CHECKPOINTS_KEEP_PER_THREAD,
+    help="Number of latest checkpoints kept per thread.",
+)
+parser.add_argument(
+    "--keep-orphans",
+    action="store_true",
+    help="Keep the checkpoints and memories of deleted threads and users.",
+)
+parser.add_argument(
+    "--dry-run", action="store_true", help="Report without deleting anything."
+)
+parser.add_argument(
+    "--no-vacuum", action="store_true", help="Skip the VACUUM of the databases."
+)
+args = parser.parse_args()
+
+
+def format_size(n_bytes: int) -> str:
+    return f"{n_bytes / (1024 * 1024):.2f} MB"
+
+
+try:
+    id_manager = IDManager(USERS_THREADS_DB_FILE_PATH)
+
+    checkpointer_conn = connect_sqlite(CHECKPOINTER_DB_FILE_PATH)
+    checkpointer = SqliteSaver(checkpointer_conn)
+    checkpointer.setup()
+
+    store_conn = connect_sqlite(STORE_DB_FILE_PATH)
+    store = SqliteStore(store_conn)
+    store.setup()
+
+    action = "Would remove" if args.dry_run else "Removed"
+
+    if not args.keep_orphans:
+        orphaned_threads = find_orphaned_threads(checkpointer_conn, id_manager)
+        orphaned_users = find_orphaned_users(store, id_manager)
+        if not args.dry_run:
+            delete_threads(checkpointer, orphaned_threads)
+            delete_user_memories(store, orphaned_users)
+        print(
+            f"{action} the checkpoints of {len(orphaned_threads)} deleted threads "
+            f"and the memories of {len(orphaned_users)} deleted users"
+        )
+
+    n_indexed, n_dropped = sync_memory_index(store, dry_run=args.dry_run)
+    print(
+        f"{'Would index' if args.dry_run else 'Indexed'} {n_indexed} memories missing "
+        f"from the memory index, {action.lower()} {n_dropped} stale entries"
+    )
+
+    n_checkpoints, n_writes = prune_checkpoints(
+        checkpointer_conn, args.keep_checkpoints, dry_run=args.dry_run
+    )
+    print(
+        f"{action} {n_checkpoints} old checkpoints and {n_writes} pending writes "
+        f"(keeping the latest {args.keep_checkpoints} per thread)"
+    )
+
+    if not args.dry_run and not args.no_vacuum:
+        total_before, total_after = 0, 0
+        for name, conn, path in [
+            ("Checkpointer", checkpointer_conn, CHECKPOINTER_DB_FILE_PATH),
+            ("Store", store_conn, STORE_DB_FILE_PATH),
+        ]:
+            size_before, size_after = vacuum(conn, path)
+            total_before += size_before
+            total_after += size_after
+            print(f"{name}: {format_size(size_before)} -> {format_size(size_after)}")
+        print(f"Reclaimed {format_size(total_before - total_after)}")
+except Exception as e:
+    print(f"Error running maintenance: {e}")
@@ -0,0 +1,232 @@
+import json
+import math
+import re
+from typing import Dict, List, Tuple
+
+from langgraph.store.base import BaseStore
+
+from memory_index import (
+    MEMORY_NAMESPACE_PREFIX,
+    embed_text,
+    memory_embedding,
+    memory_value,
+    put_memory,
+    user_memory_index,
+)
+
+PAGE_SIZE = 100
+
+
+def cosine_similarity(a: Dict[int, float], b: Dict[int, float]) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    dot = sum(weight * b[feature] for feature, weight in a.items() if feature in b)
+    norm_a = math.sqrt(sum(weight**2 for weight in a.values()))
+    norm_b = math.sqrt(sum(weight**2 for weight in b.values()))
+    return dot / max(norm_a * norm_b, 1e-12)
+
+
+def list_memory_namespaces(store: BaseStore) -> List[tuple]:
+    namespaces, offset = [], 0
+    while True:
+        page = store.list_namespaces(
+            prefix=MEMORY_NAMESPACE_PREFIX, limit=PAGE_SIZE, offset=offset
+        )
+        namespaces.extend(page)
+        if len(page) < PAGE_SIZE:
+            return namespaces
+        offset += PAGE_SIZE
+
+
+def list_memories(store: BaseStore, namespace: tuple) -> list:
+    memories, offset = [], 0
+    while True:
+        page = store.search(namespace, limit=PAGE_SIZE, offset=offset)
+        memories.extend(page)
+        if len(page) < PAGE_SIZE:
+            # search matches namespace prefixes, keep this namespace only
+            return [m for m in memories if tuple(m.namespace) == namespace]
+        offset += PAGE_SIZE
+
+
+def delete_memories(store: BaseStore, namespace: tuple) -> int:
+    """
+    Delete every memory of one namespace.
+    Returns:
+        int: The number of memories deleted.
+    """
+    memories = list_memories(store, namespace)
+    for memory in memories:
+        store.delete(namespace, memory.key)
+    user_memory_index.remove_user(namespace[-1])
+    return len(memories)
+
+
+def plan_compaction(memories: list, similarity_threshold: float) -> List[list]:
+    """
+    Cluster near-duplicate memories and decide which ones to keep.
+    Memories are visited newest first; each joins the first cluster whose newest
+    memory is at least similarity_threshold similar to it, or starts a new cluster.
+    Args:
+        memories (list): The store items of one user's memories.
+        similarity_threshold (float): The cosine similarity above which two memories
+            are near-duplicates.
+    Returns:
+        List[list]: The clusters, newest first, each newest memory first.
+    """
+    memories = sorted(memories, key=lambda m: m.updated_at, reverse=True)
+    clusters, representatives = [], []
+    for memory in memories:
+        embedding = memory_embedding(memory.value)
+        for cluster, representative in zip(clusters, representatives):
+            if cosine_similarity(embedding, representative) >= similarity_threshold:
+                cluster.append(memory)
+                break
+        else:
+            clusters.append([memory])
+            representatives.append(embedding)
+    return clusters
+
+
+def split_sentences(text: str) -> List[str]:
+    return [
+        sentence for sentence in re.split(r"(?<=[.!?])\s+", text.strip()) if sentence
+    ]
+
+
+def merge_cluster(cluster: list, similarity_threshold: float) -> str:
+    """
+    Merge a cluster of near-duplicate memories into one text: the sentences of the
+    newest memory, then those of the older ones that no sentence kept before already
+    says, newest first. Nothing is reconciled, so the latest statement of a fact comes
+    first but an older, contradicting one stays.
+    Args:
+        cluster (list): The store items of the cluster, newest first.
+        similarity_threshold (float): The cosine similarity above which two sentences
+            say the same thing.
+    Returns:
+        str: The merged memory text.
+    """
+    sentences, embeddings = [], []
+    for memory in cluster:
+        for sentence in split_sentences(memory.value["content"]):
+            embedding = embed_text(sentence)
+            if any(
+                cosine_similarity(embedding, other) >= similarity_threshold
+                for other in embeddings
+            ):
+                continue
+            sentences.append(sentence)
+            embeddings.append(embedding)
+    return " ".join(sentences)
+
+
+def compact_user_memories(
+    store: BaseStore,
+    namespace: tuple,
+    similarity_threshold: float,
+    max_memories: int,
+    dry_run: bool = False,
+) -> dict:
+    """
+    Merge near-duplicates and cap the memories of one user. Each cluster of
+    near-duplicates is merged into its newest memory (merge_cluster), which is
+    rewritten before the older ones are deleted, and only the max_memories newest
+    clusters are kept.
+    Args:
+        store (BaseStore): The store holding the memories.
+        namespace (tuple): The user's memory namespace.
+        similarity_threshold (float): The near-duplicate cosine similarity threshold.
+        max_memories (int): The maximum number of memories to keep.
+        dry_run (bool): Report what would be deleted without deleting it.
+    Returns:
+        dict: The numbers of memories before and after, duplicates merged, memories
+        rewritten with merged content, capped memories removed, and the net bytes of
+        memory values removed.
+    """
+    memories = list_memories(store, namespace)
+    clusters = plan_compaction(memories, similarity_threshold)
+
+    duplicates = [memory for cluster in clusters for memory in cluster[1:]]
+    capped = [cluster[0] for cluster in clusters[max_memories:]]
+    to_delete = duplicates + capped
+    merged = {}
+    for cluster in clusters[:max_memories]:
+        if len(cluster) > 1:
+            content = merge_cluster(cluster, similarity_threshold)
+            if content != cluster[0].value["content"]:
+                merged[cluster[0].key] = (cluster[0], content)
+
+    if not dry_run:
+        # Merged first: if interrupted, duplicates are left rather than facts lost
+        for memory_key, (_, content) in merged.items():
+            put_memory(store, namespace[-1], content, memory_key=memory_key)
+        for memory in to_delete:
+            store.delete(namespace, memory.key)
+        user_memory_index.remove(namespace[-1], [m.key for m in to_delete])
+
+    bytes_added = sum(
+        len(json.dumps(memory_value(content))) - len(json.dumps(memory.value))
+        for memory, content in merged.values()
+    )
+    return {
+        "memories_before": len(memories),
+        "memories_after": len(memories) - len(to_delete),
+        "duplicates_merged": len(duplicates),
+        "memories_rewritten": len(merged),
+        "capped_removed": len(capped),
+        "bytes_removed": sum(len(json.dumps(m.value)) for m in to_delete) - bytes_added,
+    }
+
+
+def compact_memories(
+    store: BaseStore,
+    similarity_threshold: float,
+    max_memories: int,
+    dry_run: bool = False,
+) -> Dict[str, dict]:
+    """
+    Run compact_user_memories over every user.
+    Returns:
+        Dict[str, dict]: The report of each user with memories, by user id.
+    """
+    return {
+        namespace[-1]: compact_user_memories(
+            store, namespace, similarity_threshold, max_memories, dry_run
+        )
+        for namespace in list_memory_namespaces(store)
+    }
+
+
+def sync_memory_index(store: BaseStore, dry_run: bool = False) -> Tuple[int, int]:
+    """
+    Index the memories the memory index is missing (e.g. saved before it existed) and
+    drop the ones it holds that are no longer in the store.
+    Returns:
+        Tuple[int, int]: The numbers of memories indexed and dropped.
+    """
+    n_indexed, n_dropped = 0, 0
+    user_ids = set(user_memory_index.indexed_users())
+    for namespace in list_memory_namespaces(store):
+        user_id = namespace[-1]
+        user_ids.discard(user_id)
+        memories = list_memories(store, namespace)
+        indexed_keys = set(user_memory_index.indexed_keys(user_id))
+        for memory in memories:
+            if memory.key not in indexed_keys:
+                n_indexed += 1
+                if not dry_run:
+                    user_memory_index.add(
+                        user_id, memory.key, memory_embedding(memory.value)
+                    )
+        stale_keys = indexed_keys - {memory.key for memory in memories}
+        n_dropped += len(stale_keys)
+        if not dry_run:
+            user_memory_index.remove(user_id, list(stale_keys))
+
+    # Users with indexed memories but none left in the store
+    for user_id in user_ids:
+        n_dropped += len(user_memory_index.indexed_keys(user_id))
+        if not dry_run:
+            user_memory_index.remove_user(user_id)
+    return n_indexed, n_dropped
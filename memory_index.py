@@ -0,0 +1,418 @@
+import asyncio
+import math
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from langgraph.store.base import BaseStore, GetOp
+
+from text_index import tokenize
+from vector_index import hash_token
+from prompt import estimate_tokens
+from sqlite_backend import ThreadLocalConnection, begin_immediate
+from app.const import (
+    STORE_DB_FILE_PATH,
+    MEMORY_EMBEDDING_N_FEATURES,
+    MEMORY_SEARCH_MAX_CANDIDATES,
+)
+
+MEMORY_NAMESPACE_PREFIX = ("user_memories",)
+
+
+def embed_text(text: Optional[str]) -> Dict[int, float]:
+    """
+    Embed a text as a sparse vector of hashed, log-scaled term frequencies. Local and
+    stateless, so memories can be embedded at write time in any process.
+    Args:
+        text (Optional[str]): The text to embed.
+    Returns:
+        Dict[int, float]: The weight of every non-zero hashed feature.
+    """
+    counts = {}
+    for token in tokenize(text):
+        feature, _ = hash_token(token, MEMORY_EMBEDDING_N_FEATURES)
+        counts[feature] = counts.get(feature, 0) + 1
+    return {feature: 1.0 + math.log(count) for feature, count in counts.items()}
+
+
+def memory_value(content: str) -> dict:
+    """
+    Build the store value of a memory, embedded at write time.
+    Args:
+        content (str): The memory text.
+    Returns:
+        dict: The value, with the content and its sparse embedding.
+    """
+    embedding = embed_text(content)
+    return {
+        "content": content,
+        "embedding": {
+            "features": list(embedding.keys()),
+            "weights": [round(weight, 4) for weight in embedding.values()],
+        },
+    }
+
+
+def memory_embedding(value: dict) -> Dict[int, float]:
+    if "embedding" not in value:
+        # Memories saved before they were embedded
+        return embed_text(value["content"])
+    return dict(zip(value["embedding"]["features"], value["embedding"]["weights"]))
+
+
+def rank_memories(
+    memories: list,
+    query: str,
+    top_k: int,
+    token_budget: int,
+    doc_freqs: Optional[Dict[int, int]] = None,
+    n_memories: Optional[int] = None,
+) -> list:
+    """
+    Select the memories most similar to a query, within a prompt token budget.
+    Similarity is the cosine of TF-IDF vectors, with the IDF taken over the user's
+    memories, so words common to all of them (user, asked, prefers) weigh little.
+    Args:
+        memories (list): The store items of a user's memories.
+        query (str): The text to rank the memories against.
+        top_k (int): The maximum number of memories to return.
+        token_budget (int): The maximum estimated number of tokens of their contents.
+        doc_freqs (Optional[Dict[int, int]]): The number of the user's memories holding
+            each feature, when memories are only some of them; counted over memories
+            otherwise.
+        n_memories (Optional[int]): The number of the user's memories, with doc_freqs.
+    Returns:
+        list: The selected items, most similar first; ties go to the most recent.
+    """
+    if not memories:
+        return []
+
+    embeddings = [memory_embedding(m.value) for m in memories]
+    if doc_freqs is None:
+        doc_freqs = {}
+        for embedding in embeddings:
+            for feature in embedding:
+                doc_freqs[feature] = doc_freqs.get(feature, 0) + 1
+        n_memories = len(memories)
+
+    def idf(feature: int) -> float:
+        return math.log((1 + n_memories) / (1 + doc_freqs.get(feature, 0))) + 1
+
+    query_vector = {f: w * idf(f) for f, w in embed_text(query).items()}
+    scores = []
+    for embedding in embeddings:
+        norm = math.sqrt(sum((w * idf(f)) ** 2 for f, w in embedding.items()))
+        dot = sum(
+            w * idf(f) * query_vector[f]
+            for f, w in embedding.items()
+            if f in query_vector
+        )
+        scores.append(dot / max(norm, 1e-12))
+
+    order = sorted(
+        range(len(memories)),
+        key=lambda i: (scores[i], memories[i].updated_at),
+        reverse=True,
+    )
+
+    selected, used_tokens = [], 0
+    for i in order:
+        if len(selected) == top_k:
+            break
+        n_tokens = estimate_tokens(memories[i].value["content"])
+        if used_tokens + n_tokens > token_budget:
+            continue
+        selected.append(memories[i])
+        used_tokens += n_tokens
+    return selected
+
+
+class MemoryIndex(ThreadLocalConnection):
+    """
+    A persisted inverted index of the users' memories, next to them in the store
+    database: for each user and hashed term, the memories holding the term and its
+    weight. A search reads the postings of the query terms only, so it costs in the
+    number of memories sharing a term with the query, not in the number of memories.
+
+    put_memory and the deletes of memory_compaction keep it in sync. Memories deleted
+    behind its back are dropped when a search finds them missing, and sync_memory_index
+    (run by maintenance.py) indexes memories saved behind its back, e.g. before it existed.
+
+    Its tables are created on first use, so that importing it (through IDManager, in
+    the tooling scripts) leaves the database untouched.
+    """
+
+    def __init__(self, db_path: str):
+        self._init_connections(db_path)
+        self.setup_lock = threading.Lock()
+        self.is_setup = False
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        conn = ThreadLocalConnection.conn.fget(self)
+        if not self.is_setup:
+            self._setup(conn)
+        return conn
+
+    def _setup(self, conn: sqlite3.Connection) -> None:
+        with self.setup_lock:
+            if self.is_setup:
+                return
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS memory_index_docs (
+                    user_id TEXT NOT NULL,
+                    memory_key TEXT NOT NULL,
+                    norm REAL NOT NULL,
+                    PRIMARY KEY (user_id, memory_key)
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS memory_index_postings (
+                    user_id TEXT NOT NULL,
+                    feature INTEGER NOT NULL,
+                    memory_key TEXT NOT NULL,
+                    weight REAL NOT NULL,
+                    PRIMARY KEY (user_id, feature, memory_key)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS idx_memory_index_postings_key
+                ON memory_index_postings (user_id, memory_key);
+                """
+            )
+            self.is_setup = True
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        conn = self.conn
+        begin_immediate(conn)
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        else:
+            conn.commit()
+
+    def add(self, user_id: str, memory_key: str, embedding: Dict[int, float]) -> None:
+        """Index a memory, replacing its previous postings."""
+        with self._transaction() as conn:
+            self._delete(conn, user_id, [memory_key])
+            conn.execute(
+                "INSERT INTO memory_index_docs VALUES (?, ?, ?)",
+                (
+                    user_id,
+                    memory_key,
+                    math.sqrt(sum(w**2 for w in embedding.values())),
+                ),
+            )
+            conn.executemany(
+                "INSERT INTO memory_index_postings VALUES (?, ?, ?, ?)",
+                [(user_id, f, memory_key, w) for f, w in embedding.items()],
+            )
+
+    def remove(self, user_id: str, memory_keys: List[str]) -> None:
+        """Drop memories from the index."""
+        if memory_keys:
+            with self._transaction() as conn:
+                self._delete(conn, user_id, memory_keys)
+
+    def remove_user(self, user_id: str) -> None:
+        """Drop every memory of a user from the index."""
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM memory_index_docs WHERE user_id = ?", (user_id,))
+            conn.execute(
+                "DELETE FROM memory_index_postings WHERE user_id = ?", (user_id,)
+            )
+
+    def _delete(
+        self, conn: sqlite3.Connection, user_id: str, memory_keys: List[str]
+    ) -> None:
+        for table in ["memory_index_docs", "memory_index_postings"]:
+            conn.executemany(
+                f"DELETE FROM {table} WHERE user_id = ? AND memory_key = ?",
+                [(user_id, memory_key) for memory_key in memory_keys],
+            )
+
+    def indexed_keys(self, user_id: str) -> List[str]:
+        rows = self.conn.execute(
+            "SELECT memory_key FROM memory_index_docs WHERE user_id = ?", (user_id,)
+        ).fetchall()
+        return [memory_key for (memory_key,) in rows]
+
+    def indexed_users(self) -> List[str]:
+        rows = self.conn.execute(
+            "SELECT DISTINCT user_id FROM memory_index_docs"
+        ).fetchall()
+        return [user_id for (user_id,) in rows]
+
+    def doc_freqs(
+        self, user_id: str, features: Iterable[int]
+    ) -> Tuple[Dict[int, int], int]:
+        """
+        The document frequencies of features over a user's indexed memories.
+        Returns:
+            Tuple[Dict[int, int], int]: The number of memories holding each feature that
+            any holds, and the number of memories.
+        """
+        features = list(set(features))
+        (n_memories,) = self.conn.execute(
+            "SELECT COUNT(*) FROM memory_index_docs WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        if not features:
+            return {}, n_memories
+        rows = self.conn.execute(
+            "SELECT feature, COUNT(*) FROM memory_index_postings "
+            f"WHERE user_id = ? AND feature IN ({', '.join('?' * len(features))}) "
+            "GROUP BY feature",
+            (user_id, *features),
+        ).fetchall()
+        return dict(rows), n_memories
+
+    def candidate_keys(
+        self, user_id: str, query_embedding: Dict[int, float], limit: int
+    ) -> List[str]:
+        """
+        The memories sharing a term with a query, best first. They are ranked by the
+        TF-IDF dot product over the norm of their term frequencies, which only
+        approximates rank_memories, hence a limit well above the memories needed.
+        Args:
+            user_id (str): The user whose memories to search.
+            query_embedding (Dict[int, float]): The embedding of the query.
+            limit (int): The maximum number of keys.
+        Returns:
+            List[str]: The keys of the memories.
+        """
+        features = list(query_embedding)
+        if not features:
+            return []
+        (n_memories,) = self.conn.execute(
+            "SELECT COUNT(*) FROM memory_index_docs WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        rows = self.conn.execute(
+            "SELECT p.feature, p.memory_key, p.weight, d.norm "
+            "FROM memory_index_postings p JOIN memory_index_docs d "
+            "ON d.user_id = p.user_id AND d.memory_key = p.memory_key "
+            f"WHERE p.user_id = ? AND p.feature IN ({', '.join('?' * len(features))})",
+            (user_id, *features),
+        ).fetchall()
+
+        doc_freqs = {}
+        for feature, _, _, _ in rows:
+            doc_freqs[feature] = doc_freqs.get(feature, 0) + 1
+        scores = {}
+        for feature, memory_key, weight, norm in rows:
+            idf = math.log((1 + n_memories) / (1 + doc_freqs[feature])) + 1
+            scores[memory_key] = scores.get(memory_key, 0.0) + (
+                weight * query_embedding[feature] * idf**2 / max(norm, 1e-12)
+            )
+        return sorted(scores, key=scores.get, reverse=True)[:limit]
+
+
+# Shared by the app; the store database is only opened on first use
+user_memory_index = MemoryIndex(STORE_DB_FILE_PATH)
+
+
+def put_memory(
+    store: BaseStore, user_id: str, content: str, memory_key: Optional[str] = None
+) -> str:
+    """
+    Save a memory of a user and index it.
+    Args:
+        store (BaseStore): The store holding the memories.
+        user_id (str): The user the memory belongs to.
+        content (str): The memory text.
+        memory_key (Optional[str]): The key of a memory to overwrite; a new one if None.
+    Returns:
+        str: The key of the memory.
+    """
+    memory_key = memory_key or str(uuid.uuid4())
+    value = memory_value(content)
+    store.put((*MEMORY_NAMESPACE_PREFIX, user_id), memory_key, value, index=False)
+    user_memory_index.add(user_id, memory_key, memory_embedding(value))
+    return memory_key
+
+
+async def aput_memory(store: BaseStore, user_id: str, content: str) -> str:
+    """Async variant of put_memory."""
+    memory_key = str(uuid.uuid4())
+    value = memory_value(content)
+    await store.aput(
+        (*MEMORY_NAMESPACE_PREFIX, user_id), memory_key, value, index=False
+    )
+    await asyncio.to_thread(
+        user_memory_index.add, user_id, memory_key, memory_embedding(value)
+    )
+    return memory_key
+
+
+def merge_candidates(
+    namespace: tuple, user_id: str, keys: List[str], items: list, recent: list
+) -> list:
+    """
+    Merge the memories found through the index with the most recent ones, which are
+    the ones rank_memories picks when no memory shares a term with the query, and
+    drop the memories deleted since they were indexed from the index.
+    """
+    missing = [key for key, item in zip(keys, items) if item is None]
+    if missing:
+        user_memory_index.remove(user_id, missing)
+    memories = {item.key: item for item in items if item is not None}
+    # search matches namespace prefixes: "user1" would also return "user10"'s memories
+    for item in recent:
+        if tuple(item.namespace) == namespace:
+            memories.setdefault(item.key, item)
+    return list(memories.values())
+
+
+def search_memories(
+    store: BaseStore, user_id: str, query: str, top_k: int, token_budget: int
+) -> list:
+    """
+    Fetch the memories of a user most relevant to a query. Only the (at most
+    MEMORY_SEARCH_MAX_CANDIDATES) memories the index ranks best and the top_k most
+    recent ones are read and ranked; when more memories share a term with the query,
+    the preselection of the index may miss some of the best ones.
+    Args:
+        store (BaseStore): The store holding the memories.
+        user_id (str): The user whose memories to search.
+        query (str): The text to rank the memories against.
+        top_k (int): The maximum number of memories to return.
+        token_budget (int): The maximum estimated number of tokens of their contents.
+    Returns:
+        list: The selected store items, most similar first.
+    """
+    namespace = (*MEMORY_NAMESPACE_PREFIX, user_id)
+    keys = user_memory_index.candidate_keys(
+        user_id, embed_text(query), MEMORY_SEARCH_MAX_CANDIDATES
+    )
+    items = store.batch([GetOp(namespace, key) for key in keys]) if keys else []
+    recent = store.search(namespace, limit=top_k)
+    memories = merge_candidates(namespace, user_id, keys, items, recent)
+
+    features = {f for m in memories for f in memory_embedding(m.value)}
+    doc_freqs, n_memories = user_memory_index.doc_freqs(user_id, features)
+    return rank_memories(memories, query, top_k, token_budget, doc_freqs, n_memories)
+
+
+async def asearch_memories(
+    store: BaseStore, user_id: str, query: str, top_k: int, token_budget: int
+) -> list:
+    """Async variant of search_memories."""
+    namespace = (*MEMORY_NAMESPACE_PREFIX, user_id)
+    keys = await asyncio.to_thread(
+        user_memory_index.candidate_keys,
+        user_id,
+        embed_text(query),
+        MEMORY_SEARCH_MAX_CANDIDATES,
+    )
+    items = await store.abatch([GetOp(namespace, key) for key in keys]) if keys else []
+    recent = await store.asearch(namespace, limit=top_k)
+    memories = await asyncio.to_thread(
+        merge_candidates, namespace, user_id, keys, items, recent
+    )
+
+    features = {f for m in memories for f in memory_embedding(m.value)}
+    doc_freqs, n_memories = await asyncio.to_thread(
+        user_memory_index.doc_freqs, user_id, features
+    )
+    return rank_memories(memories, query, top_k, token_budget, doc_freqs, n_memories)
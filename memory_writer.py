@@ -0,0 +1,342 @@
+import queue
+import threading
+import time
+import uuid
+import zlib
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
+from langgraph.store.base import BaseStore
+
+from app.const import (
+    SAVE_MEMORY_PROMPT_FILE_PATH,
+    STORE_DB_FILE_PATH,
+    MEMORY_WRITER_ENABLED,
+    MEMORY_WRITER_N_WORKERS,
+    MEMORY_WRITER_MAX_QUEUE_SIZE,
+    MEMORY_WRITER_BATCH_SIZE,
+    MEMORY_WRITER_BATCH_WAIT_SECONDS,
+    MEMORY_WRITER_MAX_ATTEMPTS,
+    SAVE_MEMORY_TOP_K,
+    SAVE_MEMORY_TOKEN_BUDGET,
+)
+from prompt import read_prompt_file
+from llm import llm
+from memory_index import put_memory, search_memories
+from sqlite_backend import ThreadLocalSqliteStore
+
+# Pending save jobs, kept in the store until their memory has been written
+MEMORY_OUTBOX_NAMESPACE = ("memory_outbox",)
+OUTBOX_PAGE_SIZE = 100
+
+
+class MemorySummarySave(BaseModel):
+    reasoning: str = Field(
+        ..., description="Explain briefly why you decided to save or not save"
+    )
+    should_save: bool = Field(
+        ..., description="Whether this memory should be saved or not"
+    )
+    summary: str = Field(
+        ...,
+        description="A short, precise memory of the new user information (empty if should_save is false)",
+    )
+
+
+def format_past_memories(memories: list) -> str:
+    if not memories:
+        return "No relevant past memories."
+    return "\n".join([f"- {m.value['content']}" for m in memories])
+
+
+def build_save_memory_prompt(
+    user_query: str, final_response: str, memories: list
+) -> str:
+    return read_prompt_file(SAVE_MEMORY_PROMPT_FILE_PATH).format(
+        user_query=user_query,
+        analyst_response=final_response,
+        past_memories=format_past_memories(memories),
+    )
+
+
+class MemoryWriter:
+    """
+    Write-behind saving of user memories, off the user-facing critical path.
+
+    enqueue first records the job in a durable outbox in the store, then hands it to
+    a worker through a bounded queue. Workers drain their queue in batches, decide
+    what to save with one LLM call per job (the calls of a round run concurrently
+    through llm.batch), write the memories, and only then delete the jobs from the
+    outbox. Jobs left in the outbox are replayed: after a crash by recover when the
+    writer starts, and after a full queue as soon as every worker is idle again, so
+    every job is processed at least once.
+
+    Each user is always served by the same worker, and a batch splits into rounds
+    holding at most one job per user, so a user's memories are written in order and
+    each decision sees the memories saved before it.
+
+    Nothing runs until start is called, from the app entry points; until then the
+    memory nodes save synchronously.
+    """
+
+    def __init__(
+        self,
+        store: BaseStore,
+        n_workers: int,
+        max_queue_size: int,
+        batch_size: int,
+        batch_wait_seconds: float,
+        max_attempts: int,
+    ):
+        self.store = store
+        self.batch_size = batch_size
+        self.batch_wait_seconds = batch_wait_seconds
+        self.max_attempts = max_attempts
+        self.queues = [
+            queue.Queue(maxsize=max(1, max_queue_size // n_workers))
+            for _ in range(n_workers)
+        ]
+        self.workers = []
+        self.start_lock = threading.Lock()
+        # Held while a job goes to the outbox and a queue, so that the outbox is
+        # never re-scanned between the two
+        self.submit_lock = threading.Lock()
+        # Set when a job could not be queued, or failed without being retried, and
+        # waits in the outbox
+        self.outbox_overflowed = threading.Event()
+
+    @property
+    def is_running(self) -> bool:
+        return bool(self.workers)
+
+    def start(self) -> None:
+        """Start the workers and replay the jobs left in the outbox. Idempotent."""
+        with self.start_lock:
+            if self.workers:
+                return
+            # No job can be enqueued before the outbox has been read
+            with self.submit_lock:
+                self._start_workers()
+                self._resubmit_outbox()
+
+    def _start_workers(self) -> None:
+        for i, worker_queue in enumerate(self.queues):
+            worker = threading.Thread(
+                target=self._run_worker,
+                args=(worker_queue,),
+                name=f"memory-writer-{i}",
+                daemon=True,
+            )
+            worker.start()
+            self.workers.append(worker)
+
+    def enqueue(self, user_id: str, user_query: str, final_response: str) -> str:
+        """
+        Schedule a memory save for a finished turn.
+        Args:
+            user_id (str): The user the memory belongs to.
+            user_query (str): The user query of the turn.
+            final_response (str): The analyst response of the turn.
+        Returns:
+            str: The id of the job in the outbox.
+        """
+        job_id = str(uuid.uuid4())
+        job = {
+            "user_id": user_id,
+            "user_query": user_query,
+            "final_response": final_response,
+            "attempts": 0,
+            "created_at": time.time(),
+        }
+        # Durable first: a job that never reaches a worker is replayed by recover
+        with self.submit_lock:
+            self.store.put(MEMORY_OUTBOX_NAMESPACE, job_id, job, index=False)
+            self._submit(job_id, job)
+        return job_id
+
+    def recover(self) -> int:
+        """
+        Re-submit every job still in the outbox. Only safe when no job is queued or
+        being processed, e.g. before the workers take any job.
+        Returns:
+            int: The number of jobs re-submitted.
+        """
+        with self.submit_lock:
+            return self._resubmit_outbox()
+
+    def _recover_overflow(self) -> None:
+        # Once every queue is drained, the jobs left in the outbox are exactly those
+        # that found their queue full: enqueue cannot add one meanwhile (submit_lock),
+        # and retries only happen while a job is unfinished
+        with self.submit_lock:
+            if not self.outbox_overflowed.is_set() or any(
+                worker_queue.unfinished_tasks for worker_queue in self.queues
+            ):
+                return
+            self.outbox_overflowed.clear()
+            self._resubmit_outbox()
+
+    def _resubmit_outbox(self) -> int:
+        items, offset = [], 0
+        while True:
+            page = self.store.search(
+                MEMORY_OUTBOX_NAMESPACE, limit=OUTBOX_PAGE_SIZE, offset=offset
+            )
+            items.extend(page)
+            if len(page) < OUTBOX_PAGE_SIZE:
+                break
+            offset += OUTBOX_PAGE_SIZE
+
+        for item in sorted(items, key=lambda item: item.value["created_at"]):
+            self._submit(item.key, item.value)
+        if items:
+            print(f"Memory writer recovered {len(items)} pending jobs")
+        return len(items)
+
+    def flush(self) -> None:
+        """Block until every submitted job, including those that overflowed, has been processed."""
+        while True:
+            for worker_queue in self.queues:
+                worker_queue.join()
+            # Under submit_lock, so as not to miss a re-scan in progress in a worker
+            with self.submit_lock:
+                if not self.outbox_overflowed.is_set() and not any(
+                    worker_queue.unfinished_tasks for worker_queue in self.queues
+                ):
+                    return
+            self._recover_overflow()
+
+    def _submit(self, job_id: str, job: dict) -> None:
+        worker_index = zlib.crc32(job["user_id"].encode("utf-8")) % len(self.queues)
+        try:
+            self.queues[worker_index].put_nowait((job_id, job))
+        except queue.Full:
+            self.outbox_overflowed.set()
+            print(
+                f"Memory writer queue full, job {job_id} stays in the outbox "
+                "until the workers are idle"
+            )
+
+    def _run_worker(self, worker_queue: queue.Queue) -> None:
+        while True:
+            batch = [worker_queue.get()]
+            deadline = time.monotonic() + self.batch_wait_seconds
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(
+                        worker_queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                    )
+                except queue.Empty:
+                    break
+
+            try:
+                self._process_batch(batch)
+            except Exception as e:
+                # Failures are retried per job; this is a failed retry, e.g. the store
+                # is unavailable. The jobs are still in the outbox: replay them once idle
+                self.outbox_overflowed.set()
+                print(f"Memory writer batch failed, its jobs stay in the outbox: {e}")
+            finally:
+                for _ in batch:
+                    worker_queue.task_done()
+
+            if self.outbox_overflowed.is_set():
+                self._recover_overflow()
+
+    def _process_batch(self, batch: List[tuple]) -> None:
+        # Split the batch into rounds holding at most one job per user
+        rounds = []
+        for job_id, job in batch:
+            for round_jobs in rounds:
+                if all(other["user_id"] != job["user_id"] for _, other in round_jobs):
+                    round_jobs.append((job_id, job))
+                    break
+            else:
+                rounds.append([(job_id, job)])
+
+        for round_jobs in rounds:
+            self._process_round(round_jobs)
+
+    def _process_round(self, round_jobs: List[tuple]) -> None:
+        # Every failure is retried per job, so that one job cannot hold back the others
+        prompts, prompted_jobs = [], []
+        for job_id, job in round_jobs:
+            try:
+                memories = search_memories(
+                    self.store,
+                    job["user_id"],
+                    f"{job['user_query']}\n{job['final_response']}",
+                    top_k=SAVE_MEMORY_TOP_K,
+                    token_budget=SAVE_MEMORY_TOKEN_BUDGET,
+                )
+            except Exception as e:
+                self._retry(job_id, job, e)
+                continue
+            prompts.append(
+                build_save_memory_prompt(
+                    job["user_query"], job["final_response"], memories
+                )
+            )
+            prompted_jobs.append((job_id, job))
+        if not prompted_jobs:
+            return
+
+        try:
+            responses = llm.with_structured_output(MemorySummarySave).batch(
+                prompts, return_exceptions=True
+            )
+        except Exception as e:
+            # Raised before any call, e.g. while binding the output schema
+            responses = [e] * len(prompted_jobs)
+
+        for (job_id, job), response in zip(prompted_jobs, responses):
+            if isinstance(response, Exception):
+                self._retry(job_id, job, response)
+                continue
+
+            try:
+                if response.should_save:
+                    put_memory(self.store, job["user_id"], response.summary)
+                self.store.delete(MEMORY_OUTBOX_NAMESPACE, job_id)
+            except Exception as e:
+                self._retry(job_id, job, e)
+
+    def _retry(self, job_id: str, job: dict, error: Exception) -> None:
+        job = {**job, "attempts": job["attempts"] + 1}
+        if job["attempts"] >= self.max_attempts:
+            print(
+                f"Memory job {job_id} dropped after {job['attempts']} attempts: {error}"
+            )
+            self.store.delete(MEMORY_OUTBOX_NAMESPACE, job_id)
+            return
+
+        print(f"Memory job {job_id} failed, retrying: {error}")
+        self.store.put(MEMORY_OUTBOX_NAMESPACE, job_id, job, index=False)
+        self._submit(job_id, job)
+
+
+def create_memory_writer() -> Optional[MemoryWriter]:
+    if not MEMORY_WRITER_ENABLED:
+        return None
+
+    # Every worker thread gets its own store connection
+    writer = MemoryWriter(
+        ThreadLocalSqliteStore(STORE_DB_FILE_PATH),
+        n_workers=MEMORY_WRITER_N_WORKERS,
+        max_queue_size=MEMORY_WRITER_MAX_QUEUE_SIZE,
+        batch_size=MEMORY_WRITER_BATCH_SIZE,
+        batch_wait_seconds=MEMORY_WRITER_BATCH_WAIT_SECONDS,
+        max_attempts=MEMORY_WRITER_MAX_ATTEMPTS,
+    )
+    return writer
+
+
+def start_memory_writer() -> None:
+    """Start the shared memory writer, if enabled. Called by the app entry points."""
+    if memory_writer is not None:
+        memory_writer.start()
+
+
+# Created at import so that every module shares it, but only started explicitly:
+# importing the workflow (tests, maintenance scripts) starts no thread
+memory_writer = create_memory_writer()
@@ -0,0 +1,221 @@
+import argparse
+import inspect
+import json
+import math
+import os
+import time
+
+from app.const import (
+    MICROBENCHMARK_SIZES,
+    MICROBENCHMARK_SKEW,
+    MICROBENCHMARK_REPEATS,
+    MICROBENCHMARK_RESULTS_FILE_PATH,
+)
+from benchmarking import measure
+from synthetic_data import generate_bitext_frame
+
+# Dataset micro-benchmark: generate Bitext-shaped frames of growing size, install each
+# as the shared dataset, and measure the time and peak memory of indexing, of every
+# Dataset query method (unfiltered and filtered by the most frequent category) and of
+# every tool of the structured query agent. The growth of each operation with the
+# number of rows is reported as a scaling exponent: about 1 is linear, above it the
+# operation stops scaling. The indexes built here are never written to disk.
+# The vector index dominates the run time of large sizes.
+parser = argparse.ArgumentParser(description="Micro-benchmark the Dataset and tools.")
+parser.add_argument(
+    "--sizes",
+    type=int,
+    nargs="+",
+    default=MICROBENCHMARK_SIZES,
+    help="The numbers of rows to generate.",
+)
+parser.add_argument(
+    "--skew",
+    type=float,
+    default=MICROBENCHMARK_SKEW,
+    help="Zipf exponent of the intent frequencies (0 is uniform).",
+)
+parser.add_argument(
+    "--repeats",
+    type=int,
+    default=MICROBENCHMARK_REPEATS,
+    help="Number of timed calls per operation.",
+)
+parser.add_argument(
+    "--output", default=MICROBENCHMARK_RESULTS_FILE_PATH, help="The JSON results file."
+)
+args = parser.parse_args()
+
+# The tool modules create the LLM when imported; the tools themselves never call it
+os.environ.setdefault("LLM_BACKEND", "fake")
+
+from data import Dataset, build_vector_index  # noqa: E402
+from structured_query_agent import structured_query_agent_tool_list  # noqa: E402
+
+
+def rebuild_text_index() -> None:
+    with Dataset._text_index_lock:
+        Dataset.singleton_text_index = None
+    Dataset.get_text_index()
+
+
+def reset_view_cache() -> None:
+    with Dataset._view_cache_lock:
+        Dataset._view_cache.clear()
+
+
+def filtered_frame(category: str) -> None:
+    # A new filter, so the view is computed rather than read from the cache
+    reset_view_cache()
+    Dataset({"category": [category], "intent": []}).dataset
+
+
+def method_cases(dataset: Dataset, top_category: str, top_intent: str) -> dict:
+    row_ids = list(range(10))
+    return {
+        "count_rows": lambda: dataset.count_rows(),
+        "count_category": lambda: dataset.count_category(top_category),
+        "count_intent": lambda: dataset.count_intent(top_intent),
+        "get_possible_intents": lambda: dataset.get_possible_intents(),
+        "get_possible_categories": lambda: dataset.get_possible_categories(),
+        "show_examples": lambda: dataset.show_examples(5),
+        "get_distribution": lambda: dataset.get_distribution("intent"),
+        "value_counts(flags)": lambda: dataset.value_counts("flags"),
+        "value_counts(instruction)": lambda: dataset.value_counts(
+            "instruction", top_k=20
+        ),
+        "get_cross_tab": lambda: dataset.get_cross_tab("category", "intent"),
+        "search_text": lambda: dataset.search_text("cancel order refund", top_k=10),
+        "search_similar": lambda: dataset.search_similar(
+            "cancel order refund", top_k=10
+        ),
+        "get_rows": lambda: dataset.get_rows(row_ids),
+    }
+
+
+def tool_args(top_category: str, top_intent: str) -> dict:
+    distribution = Dataset().get_distribution("intent")
+    return {
+        "get_possible_intents_tool": {},
+        "get_possible_categories_tool": {},
+        "select_semantic_intent_tool": {"intent_names": [top_intent]},
+        "select_semantic_category_tool": {"category_names": [top_category]},
+        "search_text_tool": {"query": "cancel order refund"},
+        "finish_tool": {"final_response": "Done"},
+        "sort_dict_by_values_tool": {"d": json.dumps(distribution)},
+        "len_tool": {"object": json.dumps(list(distribution))},
+        "sum_tool": {"a": 1, "b": 2},
+        "count_category_tool": {"category": top_category},
+        "count_intent_tool": {"intent": top_intent},
+        "count_rows_tool": {},
+        "show_examples_tool": {"n": 5},
+        "value_counts_tool": {"column": "intent"},
+        "get_cross_tab_tool": {"row_column": "category", "column_column": "intent"},
+    }
+
+
+def tool_case(tool, args: dict):
+    takes_dataset = "dataset" in inspect.signature(tool.func).parameters
+
+    def call_tool():
+        # A fresh Dataset per call, as the select tools narrow the one they are given
+        call_args = {"reasoning": "Benchmark", **args}
+        if takes_dataset:
+            call_args["dataset"] = Dataset()
+        return tool.invoke(
+            {
+                "type": "tool_call",
+                "id": "benchmark",
+                "name": tool.name,
+                "args": call_args,
+            }
+        )
+
+    return call_tool
+
+
+def run_size(n_rows: int) -> dict:
+    start = time.perf_counter()
+    df = generate_bitext_frame(n_rows, skew=args.skew)
+    print(f"Generated {n_rows} rows in {time.perf_counter() - start:.1f}s")
+
+    top_category = df["category"].value_counts().index[0]
+    top_intent = df["intent"].value_counts().index[0]
+    # Installs the frame and builds its bitmap index and count cube
+    results = {
+        "set_singleton_dataset": measure(lambda: Dataset.set_singleton_dataset(df), 1)
+    }
+    results["build_text_index"] = measure(rebuild_text_index, 1)
+    # Installed directly: get_vector_index only loads the index preprocess.py writes
+    vector_indexes = []
+    results["build_vector_index"] = measure(
+        lambda: vector_indexes.append(build_vector_index(df)), 1
+    )
+    with Dataset._vector_index_lock:
+        Dataset.singleton_vector_index = vector_indexes[-1]
+
+    results["filtered_view (cold)"] = measure(
+        lambda: filtered_frame(top_category), args.repeats
+    )
+    for dataset_name, dataset in [
+        ("", Dataset()),
+        (" [filtered]", Dataset({"category": [top_category], "intent": []})),
+    ]:
+        for name, function in method_cases(dataset, top_category, top_intent).items():
+            results[f"Dataset.{name}{dataset_name}"] = measure(function, args.repeats)
+
+    arguments = tool_args(top_category, top_intent)
+    for tool in structured_query_agent_tool_list:
+        if tool.name not in arguments:
+            print(f"No benchmark arguments for {tool.name}, skipped")
+            continue
+        results[tool.name] = measure(
+            tool_case(tool, arguments[tool.name]), args.repeats
+        )
+
+    return {
+        name: {"ms": round(seconds * 1000, 3), "peak_mb": round(peak / 2**20, 3)}
+        for name, (seconds, peak) in results.items()
+    }
+
+
+def scaling_exponent(sizes: list, timings: list) -> float:
+    """The slope of log(time) against log(rows), between the smallest and largest N."""
+    if len(sizes) < 2 or timings[0] <= 0 or timings[-1] <= 0:
+        return float("nan")
+    return math.log(timings[-1] / timings[0]) / math.log(sizes[-1] / sizes[0])
+
+
+try:
+    sizes = sorted(args.sizes)
+    results_by_size = {n_rows: run_size(n_rows) for n_rows in sizes}
+    operations = list(results_by_size[sizes[0]])
+
+    print()
+    print(
+        f"{'operation':<42}"
+        + "".join(f"{f'N={n_rows}':>24}" for n_rows in sizes)
+        + f"{'scaling':>10}"
+    )
+    results = {"skew": args.skew, "repeats": args.repeats, "operations": {}}
+    for operation in operations:
+        measurements = [results_by_size[n_rows][operation] for n_rows in sizes]
+        exponent = scaling_exponent(sizes, [m["ms"] for m in measurements])
+        results["operations"][operation] = {
+            "by_size": dict(zip(map(str, sizes), measurements)),
+            "scaling_exponent": None if math.isnan(exponent) else round(exponent, 2),
+        }
+        print(
+            f"{operation:<42}"
+            + "".join(
+                f"{'%.2f ms / %.1f MB' % (m['ms'], m['peak_mb']):>24}"
+                for m in measurements
+            )
+            + f"{exponent:>10.2f}"
+        )
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+except Exception as e:
+    print(f"Error running the micro-benchmark: {e}")
@@ -13,6 +13,19 @@ class OutOfScopeResponse(BaseModel):
     )
 
 
+def apply_out_of_scope_response(
+    state: UserQueryState, system_prompt: str, response: OutOfScopeResponse
+) -> UserQueryState:
+    state["messages"] = [
+        SystemMessage(content=system_prompt),
+        AIMessage(content=response.model_dump_json()),
+    ]
+    state["final_response"] = response.response
+    state["is_complete"] = True
+
+    return state
+
+
 def out_of_scope_handler_node(state: UserQueryState) -> UserQueryState:
 
     system_prompt = read_prompt_file(OUT_OF_SCOPE_HANDLER_SYSTEM_PROMPT_FILE_PATH)
@@ -21,11 +34,15 @@ def out_of_scope_handler_node(state: UserQueryState) -> UserQueryState:
         state["messages"] + [system_prompt]
     )
 
-    state["messages"] = [
-        SystemMessage(content=system_prompt),
-        AIMessage(content=response.model_dump_json()),
-    ]
-    state["final_response"] = response.response
-    state["is_complete"] = True
+    return apply_out_of_scope_response(state, system_prompt, response)
 
-    return state
+
+async def out_of_scope_handler_node_async(state: UserQueryState) -> UserQueryState:
+
+    system_prompt = read_prompt_file(OUT_OF_SCOPE_HANDLER_SYSTEM_PROMPT_FILE_PATH)
+
+    response = await llm.with_structured_output(OutOfScopeResponse).ainvoke(
+        state["messages"] + [system_prompt]
+    )
+
+    return apply_out_of_scope_response(state, system_prompt, response)
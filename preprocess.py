@@ -0,0 +1,42 @@
+import os
+import sys
+
+from app.const import DATASET_SNAPSHOT_FILE_PATH, VECTOR_INDEX_DIR_PATH
+from data import (
+    load_dataset_from_hub,
+    write_dataset_snapshot,
+    read_dataset_snapshot,
+    dataset_fingerprint,
+    build_vector_index,
+)
+
+# One-time preprocessing: snapshot the dataset next to the DB files so that every
+# later process memory-maps it at startup instead of going through Hugging Face,
+# and build the row embeddings used to pick relevant rows for summaries. The index
+# is tagged with the snapshot fingerprint; the app ignores it once the snapshot changes.
+try:
+    df = load_dataset_from_hub()
+    write_dataset_snapshot(df)
+    size_mb = os.path.getsize(DATASET_SNAPSHOT_FILE_PATH) / (1024 * 1024)
+    print(
+        f"Dataset snapshot written: {DATASET_SNAPSHOT_FILE_PATH} "
+        f"({len(df)} rows, {size_mb:.1f} MB)"
+    )
+except Exception as e:
+    print(f"Error writing dataset snapshot: {e}")
+    if not os.path.exists(DATASET_SNAPSHOT_FILE_PATH):
+        sys.exit(1)
+    print("Building the vector index from the existing snapshot instead")
+
+try:
+    # Read back from the snapshot, so the index matches the rows the app will load
+    fingerprint = dataset_fingerprint(DATASET_SNAPSHOT_FILE_PATH)
+    vector_index = build_vector_index(read_dataset_snapshot(DATASET_SNAPSHOT_FILE_PATH))
+    vector_index.save(VECTOR_INDEX_DIR_PATH, fingerprint)
+    print(
+        f"Vector index written: {VECTOR_INDEX_DIR_PATH} "
+        f"({vector_index.embeddings.shape[0]} rows, {vector_index.embeddings.shape[1]} dims)"
+    )
+except Exception as e:
+    print(f"Error writing vector index: {e}")
+    sys.exit(1)
@@ -9,3 +9,14 @@ def read_prompt_file(prompt_file_path: str) -> str:
     with open(prompt_file_path, "r", encoding="utf-8") as f:
         prompt = f.read()
     return prompt
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of LLM tokens of a text, at about 4 characters per token.
+    Args:
+        text (str): The text to measure.
+    Returns:
+        int: The estimated number of tokens.
+    """
+    return len(text) // 4 + 1
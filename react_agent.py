@@ -6,32 +6,26 @@ from llm import llm
 from app.const import MAX_ITERATIONS, DEFAULT_PARALLEL_TOOL_CALLS
 
 
-def react_agent_node(
-    state: UserQueryState,
-    system_prompt_file_path: str,
-    agent_tool_list: list,
-) -> UserQueryState:
-
-    # Get the current iteration count, defaulting to 0 if not present
-    iteration_count = state.get("iteration_count", 0)
-
-    # Check if the maximum number of iterations has been reached
-    if iteration_count >= MAX_ITERATIONS:
-        # If so, return a message indicating that processing is stopping
-        state["messages"] = [
-            AIMessage(
-                content="Maximum iterations reached. Stopping further processing.",
-            )
-        ]
-        state["final_response"] = (
-            "Sorry, the request caused too many internal steps and could not be completed."
+def stop_react_agent(state: UserQueryState) -> UserQueryState:
+    # Return a message indicating that processing is stopping
+    state["messages"] = [
+        AIMessage(
+            content="Maximum iterations reached. Stopping further processing.",
         )
-        state["is_complete"] = True
-        return state
+    ]
+    state["final_response"] = (
+        "Sorry, the request caused too many internal steps and could not be completed."
+    )
+    state["is_complete"] = True
+    return state
 
+
+def prepare_react_agent_messages(
+    state: UserQueryState, system_prompt_file_path: str
+) -> list:
     # If this is the first iteration, add the system prompt to the messages
     new_messages = []
-    if iteration_count == 0:
+    if state.get("iteration_count", 0) == 0:
 
         concise_history = state.get("concise_history", [])
 
@@ -47,15 +41,58 @@ def react_agent_node(
         )
         new_messages = [SystemMessage(content=system_prompt)]
 
-    # Bind the tools to the LLM and invoke it with the current messages
-    llm_with_tools = llm.bind_tools(
+    return new_messages
+
+
+def bind_react_agent_tools(agent_tool_list: list):
+    return llm.bind_tools(
         tools=agent_tool_list,
         parallel_tool_calls=DEFAULT_PARALLEL_TOOL_CALLS,
     )
-    response = llm_with_tools.invoke(state["messages"] + new_messages)
 
+
+def apply_react_agent_response(
+    state: UserQueryState, new_messages: list, response
+) -> UserQueryState:
     # Update the state with the new messages and increment the iteration count
     state["messages"] = new_messages + [response]
-    state["iteration_count"] = iteration_count + 1
-
+    state["iteration_count"] = state.get("iteration_count", 0) + 1
     return state
+
+
+def react_agent_node(
+    state: UserQueryState,
+    system_prompt_file_path: str,
+    agent_tool_list: list,
+) -> UserQueryState:
+
+    # Check if the maximum number of iterations has been reached
+    if state.get("iteration_count", 0) >= MAX_ITERATIONS:
+        return stop_react_agent(state)
+
+    new_messages = prepare_react_agent_messages(state, system_prompt_file_path)
+
+    # Bind the tools to the LLM and invoke it with the current messages
+    response = bind_react_agent_tools(agent_tool_list).invoke(
+        state["messages"] + new_messages
+    )
+
+    return apply_react_agent_response(state, new_messages, response)
+
+
+async def react_agent_node_async(
+    state: UserQueryState,
+    system_prompt_file_path: str,
+    agent_tool_list: list,
+) -> UserQueryState:
+
+    if state.get("iteration_count", 0) >= MAX_ITERATIONS:
+        return stop_react_agent(state)
+
+    new_messages = prepare_react_agent_messages(state, system_prompt_file_path)
+
+    response = await bind_react_agent_tools(agent_tool_list).ainvoke(
+        state["messages"] + new_messages
+    )
+
+    return apply_react_agent_response(state, new_messages, response)
@@ -1,12 +1,21 @@
 from enum import Enum
+from typing import Optional
 from pydantic import BaseModel, Field
 from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
 
 
 from graph_state import UserQueryState
 from prompt import read_prompt_file
-from app.const import ROUTER_SYSTEM_PROMPT_FILE_PATH
-from llm import llm
+from fast_router import FastRouter, FastRouterModel, log_router_decision
+from app.const import (
+    ROUTER_SYSTEM_PROMPT_FILE_PATH,
+    ROUTER_FAST_PATH_ENABLED,
+    ROUTER_FAST_PATH_CONFIDENCE_THRESHOLD,
+    ROUTER_DECISIONS_LOG_FILE_PATH,
+    ROUTER_DECISIONS_LOG_MAX_BYTES,
+    ROUTER_MODEL_FILE_PATH,
+)
+from llm import llm, llm_backend
 
 
 class QueryLabel(str, Enum):
@@ -26,22 +35,83 @@ class QueryClassification(BaseModel):
     )
 
 
-def router_node(state: UserQueryState) -> UserQueryState:
+fast_router = (
+    FastRouter(
+        FastRouterModel.load(ROUTER_MODEL_FILE_PATH),
+        threshold=ROUTER_FAST_PATH_CONFIDENCE_THRESHOLD,
+    )
+    if ROUTER_FAST_PATH_ENABLED
+    else None
+)
 
-    user_query = state["user_query"]
+
+def classify_query_fast_path(user_query: str) -> Optional[QueryClassification]:
+    # Try the local fast path first, and only call the LLM when it is not confident
+    if fast_router is not None:
+        fast_result = fast_router.classify(user_query)
+        if fast_result is not None:
+            label, reasoning = fast_result
+            print(f"Router fast path: {label}")
+            return QueryClassification(reasoning=reasoning, label=QueryLabel(label))
+    return None
+
+
+def log_llm_classification(user_query: str, response: QueryClassification) -> None:
+    # Only LLM decisions are logged, so the fast path never trains on its own output.
+    # The scripted LLM labels queries with the fast path's own keyword rules.
+    if llm_backend == "fake":
+        return
+    log_router_decision(
+        ROUTER_DECISIONS_LOG_FILE_PATH,
+        user_query,
+        QueryLabel(response.label).value,
+        max_bytes=ROUTER_DECISIONS_LOG_MAX_BYTES,
+    )
+
+
+def build_router_messages(user_query: str) -> list:
     system_prompt = read_prompt_file(ROUTER_SYSTEM_PROMPT_FILE_PATH)
-    messages = [SystemMessage(content=system_prompt), HumanMessage(content=user_query)]
+    return [SystemMessage(content=system_prompt), HumanMessage(content=user_query)]
 
-    response = llm.with_structured_output(QueryClassification).invoke(messages)
 
+def apply_query_classification(
+    state: UserQueryState, messages: list, response: QueryClassification
+) -> UserQueryState:
     state["messages"] = messages + [AIMessage(content=response.model_dump_json())]
     state["query_classification_result"] = {
         "reason": response.reasoning,
         "label": response.label,
     }
-
     return state
 
 
+def router_node(state: UserQueryState) -> UserQueryState:
+
+    user_query = state["user_query"]
+    messages = build_router_messages(user_query)
+
+    response = classify_query_fast_path(user_query)
+    if response is None:
+        response = llm.with_structured_output(QueryClassification).invoke(messages)
+        log_llm_classification(user_query, response)
+
+    return apply_query_classification(state, messages, response)
+
+
+async def router_node_async(state: UserQueryState) -> UserQueryState:
+
+    user_query = state["user_query"]
+    messages = build_router_messages(user_query)
+
+    response = classify_query_fast_path(user_query)
+    if response is None:
+        response = await llm.with_structured_output(QueryClassification).ainvoke(
+            messages
+        )
+        log_llm_classification(user_query, response)
+
+    return apply_query_classification(state, messages, response)
+
+
 def get_query_label(state: UserQueryState) -> QueryLabel:
     return QueryLabel(state["query_classification_result"]["label"])
@@ -0,0 +1,158 @@
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Iterator
+
+from langgraph.checkpoint.serde.base import SerializerProtocol
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.store.sqlite import SqliteStore
+
+from app.const import SQLITE_BUSY_TIMEOUT_SECONDS
+
+
+def connect_sqlite(db_path: str) -> sqlite3.Connection:
+    """
+    Open an autocommit SQLite connection tuned for concurrent use: WAL lets readers run
+    alongside the writer, and writers wait up to SQLITE_BUSY_TIMEOUT_SECONDS for each
+    other instead of failing with "database is locked".
+    Args:
+        db_path (str): The path of the database.
+    Returns:
+        sqlite3.Connection: The connection.
+    """
+    conn = sqlite3.connect(
+        db_path,
+        timeout=SQLITE_BUSY_TIMEOUT_SECONDS,
+        isolation_level=None,
+        check_same_thread=False,
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class LockWaitStats:
+    """
+    Time spent waiting for the SQLite write lock, across all threads. Only the waits of
+    explicit write transactions (begin_immediate) are measured; a single autocommitted
+    statement waits for the lock inside its own execution.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self.lock:
+            self.count = 0
+            self.total_seconds = 0.0
+            self.max_seconds = 0.0
+
+    def record(self, wait_seconds: float) -> None:
+        with self.lock:
+            self.count += 1
+            self.total_seconds += wait_seconds
+            self.max_seconds = max(self.max_seconds, wait_seconds)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "transactions": self.count,
+                "total_seconds": self.total_seconds,
+                "max_seconds": self.max_seconds,
+            }
+
+
+lock_wait_stats = LockWaitStats()
+
+
+def begin_immediate(conn: sqlite3.Connection) -> None:
+    """
+    Begin a write transaction, taking the write lock up front so that reads made inside
+    it cannot be invalidated by a concurrent writer. The wait is recorded in
+    lock_wait_stats.
+    """
+    start = time.perf_counter()
+    conn.execute("BEGIN IMMEDIATE")
+    lock_wait_stats.record(time.perf_counter() - start)
+
+
+class ThreadLocalConnection:
+    """
+    Mixin replacing the single shared connection of a LangGraph SQLite backend with one
+    connection per thread, so that concurrent graph runs neither serialize on one
+    connection's lock nor share its cursors. Connections are opened on first use in each
+    thread, and closed when the thread exits.
+    """
+
+    def _init_connections(self, db_path: str) -> None:
+        self.db_path = db_path
+        self.local = threading.local()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = connect_sqlite(self.db_path)
+            self.local.conn = conn
+        return conn
+
+    @conn.setter
+    def conn(self, value) -> None:
+        # The base class assigns its shared connection; connections are per thread
+        pass
+
+
+class ThreadLocalSqliteSaver(ThreadLocalConnection, SqliteSaver):
+    """SqliteSaver with one connection per thread."""
+
+    def __init__(self, db_path: str, *, serde: SerializerProtocol = None):
+        self._init_connections(db_path)
+        super().__init__(None, serde=serde)
+        # Create the tables once, then drop the lock that serialized the shared connection
+        self.setup()
+        self.lock = nullcontext()
+
+    @contextmanager
+    def cursor(self, transaction: bool = True) -> Iterator[sqlite3.Cursor]:
+        """
+        Run the writes of the checkpointer in one explicit transaction. The base class
+        only commits after them, which relies on the implicit transaction of a default
+        connection: on the autocommit connections of connect_sqlite, every row of a
+        put_writes would be committed on its own, and a crash or a concurrent reader
+        could see a partial set of pending writes. Beginning with begin_immediate also
+        takes the write lock up front, under the busy timeout, and records the wait in
+        lock_wait_stats, which is how loadtest.py measures the checkpointer's lock waits.
+        Reads (transaction=False) run outside any transaction.
+        Args:
+            transaction (bool): Whether the cursor writes.
+        Returns:
+            Iterator[sqlite3.Cursor]: The cursor, on the connection of this thread.
+        """
+        conn = self.conn
+        if transaction:
+            begin_immediate(conn)
+        cur = conn.cursor()
+        try:
+            yield cur
+        except BaseException:
+            if transaction:
+                conn.rollback()
+            raise
+        else:
+            if transaction:
+                conn.commit()
+        finally:
+            cur.close()
+
+
+class ThreadLocalSqliteStore(ThreadLocalConnection, SqliteStore):
+    """SqliteStore with one connection per thread."""
+
+    def __init__(self, db_path: str):
+        self._init_connections(db_path)
+        super().__init__(None)
+        # Run the migrations once, then drop the lock that serialized the shared connection
+        self.setup()
+        self.lock = nullcontext()
@@ -1,4 +1,5 @@
 import json
+from typing import Optional
 from typing_extensions import Annotated
 from langchain_core.messages import HumanMessage, SystemMessage, ToolMessage, AIMessage
 from langchain_core.tools import tool, InjectedToolCallId
@@ -15,10 +16,16 @@ from general_tools import (
     get_possible_categories_tool,
     select_semantic_intent_tool,
     select_semantic_category_tool,
+    search_text_tool,
     finish_tool,
 )
-from app.const import STRUCTURED_QUERY_AGENT_SYSTEM_PROMPT_FILE_PATH, MAX_ITERATIONS
-from react_agent import react_agent_node
+from app.const import (
+    STRUCTURED_QUERY_AGENT_SYSTEM_PROMPT_FILE_PATH,
+    MAX_ITERATIONS,
+    DATASET_INDEXED_COLUMNS,
+    VALUE_COUNTS_TEXT_COLUMNS_DEFAULT_TOP_K,
+)
+from react_agent import react_agent_node, react_agent_node_async
 
 # Tools
 
@@ -248,11 +255,102 @@ def show_examples_tool(
     )
 
 
+@tool
+def value_counts_tool(
+    reasoning: str,
+    column: str,
+    dataset: Annotated[Dataset, InjectedState("dataset")],
+    tool_call_id: Annotated[str, InjectedToolCallId],
+    top_k: Optional[int] = None,
+) -> Command:
+    """
+    Group the rows by a column and count every value in a single call, most frequent first.
+    Args:
+        reasoning (str): Reasoning for the function call.
+        column (str): The column to group by: "category", "intent", "flags", "instruction" or "response".
+        top_k (int): Return only the k most frequent values. Default is all values for
+            "category", "intent" and "flags", and the 20 most frequent for the text columns.
+    Returns:
+        The number of rows and distinct values, and the count and share of rows per value.
+    """
+    if top_k is None and column not in DATASET_INDEXED_COLUMNS:
+        top_k = VALUE_COUNTS_TEXT_COLUMNS_DEFAULT_TOP_K
+
+    try:
+        value_counts = dataset.value_counts(column, top_k=top_k)
+        return Command(
+            update={
+                "messages": [
+                    ToolMessage(
+                        json.dumps(value_counts),
+                        tool_call_id=tool_call_id,
+                    )
+                ],
+            }
+        )
+    except Exception as e:
+        error_msg = f"Error processing function call: {str(e)}"
+        return Command(
+            update={
+                "messages": [
+                    ToolMessage(
+                        json.dumps({"error": error_msg}),
+                        tool_call_id=tool_call_id,
+                    )
+                ],
+            }
+        )
+
+
+@tool
+def get_cross_tab_tool(
+    reasoning: str,
+    row_column: str,
+    column_column: str,
+    dataset: Annotated[Dataset, InjectedState("dataset")],
+    tool_call_id: Annotated[str, InjectedToolCallId],
+) -> Command:
+    """
+    Count the rows of every pair of values of two columns in a single call.
+    Args:
+        reasoning (str): Reasoning for the function call.
+        row_column (str): The outer column: "category", "intent" or "flags".
+        column_column (str): The inner column: "category", "intent" or "flags".
+    Returns:
+        For every value of row_column, the counts of the values of column_column.
+    """
+    try:
+        cross_tab = dataset.get_cross_tab(row_column, column_column)
+        return Command(
+            update={
+                "messages": [
+                    ToolMessage(
+                        json.dumps({"cross_tab": cross_tab}),
+                        tool_call_id=tool_call_id,
+                    )
+                ],
+            }
+        )
+    except Exception as e:
+        error_msg = f"Error processing function call: {str(e)}"
+        return Command(
+            update={
+                "messages": [
+                    ToolMessage(
+                        json.dumps({"error": error_msg}),
+                        tool_call_id=tool_call_id,
+                    )
+                ],
+            }
+        )
+
+
 structured_query_agent_tool_list = [
     get_possible_intents_tool,
     get_possible_categories_tool,
     select_semantic_intent_tool,
     select_semantic_category_tool,
+    search_text_tool,
     finish_tool,
     sort_dict_by_values_tool,
     len_tool,
@@ -261,6 +359,8 @@ structured_query_agent_tool_list = [
     count_intent_tool,
     count_rows_tool,
     show_examples_tool,
+    value_counts_tool,
+    get_cross_tab_tool,
 ]
 
 
@@ -276,4 +376,13 @@ def structured_query_agent_node(state: UserQueryState) -> UserQueryState:
     )
 
 
+async def structured_query_agent_node_async(state: UserQueryState) -> UserQueryState:
+
+    return await react_agent_node_async(
+        state,
+        STRUCTURED_QUERY_AGENT_SYSTEM_PROMPT_FILE_PATH,
+        structured_query_agent_tool_list,
+    )
+
+
 structured_query_agent_tool_node = ToolNode(structured_query_agent_tool_list)
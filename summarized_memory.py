@@ -1,4 +1,4 @@
-import uuid
+import asyncio
 from langchain_core.runnables import RunnableConfig
 from langgraph.config import get_store
 from pydantic import BaseModel, Field
@@ -6,22 +6,22 @@ from langchain_core.messages import SystemMessage, AIMessage, HumanMessage
 
 
 from graph_state import UserQueryState
-from app.const import SAVE_MEMORY_PROMPT_FILE_PATH, READ_MEMORY_PROMPT_FILE_PATH
+from app.const import (
+    READ_MEMORY_PROMPT_FILE_PATH,
+    SAVE_MEMORY_TOP_K,
+    SAVE_MEMORY_TOKEN_BUDGET,
+    READ_MEMORY_TOP_K,
+    READ_MEMORY_TOKEN_BUDGET,
+)
 from prompt import read_prompt_file
 from llm import llm
-
-
-class MemorySummarySave(BaseModel):
-    reasoning: str = Field(
-        ..., description="Explain briefly why you decided to save or not save"
-    )
-    should_save: bool = Field(
-        ..., description="Whether this memory should be saved or not"
-    )
-    summary: str = Field(
-        ...,
-        description="A short, precise memory of the new user information (empty if should_save is false)",
-    )
+from memory_writer import (
+    MemorySummarySave,
+    build_save_memory_prompt,
+    format_past_memories,
+    memory_writer,
+)
+from memory_index import put_memory, aput_memory, search_memories, asearch_memories
 
 
 class MemorySummaryRead(BaseModel):
@@ -35,39 +35,105 @@ class MemorySummaryRead(BaseModel):
     )
 
 
+def append_concise_history(state: UserQueryState) -> None:
+    state["concise_history"].append(
+        {
+            "Human User Query": state["user_query"],
+            "AI Final Response": state["final_response"],
+        }
+    )
+
+
+def prepare_read_memory_prompt(state: UserQueryState, memories: list) -> str:
+    return read_prompt_file(READ_MEMORY_PROMPT_FILE_PATH).format(
+        user_query=state["user_query"],
+        past_memories=format_past_memories(memories),
+    )
+
+
+def apply_read_memory_response(
+    state: UserQueryState, system_propmt: str, response: MemorySummaryRead
+) -> UserQueryState:
+    state["final_response"] = response.relevant_memories
+    state["is_complete"] = True
+    state["messages"] = [
+        SystemMessage(content=system_propmt),
+        AIMessage(content=response.model_dump_json()),
+    ]
+    return state
+
+
 def save_memory_node(state: UserQueryState, config: RunnableConfig) -> UserQueryState:
 
-    store = get_store()
     user_id = config["configurable"].get("user_id")
+    append_concise_history(state)
 
-    namespace = ("user_memories", user_id)
-    memories = store.search(namespace, limit=20)
+    # The memory is saved in the background, after the response is returned, once
+    # the entry point has started the writer
+    if memory_writer is not None and memory_writer.is_running:
+        memory_writer.enqueue(user_id, state["user_query"], state["final_response"])
+        return state
 
-    if not memories:
-        past_memories = "No relevant past memories."
-    else:
-        past_memories = "\n".join([f"- {m.value['content']}" for m in memories])
-
-    user_query = state["user_query"]
-    final_response = state["final_response"]
+    store = get_store()
 
-    state["concise_history"].append(
-        {"Human User Query": user_query, "AI Final Response": final_response}
+    memories = search_memories(
+        store,
+        user_id,
+        f"{state['user_query']}\n{state['final_response']}",
+        top_k=SAVE_MEMORY_TOP_K,
+        token_budget=SAVE_MEMORY_TOKEN_BUDGET,
     )
 
-    system_propmt = read_prompt_file(SAVE_MEMORY_PROMPT_FILE_PATH).format(
-        user_query=user_query,
-        analyst_response=final_response,
-        past_memories=past_memories,
+    system_propmt = build_save_memory_prompt(
+        state["user_query"], state["final_response"], memories
     )
 
     response = llm.with_structured_output(MemorySummarySave).invoke(system_propmt)
 
     if response.should_save:
-        memory_data = response.summary
+        put_memory(store, user_id, response.summary)
+
+        state["memory_saved"] = True
+
+    return state
 
-        memory_key = str(uuid.uuid4())
-        store.put(namespace, memory_key, {"content": memory_data})
+
+async def save_memory_node_async(
+    state: UserQueryState, config: RunnableConfig
+) -> UserQueryState:
+
+    user_id = config["configurable"].get("user_id")
+    append_concise_history(state)
+
+    if memory_writer is not None and memory_writer.is_running:
+        await asyncio.to_thread(
+            memory_writer.enqueue,
+            user_id,
+            state["user_query"],
+            state["final_response"],
+        )
+        return state
+
+    store = get_store()
+
+    memories = await asearch_memories(
+        store,
+        user_id,
+        f"{state['user_query']}\n{state['final_response']}",
+        top_k=SAVE_MEMORY_TOP_K,
+        token_budget=SAVE_MEMORY_TOKEN_BUDGET,
+    )
+
+    system_propmt = build_save_memory_prompt(
+        state["user_query"], state["final_response"], memories
+    )
+
+    response = await llm.with_structured_output(MemorySummarySave).ainvoke(
+        system_propmt
+    )
+
+    if response.should_save:
+        await aput_memory(store, user_id, response.summary)
 
         state["memory_saved"] = True
 
@@ -79,28 +145,41 @@ def read_memory_node(state: UserQueryState, config: RunnableConfig) -> UserQuery
     store = get_store()
     user_id = config["configurable"].get("user_id")
 
-    namespace = ("user_memories", user_id)
-    memories = store.search(namespace, limit=50)
+    # The memories most relevant to the query, under a constant token budget
+    memories = search_memories(
+        store,
+        user_id,
+        state["user_query"],
+        top_k=READ_MEMORY_TOP_K,
+        token_budget=READ_MEMORY_TOKEN_BUDGET,
+    )
 
-    if not memories:
-        past_memories = "No relevant past memories."
-    else:
-        past_memories = "\n".join([f"- {m.value['content']}" for m in memories])
+    system_propmt = prepare_read_memory_prompt(state, memories)
 
-    user_query = state["user_query"]
+    response = llm.with_structured_output(MemorySummaryRead).invoke(system_propmt)
 
-    system_propmt = read_prompt_file(READ_MEMORY_PROMPT_FILE_PATH).format(
-        user_query=user_query,
-        past_memories=past_memories,
+    return apply_read_memory_response(state, system_propmt, response)
+
+
+async def read_memory_node_async(
+    state: UserQueryState, config: RunnableConfig
+) -> UserQueryState:
+
+    store = get_store()
+    user_id = config["configurable"].get("user_id")
+
+    memories = await asearch_memories(
+        store,
+        user_id,
+        state["user_query"],
+        top_k=READ_MEMORY_TOP_K,
+        token_budget=READ_MEMORY_TOKEN_BUDGET,
     )
 
-    response = llm.with_structured_output(MemorySummaryRead).invoke(system_propmt)
+    system_propmt = prepare_read_memory_prompt(state, memories)
 
-    state["final_response"] = response.relevant_memories
-    state["is_complete"] = True
-    state["messages"] = [
-        SystemMessage(content=system_propmt),
-        AIMessage(content=response.model_dump_json()),
-    ]
+    response = await llm.with_structured_output(MemorySummaryRead).ainvoke(
+        system_propmt
+    )
 
-    return state
+    return apply_read_memory_response(state, system_propmt, response)
@@ -0,0 +1,159 @@
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from app.const import DATASET_INDEXED_COLUMNS
+
+# The categories and intents of the Bitext dataset
+BITEXT_INTENTS: Dict[str, List[str]] = {
+    "ACCOUNT": [
+        "create_account",
+        "delete_account",
+        "edit_account",
+        "recover_password",
+        "registration_problems",
+        "switch_account",
+    ],
+    "CANCEL": ["check_cancellation_fee"],
+    "CONTACT": ["contact_customer_service", "contact_human_agent"],
+    "DELIVERY": ["delivery_options", "delivery_period"],
+    "FEEDBACK": ["complaint", "review"],
+    "INVOICE": ["check_invoice", "get_invoice"],
+    "ORDER": ["cancel_order", "change_order", "place_order", "track_order"],
+    "PAYMENT": ["check_payment_methods", "payment_issue"],
+    "REFUND": ["check_refund_policy", "get_refund", "track_refund"],
+    "SHIPPING": ["change_shipping_address", "set_up_shipping_address"],
+    "SUBSCRIPTION": ["newsletter_subscription"],
+}
+
+# The language variation tags of the Bitext dataset (e.g. B: basic, Q: colloquial)
+BITEXT_FLAGS = "BCEIKLMNPQWZ"
+FLAG_PROBABILITY = 0.25
+
+INSTRUCTION_TEMPLATES = [
+    "I need help to {intent}",
+    "how can I {intent}?",
+    "can you help me {intent} for {{{{Order Number}}}}",
+    "I want to {intent} please",
+    "where do I {intent}",
+    "help me {intent} with my {{{{Account Type}}}} account",
+    "i dont know how to {intent}",
+    "what do I have to do to {intent}?",
+]
+RESPONSE_TEMPLATES = [
+    "I'm sorry to hear you are having trouble. To {intent}, please follow these steps:",
+    "Thank you for reaching out! I'd be glad to help you {intent}.",
+    "I understand that you want to {intent}. Here is how you can do it:",
+    "Certainly! To {intent}, go to {{{{Website URL}}}} and follow the instructions.",
+]
+SYLLABLES = ["ka", "lo", "mi", "ne", "ru", "sa", "ti", "vo", "ze", "pa", "do", "gu"]
+
+
+def zipf_weights(n: int, skew: float) -> np.ndarray:
+    """Probabilities proportional to 1 / rank**skew: uniform at 0, heavier-tailed above."""
+    weights = 1.0 / np.arange(1, n + 1) ** skew
+    return weights / weights.sum()
+
+
+def make_vocabulary(size: int, rng: np.random.Generator) -> np.ndarray:
+    """Distinct made-up words, so that the text columns grow a realistic vocabulary."""
+    words = set()
+    while len(words) < size:
+        n_syllables = rng.integers(2, 5)
+        words.add("".join(rng.choice(SYLLABLES, n_syllables)))
+    return np.array(sorted(words), dtype=object)
+
+
+def make_flags(n_rows: int, rng: np.random.Generator) -> pd.Categorical:
+    """Random flag combinations, built once per distinct combination."""
+    present = rng.random((n_rows, len(BITEXT_FLAGS))) < FLAG_PROBABILITY
+    # Every row has at least the first flag, like Bitext's basic tag B
+    present[:, 0] |= ~present.any(axis=1)
+    masks = present @ (1 << np.arange(len(BITEXT_FLAGS)))
+    unique_masks, codes = np.unique(masks, return_inverse=True)
+    labels = [
+        "".join(flag for i, flag in enumerate(BITEXT_FLAGS) if mask >> i & 1)
+        for mask in unique_masks
+    ]
+    return pd.Categorical.from_codes(codes, categories=labels)
+
+
+def make_text(
+    templates: List[str],
+    intent_phrases: np.ndarray,
+    intent_codes: np.ndarray,
+    vocabulary: np.ndarray,
+    rng: np.random.Generator,
+) -> np.ndarray:
+    """Fill a random template per row with its intent, then append a random word."""
+    n_rows = len(intent_codes)
+    template_codes = rng.integers(0, len(templates), n_rows)
+    # Each (template, intent) sentence is formatted once, then gathered for every row
+    sentences = np.array(
+        [
+            template.format(intent=phrase)
+            for template in templates
+            for phrase in intent_phrases
+        ],
+        dtype=object,
+    )
+    text = sentences[template_codes * len(intent_phrases) + intent_codes]
+    return text + " " + vocabulary[rng.integers(0, len(vocabulary), n_rows)]
+
+
+def generate_bitext_frame(
+    n_rows: int,
+    skew: float = 0.0,
+    vocabulary_size: int = 5000,
+    seed: Optional[int] = 0,
+) -> pd.DataFrame:
+    """
+    Generate a DataFrame shaped like the Bitext dataset, at any scale.
+    Args:
+        n_rows (int): The number of rows.
+        skew (float): The Zipf exponent of the intent frequencies: 0 gives every intent
+            the same share (like Bitext), larger values concentrate the rows on the
+            first intents.
+        vocabulary_size (int): The number of distinct made-up words mixed into the
+            instructions and responses.
+        seed (Optional[int]): The random seed.
+    Returns:
+        pd.DataFrame: The flags, instruction, category, intent and response columns, with
+        the same types as a dataset snapshot: categoricals for the indexed columns and
+        Arrow strings for the text.
+    """
+    rng = np.random.default_rng(seed)
+    intents = [intent for intents in BITEXT_INTENTS.values() for intent in intents]
+    categories = [
+        category for category, intents in BITEXT_INTENTS.items() for _ in intents
+    ]
+    intent_phrases = np.array([intent.replace("_", " ") for intent in intents])
+
+    intent_codes = rng.choice(len(intents), n_rows, p=zipf_weights(len(intents), skew))
+    category_names = list(BITEXT_INTENTS)
+    category_codes = np.array([category_names.index(c) for c in categories])[
+        intent_codes
+    ]
+    vocabulary = make_vocabulary(vocabulary_size, rng)
+
+    df = pd.DataFrame(
+        {
+            "flags": make_flags(n_rows, rng),
+            "instruction": make_text(
+                INSTRUCTION_TEMPLATES, intent_phrases, intent_codes, vocabulary, rng
+            ),
+            "category": pd.Categorical.from_codes(
+                category_codes, categories=category_names
+            ),
+            "intent": pd.Categorical.from_codes(intent_codes, categories=intents),
+            "response": make_text(
+                RESPONSE_TEMPLATES, intent_phrases, intent_codes, vocabulary, rng
+            ),
+        }
+    )
+    for column in df.columns:
+        if column not in DATASET_INDEXED_COLUMNS:
+            df[column] = df[column].astype(pd.ArrowDtype(pa.string()))
+    return df
@@ -0,0 +1,24 @@
+import os
+import sys
+import tempfile
+
+# Set before any app module is imported: the scripted LLM, and databases kept out of
+# the working directory
+os.environ["LLM_BACKEND"] = "fake"
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("APP_DB_DIR", tempfile.mkdtemp(prefix="test-db-"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+
+from data import Dataset  # noqa: E402
+from synthetic_data import generate_bitext_frame  # noqa: E402
+
+
+@pytest.fixture
+def bitext_df():
+    # Skewed, so that the filters select rows of very different sizes
+    df = generate_bitext_frame(2000, skew=1.0, seed=0)
+    Dataset.set_singleton_dataset(df)
+    yield df
+    Dataset.set_singleton_dataset(None)
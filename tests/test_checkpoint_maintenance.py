@@ -0,0 +1,90 @@
+import operator
+import os
+from typing import Annotated, TypedDict
+
+import pytest
+from langgraph.graph import END, START, StateGraph
+
+from checkpoint_maintenance import prune_checkpoints
+from sqlite_backend import ThreadLocalSqliteSaver, connect_sqlite
+
+THREAD_IDS = ["thread-a", "thread-b"]
+N_TURNS = 4
+
+
+class CounterState(TypedDict):
+    values: Annotated[list, operator.add]
+
+
+def table_rows(conn, table: str) -> list:
+    return conn.execute(f"SELECT * FROM {table} ORDER BY rowid").fetchall()
+
+
+def count_checkpoints(conn, thread_id: str) -> int:
+    return conn.execute(
+        "SELECT COUNT(*) FROM checkpoints WHERE thread_id = ?", (thread_id,)
+    ).fetchone()[0]
+
+
+@pytest.fixture
+def graph(tmp_path):
+    # A two-node graph run for several turns on two threads: every turn writes
+    # checkpoints and pending writes
+    checkpointer = ThreadLocalSqliteSaver(os.path.join(tmp_path, "checkpoints.db"))
+    builder = StateGraph(CounterState)
+    builder.add_node("first", lambda state: {"values": [len(state["values"])]})
+    builder.add_node("second", lambda state: {"values": [-1]})
+    builder.add_edge(START, "first")
+    builder.add_edge("first", "second")
+    builder.add_edge("second", END)
+    graph = builder.compile(checkpointer=checkpointer)
+    for thread_id in THREAD_IDS:
+        for _ in range(N_TURNS):
+            graph.invoke({"values": []}, {"configurable": {"thread_id": thread_id}})
+    return graph
+
+
+def test_dry_run_counts_without_deleting(graph):
+    conn = connect_sqlite(graph.checkpointer.db_path)
+    checkpoints_before = table_rows(conn, "checkpoints")
+    writes_before = table_rows(conn, "writes")
+
+    n_checkpoints, n_writes = prune_checkpoints(conn, keep_latest=1, dry_run=True)
+
+    assert n_checkpoints == len(checkpoints_before) - len(THREAD_IDS)
+    assert n_writes > 0
+    assert not conn.in_transaction
+    assert table_rows(conn, "checkpoints") == checkpoints_before
+    assert table_rows(conn, "writes") == writes_before
+
+
+def test_prune_keeps_the_latest_checkpoints(graph):
+    configs = [{"configurable": {"thread_id": thread_id}} for thread_id in THREAD_IDS]
+    states_before = [graph.get_state(config) for config in configs]
+    conn = connect_sqlite(graph.checkpointer.db_path)
+    dry_run_counts = prune_checkpoints(conn, keep_latest=2, dry_run=True)
+
+    assert prune_checkpoints(conn, keep_latest=2) == dry_run_counts
+    for thread_id in THREAD_IDS:
+        assert count_checkpoints(conn, thread_id) == 2
+    # Every pending write left belongs to a checkpoint left
+    assert (
+        conn.execute(
+            """
+            SELECT COUNT(*) FROM writes WHERE NOT EXISTS (
+                SELECT 1 FROM checkpoints
+                WHERE checkpoints.thread_id = writes.thread_id
+                AND checkpoints.checkpoint_ns = writes.checkpoint_ns
+                AND checkpoints.checkpoint_id = writes.checkpoint_id
+            )
+            """
+        ).fetchone()[0]
+        == 0
+    )
+    # The threads resume from the same state
+    for config, state_before in zip(configs, states_before):
+        state = graph.get_state(config)
+        assert state.values == state_before.values
+        assert state.config == state_before.config
+
+    assert prune_checkpoints(conn, keep_latest=2) == (0, 0)
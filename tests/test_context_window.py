@@ -0,0 +1,123 @@
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+from langgraph.graph.message import add_messages
+
+from app.const import (
+    CONTEXT_KEEP_LAST_TURNS,
+    CONTEXT_MAX_TURNS,
+    CONTEXT_TOOL_MESSAGE_MAX_CHARS,
+)
+from context_window import CONTEXT_SUMMARY_MESSAGE_ID, manage_context_node
+
+
+def make_turn(i: int, tool_output: str = "42") -> list:
+    return [
+        SystemMessage(content=f"system prompt {i}", id=f"system-{i}"),
+        HumanMessage(content=f"question {i}", id=f"human-{i}"),
+        AIMessage(
+            content="",
+            tool_calls=[{"name": "count_rows", "args": {}, "id": f"call-{i}"}],
+            id=f"call-ai-{i}",
+        ),
+        ToolMessage(
+            content=tool_output,
+            tool_call_id=f"call-{i}",
+            name="count_rows",
+            id=f"tool-{i}",
+        ),
+        AIMessage(content=f"answer {i}", id=f"answer-{i}"),
+    ]
+
+
+def run_manage_context(messages: list, n_turns: int) -> dict:
+    # Apply the node's update the way the graph does, through the messages reducer
+    state = {
+        "messages": messages,
+        "concise_history": [
+            {"Human User Query": f"question {i}"} for i in range(n_turns)
+        ],
+    }
+    update = manage_context_node(dict(state))
+    return {
+        "messages": add_messages(messages, update["messages"]),
+        "concise_history": update["concise_history"],
+    }
+
+
+def test_short_thread_is_left_unchanged():
+    messages = [
+        m for i in range(2) for m in make_turn(i) if not isinstance(m, SystemMessage)
+    ]
+    update = manage_context_node({"messages": messages, "concise_history": [{}, {}]})
+
+    assert update["messages"] == []
+    assert len(update["concise_history"]) == 2
+
+
+def test_long_thread_folds_into_a_summary():
+    n_turns = CONTEXT_MAX_TURNS + 1
+    messages = [m for i in range(n_turns) for m in make_turn(i)]
+    state = run_manage_context(messages, n_turns)
+
+    summary, *rest = state["messages"]
+    assert summary.id == CONTEXT_SUMMARY_MESSAGE_ID
+    kept = range(n_turns - CONTEXT_KEEP_LAST_TURNS, n_turns)
+    # Past system prompts are dropped, the kept turns stay in order
+    assert [m.id for m in rest] == [
+        message_id
+        for i in kept
+        for message_id in (f"human-{i}", f"call-ai-{i}", f"tool-{i}", f"answer-{i}")
+    ]
+    # The router and agents see the same turns
+    assert [h["Human User Query"] for h in state["concise_history"]] == [
+        f"question {i}" for i in kept
+    ]
+
+
+def test_second_fold_updates_the_summary_in_place():
+    n_turns = CONTEXT_MAX_TURNS + 1
+    messages = [m for i in range(n_turns) for m in make_turn(i)]
+    state = run_manage_context(messages, n_turns)
+
+    more_turns = CONTEXT_MAX_TURNS + 1 - CONTEXT_KEEP_LAST_TURNS
+    messages = state["messages"] + [
+        m for i in range(n_turns, n_turns + more_turns) for m in make_turn(i)
+    ]
+    update = manage_context_node(
+        {"messages": messages, "concise_history": state["concise_history"]}
+    )
+    # Only the folded messages are removed: the others keep their place
+    removed = [m.id for m in update["messages"] if m.type == "remove"]
+    assert "__remove_all__" not in removed
+    assert f"human-{n_turns - CONTEXT_KEEP_LAST_TURNS}" in removed
+
+    messages = add_messages(messages, update["messages"])
+    assert messages[0].id == CONTEXT_SUMMARY_MESSAGE_ID
+    assert sum(m.id == CONTEXT_SUMMARY_MESSAGE_ID for m in messages) == 1
+    kept = range(n_turns + more_turns - CONTEXT_KEEP_LAST_TURNS, n_turns + more_turns)
+    assert [m.id for m in messages if isinstance(m, HumanMessage)] == [
+        f"human-{i}" for i in kept
+    ]
+    # No tool call of a folded turn is left to replay
+    assert {m.tool_call_id for m in messages if isinstance(m, ToolMessage)} == {
+        f"call-{i}" for i in kept
+    }
+
+
+def test_bulky_tool_output_is_truncated_in_place():
+    messages = [
+        m
+        for i in range(2)
+        for m in make_turn(i, tool_output="x" * (CONTEXT_TOOL_MESSAGE_MAX_CHARS * 2))
+    ]
+    state = run_manage_context(messages, 2)
+
+    tool_messages = [m for m in state["messages"] if isinstance(m, ToolMessage)]
+    assert [m.id for m in tool_messages] == ["tool-0", "tool-1"]
+    assert all(
+        len(m.content) <= CONTEXT_TOOL_MESSAGE_MAX_CHARS
+        and m.content.endswith("characters]")
+        for m in tool_messages
+    )
+    assert [m.id for m in state["messages"]] == [
+        m.id for m in messages if not isinstance(m, SystemMessage)
+    ]
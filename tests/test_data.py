@@ -0,0 +1,90 @@
+import pandas as pd
+import pytest
+
+from data import Dataset
+
+FILTERS = [
+    {"category": [], "intent": []},
+    {"category": ["ACCOUNT"], "intent": []},
+    {"category": ["ORDER", "REFUND"], "intent": []},
+    {"category": [], "intent": ["complaint", "review", "no_such_intent"]},
+    {"category": ["ACCOUNT", "FEEDBACK"], "intent": ["complaint", "create_account"]},
+    {"category": ["ACCOUNT"], "intent": ["complaint"]},
+]
+
+
+def pandas_filter(df: pd.DataFrame, filter_by: dict) -> pd.DataFrame:
+    mask = pd.Series(True, index=df.index)
+    for column, values in filter_by.items():
+        if values:
+            mask &= df[column].isin(values)
+    return df[mask]
+
+
+@pytest.mark.parametrize("filter_by", FILTERS)
+def test_bitmap_counts_match_pandas(bitext_df, filter_by):
+    dataset = Dataset({column: list(values) for column, values in filter_by.items()})
+    expected = pandas_filter(bitext_df, filter_by)
+
+    assert dataset.count_rows() == len(expected)
+    for category in bitext_df["category"].cat.categories:
+        assert (
+            dataset.count_category(category) == (expected["category"] == category).sum()
+        )
+    for intent in bitext_df["intent"].cat.categories:
+        assert dataset.count_intent(intent) == (expected["intent"] == intent).sum()
+    assert dataset.count_category("NO_SUCH_CATEGORY") == 0
+
+
+@pytest.mark.parametrize("filter_by", FILTERS)
+def test_bitmap_values_and_rows_match_pandas(bitext_df, filter_by):
+    dataset = Dataset({column: list(values) for column, values in filter_by.items()})
+    expected = pandas_filter(bitext_df, filter_by)
+
+    # In order of first appearance in the filtered rows
+    assert dataset.get_possible_categories() == [
+        str(value) for value in expected["category"].unique()
+    ]
+    assert dataset.get_possible_intents() == [
+        str(value) for value in expected["intent"].unique()
+    ]
+    pd.testing.assert_frame_equal(dataset.dataset, expected)
+
+
+def test_set_filter_changes_the_selected_rows(bitext_df):
+    dataset = Dataset()
+    dataset.select_semantic_category(["ORDER"])
+    assert dataset.count_rows() == (bitext_df["category"] == "ORDER").sum()
+
+    dataset.clear_filters()
+    assert dataset.count_rows() == len(bitext_df)
+
+
+@pytest.mark.parametrize("filter_by", FILTERS)
+@pytest.mark.parametrize("column", ["category", "intent", "flags"])
+def test_count_cube_distribution_matches_pandas(bitext_df, filter_by, column):
+    dataset = Dataset({column: list(values) for column, values in filter_by.items()})
+    counts = pandas_filter(bitext_df, filter_by)[column].astype(str).value_counts()
+
+    distribution = dataset.get_distribution(column)
+    assert distribution == {value: int(count) for value, count in counts.items()}
+    assert list(distribution.values()) == sorted(distribution.values(), reverse=True)
+    assert dataset.get_distribution(column, top_k=3) == dict(
+        list(distribution.items())[:3]
+    )
+
+
+@pytest.mark.parametrize("filter_by", FILTERS)
+def test_count_cube_cross_tab_matches_pandas(bitext_df, filter_by):
+    dataset = Dataset({column: list(values) for column, values in filter_by.items()})
+    expected = pandas_filter(bitext_df, filter_by)
+    table = pd.crosstab(
+        expected["category"].astype(str), expected["intent"].astype(str)
+    )
+
+    cross_tab = dataset.get_cross_tab("category", "intent")
+    assert cross_tab == {
+        category: {intent: int(count) for intent, count in row[row > 0].items()}
+        for category, row in table.iterrows()
+        if (row > 0).any()
+    }
@@ -0,0 +1,150 @@
+import os
+import re
+import threading
+from collections import Counter
+
+import pytest
+
+import memory_writer
+from memory_compaction import list_memories
+from memory_index import MEMORY_NAMESPACE_PREFIX
+from memory_writer import MEMORY_OUTBOX_NAMESPACE, MemorySummarySave, MemoryWriter
+from sqlite_backend import ThreadLocalSqliteStore
+
+USER_IDS = ["alice", "bob", "carol"]
+
+
+class FlakyLLM:
+    """Scripted LLM whose first n_failures calls for each job raise."""
+
+    def __init__(self, n_failures: int):
+        self.n_failures = n_failures
+        self.calls = Counter()
+        self.lock = threading.Lock()
+
+    def with_structured_output(self, schema):
+        return self
+
+    def batch(self, prompts, return_exceptions=False):
+        responses = []
+        for prompt in prompts:
+            # The prompt also holds the user's memories, which change between attempts
+            query = re.search(r"query \d+", prompt).group()
+            with self.lock:
+                self.calls[query] += 1
+                attempt = self.calls[query]
+            if attempt <= self.n_failures:
+                responses.append(RuntimeError(f"attempt {attempt} failed"))
+            else:
+                responses.append(
+                    MemorySummarySave(
+                        reasoning="new fact",
+                        should_save=True,
+                        summary="The user asked about their data.",
+                    )
+                )
+        return responses
+
+
+@pytest.fixture
+def writer(tmp_path):
+    store = ThreadLocalSqliteStore(os.path.join(tmp_path, "store.db"))
+    writer = MemoryWriter(
+        store,
+        n_workers=2,
+        max_queue_size=4,
+        batch_size=2,
+        batch_wait_seconds=0.01,
+        max_attempts=3,
+    )
+    writer.start()
+    return writer
+
+
+def enqueue_jobs(writer: MemoryWriter, n_jobs: int) -> None:
+    for i in range(n_jobs):
+        writer.enqueue(USER_IDS[i % len(USER_IDS)], f"query {i}", f"response {i}")
+
+
+def count_memories(writer: MemoryWriter) -> int:
+    return sum(
+        len(list_memories(writer.store, (*MEMORY_NAMESPACE_PREFIX, user_id)))
+        for user_id in USER_IDS
+    )
+
+
+def outbox(writer: MemoryWriter) -> list:
+    return writer.store.search(MEMORY_OUTBOX_NAMESPACE, limit=100)
+
+
+def test_failed_llm_calls_are_retried(writer, monkeypatch):
+    llm = FlakyLLM(n_failures=2)
+    monkeypatch.setattr(memory_writer, "llm", llm)
+
+    enqueue_jobs(writer, 6)
+    writer.flush()
+
+    assert outbox(writer) == []
+    assert count_memories(writer) == 6
+    assert set(llm.calls.values()) == {3}
+
+
+def test_jobs_are_dropped_after_max_attempts(writer, monkeypatch):
+    llm = FlakyLLM(n_failures=10)
+    monkeypatch.setattr(memory_writer, "llm", llm)
+
+    enqueue_jobs(writer, 3)
+    writer.flush()
+
+    assert outbox(writer) == []
+    assert count_memories(writer) == 0
+    assert set(llm.calls.values()) == {writer.max_attempts}
+
+
+def test_failed_memory_writes_are_retried(writer, monkeypatch):
+    monkeypatch.setattr(memory_writer, "llm", FlakyLLM(n_failures=0))
+    put_memory = memory_writer.put_memory
+    failures = Counter()
+    lock = threading.Lock()
+
+    def flaky_put_memory(store, user_id, content):
+        # The first write of each user fails
+        with lock:
+            failures[user_id] += 1
+            first = failures[user_id] == 1
+        if first:
+            raise RuntimeError("store unavailable")
+        return put_memory(store, user_id, content)
+
+    monkeypatch.setattr(memory_writer, "put_memory", flaky_put_memory)
+
+    enqueue_jobs(writer, 6)
+    writer.flush()
+
+    assert outbox(writer) == []
+    assert count_memories(writer) == 6
+    assert set(failures.values()) == {3}
+
+
+def test_failed_batches_are_replayed_from_the_outbox(writer, monkeypatch):
+    monkeypatch.setattr(memory_writer, "llm", FlakyLLM(n_failures=0))
+    process_batch = writer._process_batch
+    n_batches = Counter()
+    lock = threading.Lock()
+
+    def failing_first_batch(batch):
+        with lock:
+            n_batches["total"] += 1
+            first = n_batches["total"] == 1
+        if first:
+            raise RuntimeError("store unavailable")
+        process_batch(batch)
+
+    monkeypatch.setattr(writer, "_process_batch", failing_first_batch)
+
+    # More jobs than the queues hold: some overflow to the outbox as well
+    enqueue_jobs(writer, 12)
+    writer.flush()
+
+    assert outbox(writer) == []
+    assert count_memories(writer) == 12
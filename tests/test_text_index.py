@@ -0,0 +1,90 @@
+import math
+
+import numpy as np
+import pytest
+
+from app.const import BM25_B, BM25_K1
+from data import Dataset
+from text_index import BM25Index, tokenize, top_k_matches
+
+DOCUMENTS = [
+    "I want a refund for my order",
+    "refund refund refund please",
+    "How do I track my order",
+    "Cancel my order and give me a refund, the order never arrived and I am unhappy",
+    None,
+    "Change the shipping address of my order",
+]
+
+
+def reference_scores(documents: list, query: str) -> list:
+    # Okapi BM25 computed directly from its definition
+    tokenized = [tokenize(document) for document in documents]
+    avg_length = sum(len(tokens) for tokens in tokenized) / len(tokenized)
+    scores = []
+    for tokens in tokenized:
+        score = 0.0
+        for term in set(tokenize(query)):
+            doc_freq = sum(term in other for other in tokenized)
+            freq = tokens.count(term)
+            if not freq:
+                continue
+            idf = math.log(1 + (len(tokenized) - doc_freq + 0.5) / (doc_freq + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * len(tokens) / avg_length)
+            score += idf * freq * (BM25_K1 + 1) / (freq + norm)
+        scores.append(score)
+    return scores
+
+
+@pytest.mark.parametrize(
+    "query", ["refund", "my order", "Refund my ORDER!", "track shipping", "unknown"]
+)
+def test_bm25_scores_match_the_definition(query):
+    index = BM25Index(DOCUMENTS, k1=BM25_K1, b=BM25_B)
+    np.testing.assert_allclose(
+        index.score(query), reference_scores(DOCUMENTS, query), rtol=1e-5, atol=1e-6
+    )
+
+
+def test_bm25_ranking():
+    index = BM25Index(DOCUMENTS, k1=BM25_K1, b=BM25_B)
+
+    scores = index.score("refund")
+    # More occurrences rank higher, and a long document ranks below a short one
+    assert scores[1] > scores[0] > scores[3] > 0
+    assert scores[2] == scores[4] == scores[5] == 0
+
+    # "track" is in one document and outweighs "order", which is in most
+    scores = index.score("track order")
+    assert np.argmax(scores) == 2
+
+
+def test_top_k_matches_keeps_the_best_candidates():
+    scores = np.array([0.5, 3.0, 0.0, 2.0, 1.0, 4.0], dtype=np.float32)
+    candidates = np.array([True, True, True, True, True, False])
+
+    ids, top_scores, n_matching = top_k_matches(scores, candidates, top_k=3)
+    assert ids.tolist() == [1, 3, 4]
+    assert top_scores.tolist() == [3.0, 2.0, 1.0]
+    assert n_matching == 4
+
+    ids, _, n_matching = top_k_matches(scores, candidates, top_k=10)
+    assert ids.tolist() == [1, 3, 4, 0]
+    assert n_matching == 4
+
+
+def test_search_text_ranks_the_filtered_rows(bitext_df):
+    dataset = Dataset({"category": ["ORDER"], "intent": []})
+    result = dataset.search_text("cancel order", top_k=5)
+
+    assert 0 < len(result["row_ids"]) <= 5
+    assert result["scores"] == sorted(result["scores"], reverse=True)
+    assert (bitext_df["category"].iloc[result["row_ids"]] == "ORDER").all()
+
+    index = Dataset.get_text_index()
+    scores = index["instruction"].score("cancel order") + index["response"].score(
+        "cancel order"
+    )
+    in_filter = (bitext_df["category"] == "ORDER").to_numpy()
+    assert result["number_of_matching_rows"] == int(((scores > 0) & in_filter).sum())
+    assert result["scores"][0] == round(float(scores[in_filter].max()), 4)
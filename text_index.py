@@ -0,0 +1,109 @@
+import re
+from collections import Counter
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """
+    Split a text into lowercase alphanumeric tokens.
+    Args:
+        text (Optional[str]): The text to tokenize.
+    Returns:
+        List[str]: The tokens, in order.
+    """
+    if not text:
+        return []
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """
+    An Okapi BM25 inverted index over a list of documents. The postings are stored
+    as CSR-style arrays: the postings of term t are doc_ids[term_indptr[t]:term_indptr[t + 1]]
+    with matching term_freqs.
+    """
+
+    def __init__(self, documents: Iterable[Optional[str]], k1: float, b: float):
+        self.k1 = k1
+        self.b = b
+        self.vocabulary = {}
+
+        term_ids, doc_ids, term_freqs, doc_lengths = [], [], [], []
+        for doc_id, document in enumerate(documents):
+            tokens = tokenize(document)
+            doc_lengths.append(len(tokens))
+            for token, freq in Counter(tokens).items():
+                term_ids.append(self.vocabulary.setdefault(token, len(self.vocabulary)))
+                doc_ids.append(doc_id)
+                term_freqs.append(freq)
+
+        term_ids = np.asarray(term_ids, dtype=np.int32)
+        order = np.argsort(term_ids, kind="stable")
+        self.doc_ids = np.asarray(doc_ids, dtype=np.int32)[order]
+        self.term_freqs = np.asarray(term_freqs, dtype=np.float32)[order]
+        self.term_indptr = np.searchsorted(
+            term_ids[order], np.arange(len(self.vocabulary) + 1)
+        )
+
+        self.doc_lengths = np.asarray(doc_lengths, dtype=np.float32)
+        self.n_docs = len(self.doc_lengths)
+        avg_doc_length = self.doc_lengths.mean() if self.n_docs else 0.0
+        self.length_norm = self.k1 * (
+            1 - self.b + self.b * self.doc_lengths / max(avg_doc_length, 1e-9)
+        )
+
+        doc_freqs = np.diff(self.term_indptr).astype(np.float32)
+        self.idf = np.log1p((self.n_docs - doc_freqs + 0.5) / (doc_freqs + 0.5))
+
+    def score(self, query: str) -> np.ndarray:
+        """
+        Score every document against a query.
+        Args:
+            query (str): The free-text query.
+        Returns:
+            np.ndarray: One BM25 score per document, 0 for documents with no query term.
+        """
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        for token in set(tokenize(query)):
+            term_id = self.vocabulary.get(token)
+            if term_id is None:
+                continue
+
+            start, end = self.term_indptr[term_id], self.term_indptr[term_id + 1]
+            doc_ids = self.doc_ids[start:end]
+            term_freqs = self.term_freqs[start:end]
+            # Each document appears at most once in a term's postings
+            scores[doc_ids] += (
+                self.idf[term_id]
+                * term_freqs
+                * (self.k1 + 1)
+                / (term_freqs + self.length_norm[doc_ids])
+            )
+        return scores
+
+
+def top_k_matches(
+    scores: np.ndarray, candidates: np.ndarray, top_k: int
+) -> Tuple[np.ndarray, np.ndarray, int]:
+    """
+    Select the best scoring candidate documents.
+    Args:
+        scores (np.ndarray): One score per document.
+        candidates (np.ndarray): A boolean mask of the documents allowed in the result.
+        top_k (int): The maximum number of documents to return.
+    Returns:
+        Tuple[np.ndarray, np.ndarray, int]: The ids and scores of the top documents, best
+        first, and the number of candidates with a positive score.
+    """
+    matching_ids = np.flatnonzero((scores > 0) & candidates)
+    if len(matching_ids) > top_k:
+        best = np.argpartition(-scores[matching_ids], top_k - 1)[:top_k]
+        top_ids = matching_ids[best]
+    else:
+        top_ids = matching_ids
+    top_ids = top_ids[np.argsort(-scores[top_ids], kind="stable")]
+    return top_ids, scores[top_ids], len(matching_ids)
@@ -0,0 +1,459 @@
+import json
+import os
+import threading
+import time
+from enum import Enum
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from app.const import (
+    LLM_MODEL_NAME,
+    LLM_PRICES_PER_MILLION_TOKENS,
+    TRACING_ENABLED,
+    TRACE_FILE_PATH,
+    TRACING_METRICS_PORT,
+    TRACING_HISTOGRAM_BUCKETS,
+)
+
+
+def format_labels(label_names: Tuple[str, ...], label_values: Tuple[str, ...]) -> str:
+    if not label_names:
+        return ""
+    pairs = []
+    for name, value in zip(label_names, label_values):
+        value = (
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        )
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Counter:
+    """A Prometheus counter, with one value per combination of label values."""
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.lock = threading.Lock()
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, label_values: Tuple[str, ...], amount: float = 1.0) -> None:
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for label_values, value in sorted(self.values.items()):
+                labels = format_labels(self.label_names, label_values)
+                lines.append(f"{self.name}{labels} {value}")
+        return lines
+
+
+class Histogram:
+    """A Prometheus histogram of durations in seconds, per combination of label values."""
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        label_names: Tuple[str, ...],
+        buckets: List[float] = TRACING_HISTOGRAM_BUCKETS,
+    ):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = sorted(buckets)
+        self.lock = threading.Lock()
+        # Per label values: the count of each bucket (not cumulative), the sum and count
+        self.series: Dict[Tuple[str, ...], dict] = {}
+
+    def observe(self, label_values: Tuple[str, ...], value: float) -> None:
+        with self.lock:
+            series = self.series.setdefault(
+                label_values,
+                {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0},
+            )
+            for i, upper_bound in enumerate(self.buckets):
+                if value <= upper_bound:
+                    series["buckets"][i] += 1
+                    break
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self.lock:
+            for label_values, series in sorted(self.series.items()):
+                cumulative = 0
+                for upper_bound, count in zip(self.buckets, series["buckets"]):
+                    cumulative += count
+                    labels = format_labels(
+                        self.label_names + ("le",), label_values + (str(upper_bound),)
+                    )
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = format_labels(
+                    self.label_names + ("le",), label_values + ("+Inf",)
+                )
+                lines.append(f"{self.name}_bucket{labels} {series['count']}")
+                labels = format_labels(self.label_names, label_values)
+                lines.append(f"{self.name}_sum{labels} {series['sum']}")
+                lines.append(f"{self.name}_count{labels} {series['count']}")
+        return lines
+
+
+class Metrics:
+    """The metrics of the traced requests."""
+
+    def __init__(self):
+        self.request_duration = Histogram(
+            "agent_request_duration_seconds",
+            "Wall time of a user query, by query label.",
+            ("label",),
+        )
+        self.node_duration = Histogram(
+            "agent_node_duration_seconds",
+            "Wall time of a graph node run.",
+            ("node",),
+        )
+        self.tool_duration = Histogram(
+            "agent_tool_duration_seconds",
+            "Wall time of a tool call.",
+            ("tool", "node"),
+        )
+        self.llm_duration = Histogram(
+            "agent_llm_duration_seconds",
+            "Wall time of an LLM call.",
+            ("model", "node"),
+        )
+        # Users and threads are only in the trace file: as labels, every new one
+        # would add series that the process and Prometheus keep forever
+        self.llm_tokens = Counter(
+            "agent_llm_tokens_total",
+            "LLM tokens, by query label, model, node and direction.",
+            ("label", "model", "node", "direction"),
+        )
+        self.llm_cost = Counter(
+            "agent_llm_cost_usd_total",
+            "Estimated LLM cost in USD, by query label, model and node.",
+            ("label", "model", "node"),
+        )
+        self.errors = Counter(
+            "agent_errors_total",
+            "Failed node runs, tool calls and LLM calls.",
+            ("kind", "name"),
+        )
+
+    def render(self) -> str:
+        """The metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in [
+            self.request_duration,
+            self.node_duration,
+            self.tool_duration,
+            self.llm_duration,
+            self.llm_tokens,
+            self.llm_cost,
+            self.errors,
+        ]:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def llm_cost(model: str, input_tokens: int, output_tokens: int) -> float:
+    """The estimated cost in USD of an LLM call, 0 for a model without a known price."""
+    prices = LLM_PRICES_PER_MILLION_TOKENS.get(model)
+    if prices is None:
+        return 0.0
+    return (input_tokens * prices["input"] + output_tokens * prices["output"]) / 1e6
+
+
+def query_label(outputs: Any) -> str:
+    """The query label in the final state of a graph run, if the router set it."""
+    if not isinstance(outputs, dict):
+        return "unknown"
+    label = (outputs.get("query_classification_result") or {}).get("label")
+    if isinstance(label, Enum):
+        return label.value
+    return label or "unknown"
+
+
+class Tracer(BaseCallbackHandler):
+    """
+    Callback handler timing every graph run (a "request"), node, tool call and LLM call
+    as spans, with the token usage and estimated cost of the LLM calls. The spans of a
+    request are kept until it ends, then labelled with its user, thread and query label,
+    recorded in the metrics and appended to the trace file as JSON lines.
+    """
+
+    # Called in the thread of the run, even from the async graph: the work is small
+    run_inline = True
+
+    def __init__(self, trace_file_path: Optional[str], metrics: Metrics):
+        self.trace_file_path = trace_file_path
+        self.metrics = metrics
+        self.lock = threading.Lock()
+        self.file_lock = threading.Lock()
+        # Open requests by root run id, and open runs by run id
+        self.traces: Dict[UUID, dict] = {}
+        self.runs: Dict[UUID, dict] = {}
+
+    def _start(
+        self,
+        run_id: UUID,
+        parent_run_id: Optional[UUID],
+        kind: Optional[str],
+        name: str,
+        metadata: Optional[dict],
+    ) -> None:
+        with self.lock:
+            if parent_run_id is None:
+                trace_id = run_id
+                self.traces[trace_id] = {
+                    "user_id": (metadata or {}).get("user_id"),
+                    "thread_id": (metadata or {}).get("thread_id"),
+                    "spans": [],
+                }
+            elif parent_run_id in self.runs:
+                trace_id = self.runs[parent_run_id]["trace_id"]
+                if kind == "chain":
+                    # Only the direct children of a graph run are nodes; deeper chains
+                    # (edges, structured output) are tracked to find their trace only
+                    kind = "node" if parent_run_id == trace_id else None
+            else:
+                return
+            self.runs[run_id] = {
+                "trace_id": trace_id,
+                "parent_id": parent_run_id,
+                "kind": "request" if parent_run_id is None else kind,
+                "name": name,
+                "node": (metadata or {}).get("langgraph_node"),
+                "start": time.time(),
+                "start_counter": time.perf_counter(),
+            }
+
+    def _end(self, run_id: UUID, error: Optional[BaseException] = None, **attributes):
+        end_counter = time.perf_counter()
+        with self.lock:
+            run = self.runs.pop(run_id, None)
+            if run is None or run["kind"] is None:
+                return None
+            trace = self.traces.get(run["trace_id"])
+            if trace is None:
+                return None
+            span = {
+                "trace_id": str(run["trace_id"]),
+                "span_id": str(run_id),
+                "parent_id": str(run["parent_id"]) if run["parent_id"] else None,
+                "kind": run["kind"],
+                "name": run["name"],
+                "node": run["node"],
+                "start": round(run["start"], 6),
+                "duration_ms": round((end_counter - run["start_counter"]) * 1000, 3),
+                "error": f"{type(error).__name__}: {error}" if error else None,
+                **attributes,
+            }
+            trace["spans"].append(span)
+            if run["kind"] != "request":
+                return None
+            return self.traces.pop(run["trace_id"])
+
+    def _record(self, trace: dict, label: str) -> None:
+        user_id, thread_id = trace["user_id"], trace["thread_id"]
+        for span in trace["spans"]:
+            span.update(user_id=user_id, thread_id=thread_id, label=label)
+            seconds = span["duration_ms"] / 1000
+            if span["kind"] == "request":
+                self.metrics.request_duration.observe((label,), seconds)
+            elif span["kind"] == "node":
+                self.metrics.node_duration.observe((span["name"],), seconds)
+            elif span["kind"] == "tool":
+                self.metrics.tool_duration.observe(
+                    (span["name"], span["node"]), seconds
+                )
+            elif span["kind"] == "llm":
+                self.metrics.llm_duration.observe((span["name"], span["node"]), seconds)
+                for direction in ["input", "output"]:
+                    self.metrics.llm_tokens.inc(
+                        (label, span["name"], span["node"], direction),
+                        span[f"{direction}_tokens"],
+                    )
+                self.metrics.llm_cost.inc(
+                    (label, span["name"], span["node"]), span["cost_usd"]
+                )
+            if span["error"]:
+                self.metrics.errors.inc((span["kind"], span["name"]))
+
+        if self.trace_file_path:
+            lines = "".join(json.dumps(span) + "\n" for span in trace["spans"])
+            with self.file_lock:
+                with open(self.trace_file_path, "a", encoding="utf-8") as f:
+                    f.write(lines)
+
+    def on_chain_start(
+        self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs
+    ):
+        name = kwargs.get("name") or (serialized or {}).get("name", "chain")
+        self._start(run_id, parent_run_id, "chain", name, metadata)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        trace = self._end(run_id)
+        if trace is not None:
+            self._record(trace, query_label(outputs))
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        trace = self._end(run_id, error)
+        if trace is not None:
+            self._record(trace, "unknown")
+
+    def on_tool_start(
+        self,
+        serialized,
+        input_str,
+        *,
+        run_id,
+        parent_run_id=None,
+        metadata=None,
+        **kwargs,
+    ):
+        name = kwargs.get("name") or (serialized or {}).get("name", "tool")
+        self._start(run_id, parent_run_id, "tool", name, metadata)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    def on_chat_model_start(
+        self,
+        serialized,
+        messages,
+        *,
+        run_id,
+        parent_run_id=None,
+        metadata=None,
+        **kwargs,
+    ):
+        model = (metadata or {}).get("ls_model_name") or LLM_MODEL_NAME
+        self._start(run_id, parent_run_id, "llm", model, metadata)
+
+    def on_llm_start(
+        self,
+        serialized,
+        prompts,
+        *,
+        run_id,
+        parent_run_id=None,
+        metadata=None,
+        **kwargs,
+    ):
+        model = (metadata or {}).get("ls_model_name") or LLM_MODEL_NAME
+        self._start(run_id, parent_run_id, "llm", model, metadata)
+
+    def on_llm_end(self, response: LLMResult, *, run_id, **kwargs):
+        input_tokens, output_tokens = 0, 0
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = getattr(message, "usage_metadata", None)
+                if usage:
+                    input_tokens += usage.get("input_tokens", 0)
+                    output_tokens += usage.get("output_tokens", 0)
+        with self.lock:
+            model = self.runs.get(run_id, {}).get("name", LLM_MODEL_NAME)
+        self._end(
+            run_id,
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            cost_usd=llm_cost(model, input_tokens, output_tokens),
+        )
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error, input_tokens=0, output_tokens=0, cost_usd=0.0)
+
+
+def serve_metrics(metrics: Metrics, port: int) -> ThreadingHTTPServer:
+    """
+    Serve the metrics at http://localhost:<port>/metrics from a daemon thread.
+    Args:
+        metrics (Metrics): The metrics to serve.
+        port (int): The port to listen on.
+    Returns:
+        ThreadingHTTPServer: The running server.
+    """
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("", port), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def tracing_enabled() -> bool:
+    default = "1" if TRACING_ENABLED else "0"
+    return os.getenv("TRACING_ENABLED", default) == "1"
+
+
+def create_tracer() -> Optional[Tracer]:
+    if not tracing_enabled():
+        return None
+
+    tracer = Tracer(TRACE_FILE_PATH, Metrics())
+    if TRACING_METRICS_PORT is not None:
+        try:
+            serve_metrics(tracer.metrics, TRACING_METRICS_PORT)
+            print(f"Serving metrics at http://localhost:{TRACING_METRICS_PORT}/metrics")
+        except OSError as e:
+            # e.g. a second process on the same machine; its traces are still written
+            print(f"Could not serve metrics on port {TRACING_METRICS_PORT}: {e}")
+    return tracer
+
+
+def start_tracing() -> Optional[Tracer]:
+    """
+    Create the shared tracer and serve its metrics, if enabled. Called by the app entry
+    points; later calls return the same tracer.
+    Returns:
+        Optional[Tracer]: The tracer, or None if tracing is disabled.
+    """
+    global tracer, tracing_started
+    with tracer_lock:
+        if not tracing_started:
+            tracer = create_tracer()
+            tracing_started = True
+        return tracer
+
+
+def get_tracer() -> Optional[Tracer]:
+    """The tracer started by start_tracing, or None."""
+    return tracer
+
+
+# Only started explicitly: importing the workflow (tests, maintenance scripts) opens
+# no port and writes no trace
+tracer: Optional[Tracer] = None
+tracing_started = False
+tracer_lock = threading.Lock()
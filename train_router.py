@@ -0,0 +1,69 @@
+import os
+from collections import Counter
+
+from app.const import (
+    ROUTER_DECISIONS_LOG_FILE_PATH,
+    ROUTER_MODEL_FILE_PATH,
+    ROUTER_MODEL_N_FEATURES,
+    ROUTER_MODEL_MIN_TRAINING_QUERIES,
+    ROUTER_FAST_PATH_CONFIDENCE_THRESHOLD,
+)
+from benchmarking import BENCHMARK_QUERIES
+from fast_router import FastRouter, FastRouterModel, read_router_decisions
+
+# Train the fast-path router on the decisions logged by the LLM router, so that
+# later processes can skip the LLM call for queries the model is confident about.
+# The fast router (keyword rules, then the model) is then evaluated on the labeled
+# benchmark corpus, which none of the logged decisions need to cover.
+try:
+    if not os.path.exists(ROUTER_DECISIONS_LOG_FILE_PATH):
+        raise FileNotFoundError(
+            f"No router decisions logged yet at {ROUTER_DECISIONS_LOG_FILE_PATH}"
+        )
+
+    queries, labels = read_router_decisions(ROUTER_DECISIONS_LOG_FILE_PATH)
+    if len(queries) < ROUTER_MODEL_MIN_TRAINING_QUERIES:
+        raise ValueError(
+            f"Only {len(queries)} router decisions logged, "
+            f"need at least {ROUTER_MODEL_MIN_TRAINING_QUERIES}"
+        )
+
+    model = FastRouterModel.train(queries, labels, ROUTER_MODEL_N_FEATURES)
+    model.save(ROUTER_MODEL_FILE_PATH)
+
+    predictions = [model.predict(query) for query in queries]
+    confident = [
+        (predicted, label)
+        for (predicted, confidence), label in zip(predictions, labels)
+        if confidence >= ROUTER_FAST_PATH_CONFIDENCE_THRESHOLD
+    ]
+    n_correct = sum(predicted == label for predicted, label in confident)
+    print(
+        f"Router model written: {ROUTER_MODEL_FILE_PATH} "
+        f"({len(queries)} queries, labels {dict(Counter(labels))})"
+    )
+    print(
+        f"Training queries above the confidence threshold: "
+        f"{len(confident)}/{len(queries)}, "
+        f"{n_correct}/{len(confident)} of them labeled as the LLM did"
+    )
+
+    # Deferred queries cost an LLM call; misrouted ones give a wrong answer
+    fast_router = FastRouter(model, ROUTER_FAST_PATH_CONFIDENCE_THRESHOLD)
+    n_eval, n_deferred, misrouted = 0, 0, []
+    for label, eval_queries in BENCHMARK_QUERIES.items():
+        for query in eval_queries:
+            n_eval += 1
+            decision = fast_router.classify(query)
+            if decision is None:
+                n_deferred += 1
+            elif decision[0] != label:
+                misrouted.append(f"{query!r}: {decision[0]} instead of {label}")
+    print(
+        f"Evaluation queries: {n_eval}, {n_deferred} deferred to the LLM, "
+        f"{len(misrouted)} misrouted"
+    )
+    for line in misrouted:
+        print(f"  {line}")
+except Exception as e:
+    print(f"Error training router model: {e}")
@@ -1,8 +1,13 @@
+import asyncio
 import json
-import math
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from typing import List, Optional, Tuple
+import pandas as pd
 from typing_extensions import Annotated
 from langchain_core.messages import HumanMessage, SystemMessage, ToolMessage
-from langchain_core.tools import tool, InjectedToolCallId
+from langchain_core.tools import StructuredTool, InjectedToolCallId
+from langchain_core.runnables.config import ContextThreadPoolExecutor
 from langgraph.prebuilt import InjectedState, ToolNode
 from langgraph.types import Command
 from pydantic import BaseModel, Field
@@ -15,17 +20,21 @@ from app.const import (
     UNSTRUCTURED_QUERY_AGENT_SYSTEM_PROMPT_FILE_PATH,
     SUMMARIZE_DEFAULT_BATCH_SIZE,
     SUMMARIZE_DEFAULT_N_BATCHES,
+    SUMMARIZE_RELEVANT_N_BATCHES,
     SUMMARIZE_BATCH_PROMPT_FILE_PATH,
     SUMMARIZE_ALL_BATCHES_PROMPT_FILE_PATH,
+    SUMMARIZE_MAX_CONCURRENCY,
+    SUMMARIZE_BATCH_TIMEOUT_SECONDS,
 )
 from general_tools import (
     get_possible_intents_tool,
     get_possible_categories_tool,
     select_semantic_intent_tool,
     select_semantic_category_tool,
+    search_text_tool,
     finish_tool,
 )
-from react_agent import react_agent_node
+from react_agent import react_agent_node, react_agent_node_async
 
 
 # Tools
@@ -42,61 +51,200 @@ class SummaryResponse(BaseModel):
     )
 
 
-@tool
-def summarize_tool(
-    reasoning: str,
-    user_request: str,
-    dataset: Annotated[Dataset, InjectedState("dataset")],
-    tool_call_id: Annotated[str, InjectedToolCallId],
-) -> Command:
+def summarize_batches(
+    batch_messages: List[list],
+) -> Tuple[List[Optional[str]], List[str]]:
     """
-    Summarize a user request using the dataset.
+    Summarize every batch with its own LLM call, running up to
+    SUMMARIZE_MAX_CONCURRENCY calls at a time. Each batch gets
+    SUMMARIZE_BATCH_TIMEOUT_SECONDS from the moment a worker starts it. A running call
+    cannot be interrupted from another thread, so a batch past its deadline is
+    abandoned: its call keeps a worker until it returns, which the LLM client's
+    request timeout (LLM_REQUEST_TIMEOUT_SECONDS per attempt) bounds. Batches not
+    started yet when the collection stops early (on an error) are cancelled.
     Args:
-        reasoning (str): Reasoning for the function call.
-        user_request (str): The user request to summarize.
+        batch_messages (List[list]): The messages of each batch.
     Returns:
-        A summary of the user request based on the dataset.
+        Tuple[List[Optional[str]], List[str]]: The summary of each batch, in order, or
+        None for batches that failed or did not finish in time; and one error per such batch.
     """
-    n_batches = SUMMARIZE_DEFAULT_N_BATCHES
-    batch_size = SUMMARIZE_DEFAULT_BATCH_SIZE
+    if not batch_messages:
+        return [], []
 
-    # Sample rows from the dataset to use for summarization
-    n_rows_to_sample = min(dataset.count_rows(), n_batches * batch_size)
-    sampled_df = dataset.show_examples(n_rows_to_sample)
+    structured_llm = llm.with_structured_output(SummaryResponse)
+    start_times = {}
 
-    # Read the prompt files for summarization
-    summarize_batch_prompt = read_prompt_file(SUMMARIZE_BATCH_PROMPT_FILE_PATH)
-    summarize_all_batches_prompt = read_prompt_file(
-        SUMMARIZE_ALL_BATCHES_PROMPT_FILE_PATH
+    def summarize_batch(i: int, messages: list) -> str:
+        start_times[i] = time.monotonic()
+        return structured_llm.invoke(messages).summary
+
+    # ContextThreadPoolExecutor keeps the tool's callbacks (tracing, streaming) in the workers
+    executor = ContextThreadPoolExecutor(max_workers=SUMMARIZE_MAX_CONCURRENCY)
+    futures = {
+        executor.submit(summarize_batch, i, messages): i
+        for i, messages in enumerate(batch_messages)
+    }
+
+    batch_summaries = [None] * len(batch_messages)
+    batch_errors = {}
+    pending = set(futures)
+    try:
+        while pending:
+            deadlines = {
+                future: start_times[futures[future]] + SUMMARIZE_BATCH_TIMEOUT_SECONDS
+                for future in pending
+                if futures[future] in start_times
+            }
+            now = time.monotonic()
+            for future, deadline in deadlines.items():
+                # A batch that finished since the last wait is collected below, not late
+                if deadline <= now and not future.done():
+                    pending.discard(future)
+                    batch_errors[futures[future]] = (
+                        f"Summary batch {futures[future]} timed out after "
+                        f"{SUMMARIZE_BATCH_TIMEOUT_SECONDS}s"
+                    )
+            if not pending:
+                break
+
+            # Batches queued behind abandoned calls have no deadline yet: check again later
+            timeout = min(
+                [deadline - now for deadline in deadlines.values() if deadline > now],
+                default=SUMMARIZE_BATCH_TIMEOUT_SECONDS,
+            )
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    batch_summaries[futures[future]] = future.result()
+                except Exception as e:
+                    batch_errors[futures[future]] = (
+                        f"Summary batch {futures[future]} failed: {e}"
+                    )
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return batch_summaries, [batch_errors[i] for i in sorted(batch_errors)]
+
+
+async def summarize_batches_async(
+    batch_messages: List[list],
+) -> Tuple[List[Optional[str]], List[str]]:
+    """
+    Async variant of summarize_batches: the batch calls are awaited concurrently,
+    up to SUMMARIZE_MAX_CONCURRENCY at a time, each under its own deadline. Unlike
+    the thread variant, a batch past its deadline is cancelled.
+    Args:
+        batch_messages (List[list]): The messages of each batch.
+    Returns:
+        Tuple[List[Optional[str]], List[str]]: The summary of each batch, in order, or
+        None for batches that failed or did not finish in time; and one error per such batch.
+    """
+    if not batch_messages:
+        return [], []
+
+    structured_llm = llm.with_structured_output(SummaryResponse)
+    semaphore = asyncio.Semaphore(SUMMARIZE_MAX_CONCURRENCY)
+    batch_summaries = [None] * len(batch_messages)
+    batch_errors = {}
+
+    async def summarize_batch(i: int, messages: list) -> None:
+        async with semaphore:
+            try:
+                response = await asyncio.wait_for(
+                    structured_llm.ainvoke(messages), SUMMARIZE_BATCH_TIMEOUT_SECONDS
+                )
+                batch_summaries[i] = response.summary
+            except asyncio.TimeoutError:
+                batch_errors[i] = (
+                    f"Summary batch {i} timed out after "
+                    f"{SUMMARIZE_BATCH_TIMEOUT_SECONDS}s"
+                )
+            except Exception as e:
+                batch_errors[i] = f"Summary batch {i} failed: {e}"
+
+    await asyncio.gather(
+        *(summarize_batch(i, messages) for i, messages in enumerate(batch_messages))
     )
+    return batch_summaries, [batch_errors[i] for i in sorted(batch_errors)]
+
+
+def sample_summary_rows(
+    dataset: Dataset, user_request: str, sampling: str
+) -> pd.DataFrame:
+    batch_size = SUMMARIZE_DEFAULT_BATCH_SIZE
+
+    if sampling == "relevant" and Dataset.get_vector_index() is None:
+        print("No vector index for relevant sampling, sampling random rows instead")
+        sampling = "random"
+
+    if sampling == "relevant":
+        # Fewer rows are needed when they are picked for the request
+        n_batches = SUMMARIZE_RELEVANT_N_BATCHES
+        n_rows_to_sample = min(dataset.count_rows(), n_batches * batch_size)
+        return dataset.get_rows(
+            dataset.search_similar(user_request, n_rows_to_sample)["row_ids"]
+        )
+    elif sampling == "random":
+        n_batches = SUMMARIZE_DEFAULT_N_BATCHES
+        n_rows_to_sample = min(dataset.count_rows(), n_batches * batch_size)
+        return dataset.show_examples(n_rows_to_sample)
+    else:
+        raise ValueError(
+            f"Unknown sampling '{sampling}'. Choose 'relevant' or 'random'."
+        )
+
 
-    # Initialize a list to hold batch summaries
-    batch_summaries = []
+def build_summary_batch_messages(
+    user_request: str, sampled_df: pd.DataFrame
+) -> Tuple[List[list], List[int]]:
+    batch_size = SUMMARIZE_DEFAULT_BATCH_SIZE
+    summarize_batch_prompt = read_prompt_file(SUMMARIZE_BATCH_PROMPT_FILE_PATH)
 
-    # Iterate over the sampled DataFrame in batches
-    for i in range(0, n_rows_to_sample, batch_size):
+    batch_messages = []
+    batch_n_rows = []
+    for i in range(0, len(sampled_df), batch_size):
         batch_df = sampled_df.iloc[i : i + batch_size]
+        batch_n_rows.append(len(batch_df))
 
         # Each batch prompt is in independent conversation in order to avoid biasing the LLM
-        messages = [
-            SystemMessage(
-                content="You are a helpful analyst that summarizes customer support interactions according to user instructions. Respond in structured JSON."
-            ),
-            HumanMessage(
-                content=summarize_batch_prompt.format(
-                    user_request=user_request, data=batch_df.to_dict(orient="records")
-                )
-            ),
-        ]
+        batch_messages.append(
+            [
+                SystemMessage(
+                    content="You are a helpful analyst that summarizes customer support interactions according to user instructions. Respond in structured JSON."
+                ),
+                HumanMessage(
+                    content=summarize_batch_prompt.format(
+                        user_request=user_request,
+                        data=batch_df.to_dict(orient="records"),
+                    )
+                ),
+            ]
+        )
 
-        # Perform the initial request to the LLM
-        response = llm.with_structured_output(SummaryResponse).invoke(messages)
+    return batch_messages, batch_n_rows
 
-        # Extract the assistant's message from the response
-        batch_summaries.append(response.summary)
 
-    # Combine all batch summaries into a final summary
-    final_messages = [
+def build_final_summary_messages(
+    user_request: str,
+    summaries: List[Optional[str]],
+    batch_n_rows: List[int],
+) -> Optional[list]:
+    """
+    Build the reduce prompt from the batch summaries, skipping the ones that failed.
+    Returns:
+        Optional[list]: The messages of the final summary call, or None if every batch failed.
+    """
+    batch_summaries, n_summarized_rows = [], 0
+    for summary, n_rows in zip(summaries, batch_n_rows):
+        if summary is not None:
+            batch_summaries.append(summary)
+            n_summarized_rows += n_rows
+    if batch_n_rows and not batch_summaries:
+        return None
+
+    summarize_all_batches_prompt = read_prompt_file(
+        SUMMARIZE_ALL_BATCHES_PROMPT_FILE_PATH
+    )
+    return [
         SystemMessage(
             "You are a helpful assistant that summarizes customer support data based on multiple batch summaries, using a structured JSON format."
         ),
@@ -104,21 +252,30 @@ def summarize_tool(
             summarize_all_batches_prompt.format(
                 user_request=user_request,
                 summaries=batch_summaries,
-                num_batches=str(int(math.ceil(n_rows_to_sample / batch_size))),
-                rows_per_batch=str(int(batch_size)),
-                n_rows=str(int(n_rows_to_sample)),
+                num_batches=str(len(batch_summaries)),
+                rows_per_batch=str(int(SUMMARIZE_DEFAULT_BATCH_SIZE)),
+                n_rows=str(int(n_summarized_rows)),
             )
         ),
     ]
 
-    # Perform the final request to the LLM
-    final_response = llm.with_structured_output(SummaryResponse).invoke(final_messages)
-    final_answer = final_response.summary
+
+def summary_command(
+    tool_call_id: str, final_answer: Optional[str], batch_errors: List[str]
+) -> Command:
+    if final_answer is None:
+        error_msg = "Error processing function call: all summary batches failed."
+        content = json.dumps({"error": error_msg, "batch_errors": batch_errors})
+    elif batch_errors:
+        # The summary leaves out the failed batches, so the agent is told which
+        content = json.dumps({"summary": final_answer, "batch_errors": batch_errors})
+    else:
+        content = json.dumps({"summary": final_answer})
     return Command(
         update={
             "messages": [
                 ToolMessage(
-                    json.dumps({"summary": final_answer}),
+                    content,
                     tool_call_id=tool_call_id,
                 )
             ],
@@ -126,11 +283,80 @@ def summarize_tool(
     )
 
 
+def summarize(
+    reasoning: str,
+    user_request: str,
+    dataset: Annotated[Dataset, InjectedState("dataset")],
+    tool_call_id: Annotated[str, InjectedToolCallId],
+    sampling: str = "relevant",
+) -> Command:
+    """
+    Summarize a user request using the dataset.
+    Args:
+        reasoning (str): Reasoning for the function call.
+        user_request (str): The user request to summarize.
+        sampling (str): "relevant" (default) to summarize the selected rows most similar to
+            the user request, or "random" to summarize a random sample of the selected rows.
+    Returns:
+        A summary of the user request based on the dataset.
+    """
+    sampled_df = sample_summary_rows(dataset, user_request, sampling)
+    batch_messages, batch_n_rows = build_summary_batch_messages(
+        user_request, sampled_df
+    )
+
+    # Map: summarize the batches concurrently, skipping the ones that fail
+    batch_summaries, batch_errors = summarize_batches(batch_messages)
+    final_messages = build_final_summary_messages(
+        user_request, batch_summaries, batch_n_rows
+    )
+    if final_messages is None:
+        return summary_command(tool_call_id, None, batch_errors)
+
+    # Reduce: combine all batch summaries into a final summary
+    final_response = llm.with_structured_output(SummaryResponse).invoke(final_messages)
+    return summary_command(tool_call_id, final_response.summary, batch_errors)
+
+
+async def summarize_async(
+    reasoning: str,
+    user_request: str,
+    dataset: Annotated[Dataset, InjectedState("dataset")],
+    tool_call_id: Annotated[str, InjectedToolCallId],
+    sampling: str = "relevant",
+) -> Command:
+    sampled_df = sample_summary_rows(dataset, user_request, sampling)
+    batch_messages, batch_n_rows = build_summary_batch_messages(
+        user_request, sampled_df
+    )
+
+    batch_summaries, batch_errors = await summarize_batches_async(batch_messages)
+    final_messages = build_final_summary_messages(
+        user_request, batch_summaries, batch_n_rows
+    )
+    if final_messages is None:
+        return summary_command(tool_call_id, None, batch_errors)
+
+    final_response = await llm.with_structured_output(SummaryResponse).ainvoke(
+        final_messages
+    )
+    return summary_command(tool_call_id, final_response.summary, batch_errors)
+
+
+# The async graph awaits the coroutine, so the batch calls do not hold a worker thread
+summarize_tool = StructuredTool.from_function(
+    func=summarize,
+    coroutine=summarize_async,
+    name="summarize_tool",
+)
+
+
 unstructured_query_agent_tool_list = [
     get_possible_intents_tool,
     get_possible_categories_tool,
     select_semantic_intent_tool,
     select_semantic_category_tool,
+    search_text_tool,
     finish_tool,
     summarize_tool,
 ]
@@ -147,4 +373,13 @@ def unstructured_query_agent_node(state: UserQueryState) -> UserQueryState:
     )
 
 
+async def unstructured_query_agent_node_async(state: UserQueryState) -> UserQueryState:
+
+    return await react_agent_node_async(
+        state,
+        UNSTRUCTURED_QUERY_AGENT_SYSTEM_PROMPT_FILE_PATH,
+        unstructured_query_agent_tool_list,
+    )
+
+
 unstructured_query_agent_tool_node = ToolNode(unstructured_query_agent_tool_list)
@@ -0,0 +1,248 @@
+import json
+import math
+import os
+import zlib
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from text_index import tokenize
+
+EMBEDDINGS_FILE_NAME = "embeddings.npy"
+COMPONENTS_FILE_NAME = "components.npy"
+IDF_FILE_NAME = "idf.npy"
+META_FILE_NAME = "meta.json"
+
+
+def hash_token(token: str, n_features: int) -> Tuple[int, float]:
+    """
+    Map a token to a feature and a sign. Uses crc32 rather than hash(), which is
+    salted per process, so that persisted indexes stay valid across restarts.
+    """
+    h = zlib.crc32(token.encode("utf-8"))
+    return h % n_features, 1.0 if (h >> 31) & 1 else -1.0
+
+
+def hash_documents(
+    documents: List[Optional[str]], n_features: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Hash documents into signed, log-scaled term frequencies.
+    Args:
+        documents (List[Optional[str]]): The documents to hash.
+        n_features (int): The number of hashed features.
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: A CSR matrix as (indptr, indices, data).
+    """
+    indptr, indices, data = [0], [], []
+    for document in documents:
+        features = {}
+        for token in tokenize(document):
+            feature, sign = hash_token(token, n_features)
+            features[feature] = features.get(feature, 0.0) + sign
+        for feature, count in features.items():
+            if count != 0:
+                indices.append(feature)
+                data.append(math.copysign(1.0 + math.log(abs(count)), count))
+        indptr.append(len(indices))
+    return (
+        np.asarray(indptr, dtype=np.int64),
+        np.asarray(indices, dtype=np.int32),
+        np.asarray(data, dtype=np.float32),
+    )
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def csr_dot_dense(
+    csr: Tuple[np.ndarray, np.ndarray, np.ndarray],
+    dense: np.ndarray,
+    chunk_rows: int = 4096,
+) -> np.ndarray:
+    """Compute X @ dense for a CSR matrix X, a chunk of rows at a time."""
+    indptr, indices, data = csr
+    n_rows = len(indptr) - 1
+    out = np.zeros((n_rows, dense.shape[1]), dtype=np.float32)
+    for start in range(0, n_rows, chunk_rows):
+        end = min(start + chunk_rows, n_rows)
+        lo, hi = indptr[start], indptr[end]
+        if lo == hi:
+            continue
+        contributions = data[lo:hi, None] * dense[indices[lo:hi]]
+        row_starts = indptr[start:end] - lo
+        non_empty = np.flatnonzero(np.diff(indptr[start : end + 1]))
+        out[start + non_empty] = np.add.reduceat(
+            contributions, row_starts[non_empty], axis=0
+        )
+    return out
+
+
+def csr_transpose_dot_dense(
+    csr: Tuple[np.ndarray, np.ndarray, np.ndarray],
+    dense: np.ndarray,
+    n_features: int,
+    chunk_rows: int = 4096,
+) -> np.ndarray:
+    """Compute X.T @ dense for a CSR matrix X, a chunk of rows at a time."""
+    indptr, indices, data = csr
+    n_rows = len(indptr) - 1
+    out = np.zeros((n_features, dense.shape[1]), dtype=np.float32)
+    for start in range(0, n_rows, chunk_rows):
+        end = min(start + chunk_rows, n_rows)
+        lo, hi = indptr[start], indptr[end]
+        if lo == hi:
+            continue
+        rows = np.repeat(np.arange(start, end), np.diff(indptr[start : end + 1]))
+        order = np.argsort(indices[lo:hi], kind="stable")
+        features = indices[lo:hi][order]
+        contributions = data[lo:hi][order, None] * dense[rows[order]]
+        feature_starts = np.flatnonzero(np.r_[True, features[1:] != features[:-1]])
+        out[features[feature_starts]] += np.add.reduceat(
+            contributions, feature_starts, axis=0
+        )
+    return out
+
+
+class VectorIndex:
+    """
+    Dense row embeddings from hashed TF-IDF features reduced with a randomized SVD,
+    for cosine-similarity retrieval without any network or embedding model.
+    """
+
+    def __init__(self, embeddings: np.ndarray, components: np.ndarray, idf: np.ndarray):
+        self.embeddings = embeddings
+        self.components = components
+        self.idf = idf
+        self.n_features = len(idf)
+
+    @classmethod
+    def build(
+        cls,
+        documents: List[Optional[str]],
+        n_features: int,
+        dim: int,
+        n_power_iterations: int = 2,
+        oversampling: int = 10,
+        seed: int = 0,
+    ) -> "VectorIndex":
+        """
+        Embed documents with hashed TF-IDF followed by a randomized truncated SVD.
+        Args:
+            documents (List[Optional[str]]): The documents to embed, one per row.
+            n_features (int): The number of hashed features.
+            dim (int): The embedding dimension.
+            n_power_iterations (int): Power iterations of the randomized SVD.
+            oversampling (int): Extra random directions of the randomized SVD.
+            seed (int): Seed of the random projection.
+        Returns:
+            VectorIndex: The index over the documents.
+        """
+        indptr, indices, data = hash_documents(documents, n_features)
+        n_docs = len(indptr) - 1
+
+        doc_freqs = np.bincount(indices, minlength=n_features)
+        idf = (np.log((1 + n_docs) / (1 + doc_freqs)) + 1).astype(np.float32)
+        data = data * idf[indices]
+        # L2-normalize each row of the TF-IDF matrix
+        rows = np.repeat(np.arange(n_docs), np.diff(indptr))
+        row_norms = np.sqrt(np.bincount(rows, weights=data**2, minlength=n_docs))
+        data = data / np.maximum(row_norms[rows], 1e-12)
+        csr = (indptr, indices, data.astype(np.float32))
+
+        rng = np.random.default_rng(seed)
+        n_components = min(dim + oversampling, n_docs, n_features)
+        omega = rng.standard_normal((n_features, n_components)).astype(np.float32)
+        q, _ = np.linalg.qr(csr_dot_dense(csr, omega))
+        for _ in range(n_power_iterations):
+            z, _ = np.linalg.qr(csr_transpose_dot_dense(csr, q, n_features))
+            q, _ = np.linalg.qr(csr_dot_dense(csr, z))
+
+        b = csr_transpose_dot_dense(csr, q, n_features).T
+        u_b, singular_values, vt = np.linalg.svd(b, full_matrices=False)
+        dim = min(dim, len(singular_values))
+
+        embeddings = (q @ u_b[:, :dim]) * singular_values[:dim]
+        return cls(
+            normalize_rows(embeddings).astype(np.float32),
+            vt[:dim].astype(np.float32),
+            idf,
+        )
+
+    def save(self, index_dir: str, fingerprint: Optional[str] = None) -> None:
+        """
+        Persist the index as .npy files, so that it can be memory-mapped later.
+        Args:
+            index_dir (str): The directory of the index files.
+            fingerprint (Optional[str]): The fingerprint of the dataset the index was
+                built from, checked by load.
+        """
+        os.makedirs(index_dir, exist_ok=True)
+        np.save(os.path.join(index_dir, EMBEDDINGS_FILE_NAME), self.embeddings)
+        np.save(os.path.join(index_dir, COMPONENTS_FILE_NAME), self.components)
+        np.save(os.path.join(index_dir, IDF_FILE_NAME), self.idf)
+        # Written last: an index without meta.json is treated as missing
+        with open(os.path.join(index_dir, META_FILE_NAME), "w") as f:
+            json.dump(
+                {
+                    "n_docs": int(self.embeddings.shape[0]),
+                    "dim": int(self.embeddings.shape[1]),
+                    "n_features": int(self.n_features),
+                    "fingerprint": fingerprint,
+                },
+                f,
+            )
+
+    @classmethod
+    def load(cls, index_dir: str, fingerprint: str) -> Optional["VectorIndex"]:
+        """
+        Load an index saved with save, memory-mapping the row embeddings.
+        Args:
+            index_dir (str): The directory of the index files.
+            fingerprint (str): The fingerprint of the current dataset.
+        Returns:
+            Optional[VectorIndex]: The index, or None if index_dir holds no complete
+            index or one built from another dataset.
+        """
+        meta_file_path = os.path.join(index_dir, META_FILE_NAME)
+        if not os.path.exists(meta_file_path):
+            return None
+        with open(meta_file_path) as f:
+            if json.load(f).get("fingerprint") != fingerprint:
+                return None
+        return cls(
+            np.load(os.path.join(index_dir, EMBEDDINGS_FILE_NAME), mmap_mode="r"),
+            np.load(os.path.join(index_dir, COMPONENTS_FILE_NAME)),
+            np.load(os.path.join(index_dir, IDF_FILE_NAME)),
+        )
+
+    def embed_query(self, query: str) -> np.ndarray:
+        """Embed a free-text query in the same space as the rows."""
+        indptr, indices, data = hash_documents([query], self.n_features)
+        data = data * self.idf[indices]
+        embedding = self.components[:, indices] @ data
+        return embedding / max(np.linalg.norm(embedding), 1e-12)
+
+    def search(
+        self, query: str, candidates: np.ndarray, top_k: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the candidate rows most similar to a query.
+        Args:
+            query (str): The free-text query.
+            candidates (np.ndarray): A boolean mask of the rows allowed in the result.
+            top_k (int): The maximum number of rows to return.
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The ids and cosine similarities of the top rows,
+            most similar first.
+        """
+        candidate_ids = np.flatnonzero(candidates)
+        similarities = self.embeddings[candidate_ids] @ self.embed_query(query)
+        if len(candidate_ids) > top_k:
+            best = np.argpartition(-similarities, top_k - 1)[:top_k]
+        else:
+            best = np.arange(len(candidate_ids))
+        best = best[np.argsort(-similarities[best], kind="stable")]
+        return candidate_ids[best], similarities[best]